@@ -8,6 +8,8 @@ import os
 import sys
 from typing import Dict, List, Any
 
+from src.tools.line_counter import count_lines
+
 class ComplexityCalculator:
     """代码复杂度计算器"""
     
@@ -64,8 +66,9 @@ class ComplexityCalculator:
     def analyze_file(self, file_path: str) -> Dict[str, Any]:
         """分析文件的复杂度"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
+            with open(file_path, 'rb') as f:
+                data = f.read()
+            content = data.decode('utf-8')
             
             # 解析AST
             tree = ast.parse(content)
@@ -78,8 +81,9 @@ class ComplexityCalculator:
             # 访问所有节点
             self.visit_node(tree)
             
-            # 计算代码行数
-            lines_of_code = len([line for line in content.split('\n') if line.strip() and not line.strip().startswith('#')])
+            # 计算代码行数（不含空行、注释和文档字符串）
+            lines = count_lines(data, '.py')
+            lines_of_code = lines["code"]
             
             # 确定复杂度等级
             if self.complexity_score < 10:
@@ -96,6 +100,8 @@ class ComplexityCalculator:
                 "functions_count": len(self.functions),
                 "classes_count": len(self.classes),
                 "lines_of_code": lines_of_code,
+                "comment_lines": lines["comment"],
+                "blank_lines": lines["blank"],
                 "functions": self.functions,
                 "classes": self.classes,
                 "analysis_summary": {
@@ -6,48 +6,396 @@
 
 import json
 import os
-from typing import Dict, Any
+from typing import Dict, Any, List
 from mcp.server.fastmcp import FastMCP
 from src.tools.code_analyzer import CodeAnalyzer
+from src.tools.issues import issue_total, page_issues
+from src.tools.watcher import WorkspaceWatcher
+from src.tools.job_queue import JobQueue, JobContext, JOB_STATUSES
+from src.tools.storage import ANALYSIS_DB_PATH
 
 # Create MCP server
 mcp = FastMCP("智能开发助手")
 
-# Initialize code analyzer
-analyzer = CodeAnalyzer()
+# Initialize code analyzer（默认在服务进程中分析，IDA_ISOLATE_ANALYSIS=1 时在受监管的工作进程中分析）
+analyzer = CodeAnalyzer(isolated=os.environ.get("IDA_ISOLATE_ANALYSIS", "0") == "1")
+
+# 工作区监听器（通过 IDA_WATCH_ROOTS 环境变量或 watch_workspace 工具启用）
+watcher = WorkspaceWatcher(analyzer)
+
+# 后台任务队列（任务记录保存在分析数据库中）
+job_queue = JobQueue(ANALYSIS_DB_PATH)
+
+
+def _run_analyze_project_job(params: Dict[str, Any], job: JobContext) -> Dict[str, Any]:
+    """后台分析整个项目"""
+    result = analyzer.analyze_project(
+        params["project_path"],
+        progress=lambda done, total, current: job.report(done, total, f"Analyzing {current}")
+    )
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+
+def _run_project_structure_job(params: Dict[str, Any], job: JobContext) -> Dict[str, Any]:
+    """后台分析项目结构"""
+    job.report(0, 1, "Scanning project structure", force=True)
+    result = analyzer.analyze_project_structure(params["project_path"])
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+
+job_queue.register("analyze_project", _run_analyze_project_job)
+job_queue.register("analyze_project_structure", _run_project_structure_job)
 
 
 # 代码分析工具
 @mcp.tool()
-def analyze_code(file_path: str) -> str:
+def analyze_code(file_path: str, revision: str = "", issue_offset: int = 0, issue_limit: int = 50,
+                 rule: str = "", min_severity: str = "info") -> str:
     """
     分析代码文件的质量、复杂度和潜在问题
     
     Args:
         file_path: 要分析的代码文件路径
+        revision: git版本（提交、分支或标签）；指定时直接从git对象读取该版本的内容，无需检出
+        issue_offset: 问题明细的起始位置（分页）
+        issue_limit: 返回的问题明细数量上限
+        rule: 只返回该规则的问题明细（如 LINT001、SEC201）
+        min_severity: 问题明细的最低严重程度（info / warning / error）
     
     Returns:
-        JSON格式的分析结果，包含质量评分、问题列表、复杂度等信息
+        JSON格式的分析结果，包含质量评分、问题明细、按规则的问题计数、复杂度等信息；
+        每条规则只保留有限条明细（IDA_ISSUE_DETAIL_CAP，默认20），total_issues 为完整的问题总数。
+        分页只能翻阅保留的明细，翻到上限后不再有更多明细：issues_page 中 has_more 表示是否还有下一页，
+        matched_total 为符合筛选条件的问题总数，omitted 为其中未保留明细的数量（只计入 issue_counts）
     """
-    result = analyzer.analyze_code_quality(file_path)
+    if revision:
+        result = analyzer.analyze_file_at_revision(file_path, revision)
+    else:
+        result = analyzer.analyze_code_quality(file_path)
+    if "error" not in result:
+        result = page_issues(result, issue_offset, issue_limit, rule, min_severity)
     return json.dumps(result, indent=2, ensure_ascii=False)
 
 
 @mcp.tool()
-def analyze_project_structure(project_path: str) -> str:
+def analyze_code_text(text: str, name: str = "buffer.py") -> str:
+    """
+    直接分析源代码文本（如未保存的编辑内容），无需写入文件
+    
+    Args:
+        text: 源代码文本
+        name: 文件名，按扩展名判断语言（.py/.js/.ts/.jsx/.tsx）
+    
+    Returns:
+        JSON格式的分析结果，与 analyze_code 相同
+    """
+    return json.dumps(analyzer.analyze_text(text, name), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def analyze_code_buffers(buffers: List[Dict[str, str]]) -> str:
     """
-    分析项目结构，统计文件类型、编程语言分布等信息
+    一次分析多段源代码文本
+    
+    Args:
+        buffers: 源代码列表，每项为 {"name": 文件名, "text": 源代码}
+    
+    Returns:
+        JSON格式的分析结果列表（与输入顺序一致）以及缓存命中统计
+    """
+    return json.dumps(analyzer.analyze_buffers(buffers), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def analyze_project_structure(project_path: str, count_lines: bool = True) -> str:
+    """
+    分析项目结构，统计文件类型、编程语言分布以及各语言的代码行、注释行和空行
     
     Args:
         project_path: 项目根目录路径
+        count_lines: 是否统计代码行数（逐文件缓存，不做语法分析）
     
     Returns:
         JSON格式的项目结构分析结果
     """
-    result = analyzer.analyze_project_structure(project_path)
+    result = analyzer.analyze_project_structure(project_path, count_lines=count_lines)
     return json.dumps(result, indent=2, ensure_ascii=False)
 
 
+@mcp.tool()
+def analyze_project(project_path: str, revision: str = "") -> str:
+    """
+    分析项目中全部代码文件并汇总质量指标
+    
+    Args:
+        project_path: 项目根目录路径
+        revision: git版本（提交、分支或标签）；指定时分析该版本的文件，无需检出
+    
+    Returns:
+        JSON格式的项目汇总结果，包含代码行数、平均质量评分、问题最多的文件等
+    """
+    aggregate = analyzer.get_project_aggregate(project_path)
+    if revision:
+        result = analyzer.analyze_project_at_revision(project_path, revision)
+    elif aggregate is not None and watcher.is_primed(project_path):
+        # 监听中的工作区，汇总结果已在后台保持最新；后台刷新不记录历史，在此记入
+        analyzer.record_project_quality(project_path)
+        result = aggregate.to_dict()
+    else:
+        result = analyzer.analyze_project(project_path)
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def compare_revisions(project_path: str, base: str, head: str = "HEAD", limit: int = 20) -> str:
+    """
+    比较项目在两个git版本之间的质量指标变化（从git对象读取，无需检出）
+    
+    Args:
+        project_path: 项目根目录路径（git仓库或其子目录）
+        base: 基准版本（提交、分支或标签）
+        head: 对比版本，默认为HEAD
+        limit: 列出的变化文件数量上限
+    
+    Returns:
+        JSON格式的比较结果，包含两个版本的汇总指标及差值、文件增删改统计，
+        以及各变化文件的质量评分、复杂度、行数和问题数变化（质量下降最多的在前）
+    """
+    result = analyzer.compare_revisions(project_path, base, head, limit=limit)
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def analyze_dependencies(project_path: str, file_path: str = "", limit: int = 100, max_depth: int = 0) -> str:
+    """
+    分析项目内的import依赖关系
+    
+    Args:
+        project_path: 项目根目录路径
+        file_path: 要查询的文件（相对项目根目录或绝对路径）；为空时返回项目概况（外部依赖、循环依赖、被依赖最多的文件）
+        limit: 列表类结果的数量上限
+        max_depth: 传递影响范围的最大深度，0表示不限
+    
+    Returns:
+        JSON格式的依赖分析结果；指定文件时包含直接依赖、被依赖以及修改该文件会影响到的全部文件
+    """
+    result = analyzer.analyze_dependencies(project_path, file_path, reuse=watcher.is_primed(project_path),
+                                           limit=limit, max_depth=max_depth)
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def check_security(path: str, min_severity: str = "info", rules_file: str = "", limit: int = 100) -> str:
+    """
+    安全漏洞扫描：检查eval/exec、shell=True、不安全的反序列化、拼接SQL、硬编码凭据、XSS等问题
+    
+    Args:
+        path: 文件或项目根目录路径
+        min_severity: 最低严重程度（info / warning / error）
+        rules_file: 额外的JSON规则文件（规则列表，每条包含 id、pattern、message，可选 language、category、severity）
+        limit: 返回的问题数量上限
+    
+    Returns:
+        JSON格式的扫描结果，包含按严重程度和规则的统计以及问题列表（严重的在前）
+    """
+    result = analyzer.check_security(path, min_severity=min_severity, rules_file=rules_file, limit=limit)
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def detect_clones(project_path: str, file_path: str = "", min_tokens: int = 50, limit: int = 20) -> str:
+    """
+    检测项目中的重复代码（包括改名后的复制代码）
+    
+    Args:
+        project_path: 项目根目录路径
+        file_path: 要查询的文件（相对项目根目录或绝对路径）；为空时返回项目概况
+        min_tokens: 重复片段的最小长度（记号数）
+        limit: 列表类结果的数量上限
+    
+    Returns:
+        JSON格式的检测结果；项目概况包含重复行比例、克隆类（同一段代码的全部副本）和重复最多的文件，
+        指定文件时返回与该文件有关的重复片段对
+    """
+    result = analyzer.detect_clones(project_path, file_path, reuse=watcher.is_primed(project_path),
+                                    min_tokens=min_tokens, limit=limit)
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def find_symbol(query: str, project_path: str, kind: str = "", exact: bool = False, limit: int = 50) -> str:
+    """
+    在项目符号索引中查找函数、类、方法和模块级变量的定义
+    
+    Args:
+        query: 符号名称或名称前缀；包含 '.' 时按限定名匹配（如 CodeAnalyzer.analyze_file）
+        project_path: 项目根目录路径
+        kind: 只返回指定类别（function / class / method / variable）
+        exact: 为True时精确匹配，否则按前缀匹配
+        limit: 返回结果数量上限
+    
+    Returns:
+        JSON格式的定义位置列表（文件、行号、列号）以及匹配总数
+    """
+    result = analyzer.find_symbol(query, project_path, kind=kind, exact=exact, limit=limit,
+                                  reuse=watcher.is_primed(project_path))
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def find_references(name: str, project_path: str, prefix: bool = False, limit: int = 100) -> str:
+    """
+    在项目符号索引中查找名称被引用和导入的位置
+    
+    Args:
+        name: 名称（函数、类、变量或属性名）
+        project_path: 项目根目录路径
+        prefix: 为True时按前缀匹配
+        limit: 返回结果数量上限
+    
+    Returns:
+        JSON格式的引用位置列表（role 为 ref 表示引用，import 表示导入）以及匹配总数
+    """
+    result = analyzer.find_references(name, project_path, prefix=prefix, limit=limit,
+                                      reuse=watcher.is_primed(project_path))
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_quality_history(path: str, days: float = 0, max_points: int = 200) -> str:
+    """
+    查询项目或文件的质量指标趋势（来自每次 analyze_project 记录的历史）
+    
+    Args:
+        path: 项目目录或项目中的文件路径
+        days: 只查询最近若干天，0表示全部历史
+        max_points: 返回的数据点上限，超出时按时间段合并
+    
+    Returns:
+        JSON格式的时间序列（代码行数、复杂度、问题数、质量评分）
+    """
+    result = analyzer.quality_history_for(path, days=days, max_points=max_points)
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def watch_workspace(project_path: str) -> str:
+    """
+    监听工作区，文件变化后在后台重新分析，使分析结果保持最新
+    
+    Args:
+        project_path: 工作区根目录路径
+    
+    Returns:
+        JSON格式的监听状态
+    """
+    return json.dumps(watcher.watch(project_path), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def unwatch_workspace(project_path: str) -> str:
+    """
+    停止监听工作区
+    
+    Args:
+        project_path: 工作区根目录路径
+    """
+    return json.dumps(watcher.unwatch(project_path), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def get_watch_status() -> str:
+    """
+    获取工作区监听状态和分析缓存统计
+    """
+    return json.dumps(watcher.status(), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def list_quarantine(limit: int = 100) -> str:
+    """
+    列出分析时超时或崩溃而被隔离的文件，以及工作进程池状态
+    
+    Args:
+        limit: 返回数量上限
+    """
+    return json.dumps(analyzer.list_quarantine(limit), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def release_quarantine(file_path: str = "") -> str:
+    """
+    解除文件的隔离，下次分析时重新尝试
+    
+    Args:
+        file_path: 被隔离的文件路径，为空时解除全部
+    """
+    return json.dumps(analyzer.release_quarantine(file_path), indent=2, ensure_ascii=False)
+
+
+@mcp.tool()
+def submit_project_analysis(project_path: str, structure_only: bool = False) -> str:
+    """
+    以后台任务方式分析项目，立即返回任务ID，可通过 get_job_status 或 jobs://{job_id} 查询进度
+    
+    Args:
+        project_path: 项目根目录路径
+        structure_only: 只分析项目结构（文件类型、语言分布）
+    
+    Returns:
+        JSON格式的任务信息
+    """
+    if not os.path.isdir(project_path):
+        return json.dumps({"error": f"Project path not found: {project_path}"}, ensure_ascii=False)
+    
+    kind = "analyze_project_structure" if structure_only else "analyze_project"
+    job = job_queue.submit(kind, {"project_path": os.path.abspath(project_path)})
+    return json.dumps(job, indent=2, ensure_ascii=False, default=str)
+
+
+@mcp.tool()
+def get_job_status(job_id: str) -> str:
+    """
+    获取后台任务的状态、进度和结果
+    
+    Args:
+        job_id: 任务ID
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        job = {"error": f"Job {job_id} not found"}
+    return json.dumps(job, indent=2, ensure_ascii=False, default=str)
+
+
+@mcp.tool()
+def cancel_job(job_id: str) -> str:
+    """
+    取消后台任务
+    
+    Args:
+        job_id: 任务ID
+    """
+    return json.dumps(job_queue.cancel(job_id), indent=2, ensure_ascii=False, default=str)
+
+
+@mcp.tool()
+def list_jobs(status: str = "", limit: int = 20) -> str:
+    """
+    列出最近的后台任务
+    
+    Args:
+        status: 状态过滤 (queued, running, completed, failed, cancelled)
+        limit: 返回数量上限
+    """
+    if status and status not in JOB_STATUSES:
+        return json.dumps({"error": f"Invalid status. Use: {', '.join(JOB_STATUSES)}"}, ensure_ascii=False)
+    return json.dumps(job_queue.list(status, limit), indent=2, ensure_ascii=False, default=str)
+
+
 @mcp.tool()
 def calculate_complexity(file_path: str) -> str:
     """
@@ -69,7 +417,9 @@ def calculate_complexity(file_path: str) -> str:
         "functions_count": analysis.get("functions", 0),
         "classes_count": analysis.get("classes", 0),
         "complexity_level": "low" if analysis.get("complexity_score", 0) < 10 else 
-                           "medium" if analysis.get("complexity_score", 0) < 20 else "high"
+                           "medium" if analysis.get("complexity_score", 0) < 20 else "high",
+        # 空行、注释行（含文档字符串）和代码行
+        "lines": analyzer.count_file_lines(analysis["file_path"])
     }
     
     return json.dumps(complexity_result, indent=2, ensure_ascii=False)
@@ -114,7 +464,7 @@ def get_project_metrics(path: str) -> str:
                 "lines_of_code": analysis.get("lines_of_code", 0),
                 "quality_score": analysis.get("quality_score", 0),
                 "complexity_score": analysis.get("complexity_score", 0),
-                "issues_count": len(analysis.get("issues", []))
+                "issues_count": issue_total(analysis)
             }
         }
     else:
@@ -132,6 +482,61 @@ def get_project_metrics(path: str) -> str:
     return json.dumps(metrics, indent=2, ensure_ascii=False)
 
 
+# 判断项目根目录的标记文件
+PROJECT_MARKERS = ('.git', 'pyproject.toml', 'setup.py', 'package.json')
+
+
+def _find_project_root(file_path: str) -> str:
+    """查找文件所属的项目根目录：优先使用监听中的工作区，其次向上查找项目标记文件"""
+    file_path = os.path.abspath(file_path)
+    for root in watcher.status()["roots"]:
+        if file_path.startswith(root["root"] + os.sep):
+            return root["root"]
+    current = os.path.dirname(file_path)
+    while True:
+        if any(os.path.exists(os.path.join(current, marker)) for marker in PROJECT_MARKERS):
+            return current
+        parent = os.path.dirname(current)
+        if parent == current:
+            return os.path.dirname(file_path)
+        current = parent
+
+
+@mcp.resource("project://dependencies/{path}")
+def get_project_dependencies(path: str) -> str:
+    """获取项目依赖概况，或单个文件的依赖与影响范围"""
+    if not os.path.exists(path):
+        return json.dumps({"error": f"Path not found: {path}"}, ensure_ascii=False)
+    
+    if os.path.isdir(path):
+        result = analyzer.analyze_dependencies(path, reuse=watcher.is_primed(path))
+    else:
+        root = _find_project_root(path)
+        result = analyzer.analyze_dependencies(root, os.path.abspath(path), reuse=watcher.is_primed(root))
+    return json.dumps(result, indent=2, ensure_ascii=False)
+
+
+@mcp.resource("quality://history/{path}")
+def get_quality_history_resource(path: str) -> str:
+    """获取项目或文件的质量指标历史"""
+    return json.dumps(analyzer.quality_history_for(path), indent=2, ensure_ascii=False)
+
+
+@mcp.resource("quality://report/{path}")
+def get_quality_report(path: str) -> str:
+    """获取项目或文件的质量报告（当前指标、7天/30天变化、质量下降的文件）"""
+    return json.dumps(analyzer.quality_report_for(path), indent=2, ensure_ascii=False)
+
+
+@mcp.resource("jobs://{job_id}")
+def get_job_resource(job_id: str) -> str:
+    """获取后台任务状态"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return json.dumps({"error": f"Job {job_id} not found"}, ensure_ascii=False)
+    return json.dumps(job, indent=2, ensure_ascii=False, default=str)
+
+
 # 智能提示：代码审查
 @mcp.prompt()
 def code_review_prompt(file_path: str, focus_area: str = "general") -> str:
@@ -230,6 +635,17 @@ if __name__ == "__main__":
     logger = logging.getLogger(__name__)
     logger.info(f"Starting IDA MCP Server in directory: {os.getcwd()}")
     
+    # 监听配置的工作区根目录（以os.pathsep分隔）
+    for root in filter(None, os.environ.get("IDA_WATCH_ROOTS", "").split(os.pathsep)):
+        status = watcher.watch(root)
+        if "error" in status:
+            logger.warning(f"Cannot watch workspace {root}: {status['error']}")
+        else:
+            logger.info(f"Watching workspace: {status['root']} ({status['mode']})")
+    
+    # 恢复上次中断的后台任务
+    job_queue.start()
+    
     try:
         # Start the server
         mcp.run(transport="stdio")
@@ -238,3 +654,7 @@ if __name__ == "__main__":
     except Exception as e:
         logger.error(f"Server error: {e}")
         sys.exit(1)
+    finally:
+        watcher.stop()
+        job_queue.stop(timeout=5)
+        analyzer.close()
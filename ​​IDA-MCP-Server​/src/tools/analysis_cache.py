@@ -0,0 +1,112 @@
+"""
+分析结果缓存模块
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+
+
+def content_hash(data: bytes) -> str:
+    """计算内容哈希（与git blob SHA-1一致，便于按版本复用缓存）"""
+    digest = hashlib.sha1()
+    digest.update(b"blob %d\0" % len(data))
+    digest.update(data)
+    return digest.hexdigest()
+
+
+class AnalysisCache:
+    """分析结果缓存
+
+    结果以内容哈希为键保存；同时记录每个路径最近一次的 (mtime, size) 快照，
+    文件未变化时无需重新读取即可命中。
+    """
+
+    def __init__(self, max_entries: int = 4096):
+        self.max_entries = max_entries
+        self._results: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._snapshots: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+
+    def lookup_path(self, file_path: str) -> Optional[Dict[str, Any]]:
+        """按路径查找缓存结果，文件已变化时返回None"""
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            return None
+
+        with self._lock:
+            snapshot = self._snapshots.get(file_path)
+            if snapshot and snapshot[:2] == (stat.st_mtime_ns, stat.st_size):
+                result = self._get(snapshot[2])
+                if result is not None:
+                    return self._for_path(result, file_path)
+        return None
+
+    def get(self, digest: str, file_path: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """按内容哈希查找缓存结果"""
+        with self._lock:
+            result = self._get(digest)
+            if result is None:
+                self.misses += 1
+                return None
+        return self._for_path(result, file_path) if file_path else dict(result)
+
+    def put(self, digest: str, result: Dict[str, Any], file_path: Optional[str] = None,
+            stat: Optional[os.stat_result] = None):
+        """写入分析结果，并可选地记录路径快照"""
+        with self._lock:
+            self._results[digest] = result
+            self._results.move_to_end(digest)
+            while len(self._results) > self.max_entries:
+                self._results.popitem(last=False)
+            if file_path and stat is not None:
+                self._snapshots[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+
+    def remember(self, file_path: str, stat: os.stat_result, digest: str):
+        """记录路径快照（结果已按哈希缓存时使用）"""
+        with self._lock:
+            self._snapshots[file_path] = (stat.st_mtime_ns, stat.st_size, digest)
+
+    def invalidate(self, file_path: str):
+        """移除路径快照，下次访问时重新校验内容"""
+        with self._lock:
+            self._snapshots.pop(file_path, None)
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self._results.clear()
+            self._snapshots.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, Any]:
+        """获取缓存统计信息"""
+        with self._lock:
+            return {
+                "entries": len(self._results),
+                "tracked_paths": len(self._snapshots),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+    def _get(self, digest: str) -> Optional[Dict[str, Any]]:
+        result = self._results.get(digest)
+        if result is not None:
+            self._results.move_to_end(digest)
+            self.hits += 1
+        return result
+
+    @staticmethod
+    def _for_path(result: Dict[str, Any], file_path: str) -> Dict[str, Any]:
+        # 相同内容可能出现在多个路径下，返回副本并修正路径
+        copied = dict(result)
+        if "file_path" in copied:
+            copied["file_path"] = file_path
+        return copied
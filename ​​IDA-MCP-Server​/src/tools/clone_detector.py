@@ -0,0 +1,386 @@
+"""
+重复代码检测模块
+
+逐文件做词法切分（标识符、字符串、数字统一替换为占位符，可发现改名后的复制代码），
+对连续 K 个记号计算滚动哈希，再用窗口取最小值（winnowing）选出指纹。
+指纹存入倒排索引（哈希 -> 出现位置），只比较共享指纹的位置，不做文件两两比较；
+文件变化时只替换该文件的指纹。
+"""
+
+import keyword
+import os
+import re
+import threading
+import time
+import zlib
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.tools.analysis_cache import AnalysisCache, content_hash
+from src.tools.parallel import load_file_results
+
+# 指纹对应的连续记号数
+KGRAM_TOKENS = 20
+# winnowing窗口大小：长度不小于 KGRAM_TOKENS + WINDOW - 1 个记号的重复片段保证能被发现
+WINDOW = 10
+# 默认报告的最小重复片段长度（记号数）
+MIN_CLONE_TOKENS = 50
+# 出现位置过多的指纹多为样板代码，不参与匹配（同时限制单个哈希的比较次数）
+MAX_POSTINGS = 50
+
+_HASH_BASE = 1000003
+_HASH_MOD = (1 << 61) - 1
+
+_PYTHON_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>\#[^\n]*)
+  | (?P<string>[rRbBuUfF]{0,2}(?:'''.*?'''|\"\"\".*?\"\"\"|'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"))
+  | (?P<number>\d[\w.]*)
+  | (?P<ident>[A-Za-z_]\w*)
+  | (?P<op>[^\s\w])
+""", re.S | re.X)
+
+_JS_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`)
+  | (?P<number>\d[\w.]*)
+  | (?P<ident>[A-Za-z_$][\w$]*)
+  | (?P<op>[^\s\w$])
+""", re.S | re.X)
+
+# 关键字保留原文，其余标识符替换为占位符
+_KEYWORDS = frozenset(keyword.kwlist) | frozenset("""
+    async await break case catch class const continue default delete do else export extends finally for
+    function if import in instanceof let new of return static super switch this throw try typeof var void
+    while yield
+""".split())
+
+_PLACEHOLDERS = {"string": "$str", "number": "$num", "ident": "$id"}
+
+
+def tokenize(content: str, file_ext: str) -> Tuple[List[int], List[int]]:
+    """切分为规范化记号，返回 (记号编码列表, 记号所在行号列表)"""
+    pattern = _PYTHON_TOKEN_PATTERN if file_ext == '.py' else _JS_TOKEN_PATTERN
+    codes: List[int] = []
+    lines: List[int] = []
+    line, last = 1, 0
+    code_cache: Dict[str, int] = {}
+    for match in pattern.finditer(content):
+        kind = match.lastgroup
+        if kind == "comment":
+            continue
+        start = match.start()
+        line += content.count("\n", last, start)
+        last = start
+        text = match.group()
+        if kind == "ident" and text in _KEYWORDS:
+            normalized = text
+        else:
+            normalized = _PLACEHOLDERS.get(kind, text)
+        code = code_cache.get(normalized)
+        if code is None:
+            # 使用确定性的哈希（内置hash在各进程中不同）
+            code = code_cache[normalized] = zlib.crc32(normalized.encode("utf-8"))
+        codes.append(code)
+        lines.append(line)
+    return codes, lines
+
+
+def winnow(codes: List[int], k: int = KGRAM_TOKENS, window: int = WINDOW) -> List[Tuple[int, int]]:
+    """计算 k-gram 滚动哈希并按窗口选取指纹，返回 [(哈希, 起始记号位置)]"""
+    if len(codes) < k:
+        return []
+    high = pow(_HASH_BASE, k - 1, _HASH_MOD)
+    value = 0
+    for code in codes[:k]:
+        value = (value * _HASH_BASE + code) % _HASH_MOD
+    hashes = [value]
+    for i in range(k, len(codes)):
+        value = ((value - codes[i - k] * high) * _HASH_BASE + codes[i]) % _HASH_MOD
+        hashes.append(value)
+
+    # 单调队列求每个窗口的最小值（相同时取最右侧），相邻窗口选中同一位置时只记录一次
+    selected: List[Tuple[int, int]] = []
+    candidates: deque = deque()
+    last_selected = -1
+    for i, value in enumerate(hashes):
+        while candidates and hashes[candidates[-1]] >= value:
+            candidates.pop()
+        candidates.append(i)
+        if candidates[0] <= i - window:
+            candidates.popleft()
+        if i >= window - 1 or i == len(hashes) - 1:
+            position = candidates[0]
+            if position != last_selected:
+                selected.append((hashes[position], position))
+                last_selected = position
+    return selected
+
+
+def fingerprint_source(content: str, file_ext: str) -> Dict[str, Any]:
+    """计算源代码的指纹，每个指纹为 [哈希, 记号位置, 起始行, 结束行]"""
+    codes, lines = tokenize(content, file_ext)
+    return {
+        "tokens": len(codes),
+        "lines": content.count("\n") + (1 if content and not content.endswith("\n") else 0),
+        "fingerprints": [[value, position, lines[position], lines[position + KGRAM_TOKENS - 1]]
+                         for value, position in winnow(codes)]
+    }
+
+
+def _fingerprint_file(file_path: str):
+    """读取并计算单个文件的指纹（在工作进程中执行），返回 (路径, stat, 内容哈希, 结果)"""
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return file_path, None, None, {"error": str(e)}
+    digest = content_hash(data)
+    try:
+        content = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        return file_path, stat, digest, {"tokens": 0, "lines": 0, "fingerprints": [], "error": str(e)}
+    return file_path, stat, digest, fingerprint_source(content, Path(file_path).suffix.lower())
+
+
+def load_fingerprints(file_paths: List[str], cache: AnalysisCache,
+                      max_workers: Optional[int] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """批量获取文件指纹（按内容哈希缓存，未命中的文件较多时并行计算），返回 ({路径: 结果}, 统计)"""
+    return load_file_results(file_paths, cache, _fingerprint_file, max_workers)
+
+
+def _merge_intervals(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1] + 1:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+class CloneIndex:
+    """项目级指纹倒排索引
+
+    文件以相对项目根目录的路径表示；倒排表中的位置为 (文件, 该文件指纹列表中的下标)。
+    """
+
+    def __init__(self, project_path: str, file_paths: List[str], fingerprints: Dict[str, Dict[str, Any]]):
+        self.project_path = project_path
+        self.files: Dict[str, List[List[int]]] = {}
+        self.lines: Dict[str, int] = {}
+        self.postings: Dict[int, List[Tuple[str, int]]] = defaultdict(list)
+        self.build_stats: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._prefix = os.path.join(project_path, '')
+        self._clones: Optional[List[Dict[str, Any]]] = None
+
+        for file_path in file_paths:
+            result = fingerprints.get(file_path)
+            if result is not None:
+                self.set_file(file_path, result)
+        self.updated_at = time.time()
+
+    def relpath(self, file_path: str) -> str:
+        """转换为相对项目根目录的路径"""
+        if file_path.startswith(self._prefix):
+            rel_path = file_path[len(self._prefix):]
+        else:
+            rel_path = os.path.relpath(os.path.abspath(file_path), self.project_path)
+        return rel_path.replace(os.sep, '/') if os.sep != '/' else rel_path
+
+    def set_file(self, file_path: str, result: Dict[str, Any]):
+        """替换文件的指纹"""
+        rel_path = self.relpath(file_path)
+        with self._lock:
+            self._remove(rel_path)
+            fingerprints = result.get("fingerprints", [])
+            self.files[rel_path] = fingerprints
+            self.lines[rel_path] = result.get("lines", 0)
+            for index, fingerprint in enumerate(fingerprints):
+                self.postings[fingerprint[0]].append((rel_path, index))
+            self._clones = None
+            self.updated_at = time.time()
+
+    def remove_file(self, file_path: str):
+        """移除文件的指纹"""
+        with self._lock:
+            self._remove(self.relpath(file_path))
+            self._clones = None
+            self.updated_at = time.time()
+
+    def _remove(self, rel_path: str):
+        for value in {fingerprint[0] for fingerprint in self.files.pop(rel_path, ())}:
+            remaining = [entry for entry in self.postings[value] if entry[0] != rel_path]
+            if remaining:
+                self.postings[value] = remaining
+            else:
+                del self.postings[value]
+        self.lines.pop(rel_path, None)
+
+    def clones(self) -> List[Dict[str, Any]]:
+        """全部重复片段对（结果在索引变化前复用），按记号数从多到少排列"""
+        with self._lock:
+            if self._clones is None:
+                self._clones = self._find_clones()
+            return self._clones
+
+    def _find_clones(self) -> List[Dict[str, Any]]:
+        # 同一对文件中，记号位置差（对角线）相同的匹配指纹属于同一段连续的重复代码
+        diagonals: Dict[Tuple[str, str, int], List[Tuple[int, int, int]]] = defaultdict(list)
+        for entries in self.postings.values():
+            if len(entries) < 2 or len(entries) > MAX_POSTINGS:
+                continue
+            for i, (file_a, index_a) in enumerate(entries):
+                position_a = self.files[file_a][index_a][1]
+                for file_b, index_b in entries[i + 1:]:
+                    position_b = self.files[file_b][index_b][1]
+                    if (file_b, position_b) < (file_a, position_a):
+                        first, second = (file_b, index_b, position_b), (file_a, index_a, position_a)
+                    else:
+                        first, second = (file_a, index_a, position_a), (file_b, index_b, position_b)
+                    diagonals[(first[0], second[0], second[2] - first[2])].append((first[2], first[1], second[1]))
+
+        clones = []
+        gap = KGRAM_TOKENS + WINDOW
+        for (file_a, file_b, offset), matches in diagonals.items():
+            matches.sort()
+            run = [matches[0]]
+            for match in matches[1:] + [None]:
+                if match is not None and match[0] - run[-1][0] <= gap:
+                    run.append(match)
+                    continue
+                tokens = run[-1][0] - run[0][0] + KGRAM_TOKENS
+                # 同一文件中与自身重叠的片段（如重复的单行语句）不算克隆
+                if file_a != file_b or offset >= tokens:
+                    fingerprints_a, fingerprints_b = self.files[file_a], self.files[file_b]
+                    clones.append({
+                        "tokens": tokens,
+                        "fragments": [
+                            (file_a, fingerprints_a[run[0][1]][2], fingerprints_a[run[-1][1]][3]),
+                            (file_b, fingerprints_b[run[0][2]][2], fingerprints_b[run[-1][2]][3])
+                        ]
+                    })
+                run = [match]
+        clones.sort(key=lambda clone: (-clone["tokens"], clone["fragments"]))
+        return clones
+
+    @staticmethod
+    def _format_clone(clone: Dict[str, Any]) -> Dict[str, Any]:
+        return {
+            "tokens": clone["tokens"],
+            "fragments": [{"file": path, "start_line": start, "end_line": end}
+                          for path, start, end in clone["fragments"]]
+        }
+
+    @staticmethod
+    def clone_classes(clones: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """把重复片段对合并为克隆类：同一文件中重叠的片段视为同一段代码，再按片段对连通"""
+        by_file: Dict[str, List[Tuple[int, int, int]]] = defaultdict(list)
+        for number, clone in enumerate(clones):
+            for side, (path, start, end) in enumerate(clone["fragments"]):
+                by_file[path].append((start, end, number * 2 + side))
+
+        parent = list(range(len(clones) * 2))
+
+        def find(node: int) -> int:
+            while parent[node] != node:
+                parent[node] = parent[parent[node]]
+                node = parent[node]
+            return node
+
+        def union(a: int, b: int):
+            root_a, root_b = find(a), find(b)
+            if root_a != root_b:
+                parent[root_b] = root_a
+
+        for number in range(len(clones)):
+            union(number * 2, number * 2 + 1)
+        for fragments in by_file.values():
+            fragments.sort()
+            current_end, current_node = -1, -1
+            for start, end, node in fragments:
+                if start <= current_end:
+                    union(current_node, node)
+                    current_end = max(current_end, end)
+                else:
+                    current_end, current_node = end, node
+
+        groups: Dict[int, Dict[str, List[Tuple[int, int]]]] = defaultdict(lambda: defaultdict(list))
+        tokens: Dict[int, int] = defaultdict(int)
+        for path, fragments in by_file.items():
+            for start, end, node in fragments:
+                root = find(node)
+                groups[root][path].append((start, end))
+                tokens[root] = max(tokens[root], clones[node // 2]["tokens"])
+
+        classes = []
+        for root, files in groups.items():
+            fragments = [{"file": path, "start_line": start, "end_line": end}
+                         for path in sorted(files) for start, end in _merge_intervals(files[path])]
+            classes.append({"tokens": tokens[root], "instances": len(fragments), "fragments": fragments})
+        classes.sort(key=lambda item: (-item["instances"] * item["tokens"], item["fragments"][0]["file"]))
+        return classes
+
+    @staticmethod
+    def duplicated_lines(clones: List[Dict[str, Any]]) -> Dict[str, int]:
+        """每个文件中处于重复片段内的行数"""
+        intervals: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+        for clone in clones:
+            for path, start, end in clone["fragments"]:
+                intervals[path].append((start, end))
+        return {path: sum(end - start + 1 for start, end in _merge_intervals(ranges))
+                for path, ranges in intervals.items()}
+
+    def summary(self, min_tokens: int = MIN_CLONE_TOKENS, limit: int = 20) -> Dict[str, Any]:
+        """项目重复代码概况"""
+        clones = [clone for clone in self.clones() if clone["tokens"] >= min_tokens]
+        duplicated = self.duplicated_lines(clones)
+        classes = self.clone_classes(clones)
+        with self._lock:
+            total_lines = sum(self.lines.values())
+            fingerprints = sum(len(entries) for entries in self.postings.values())
+            files = len(self.files)
+        duplicated_total = sum(duplicated.values())
+        most_duplicated = sorted(duplicated.items(), key=lambda item: (-item[1], item[0]))[:limit]
+        return {
+            "project_path": self.project_path,
+            "files": files,
+            "fingerprints": fingerprints,
+            "min_tokens": min_tokens,
+            "clone_pairs_count": len(clones),
+            "clone_classes_count": len(classes),
+            "total_lines": total_lines,
+            "duplicated_lines": duplicated_total,
+            "duplication_ratio": round(duplicated_total / total_lines, 4) if total_lines else 0.0,
+            "clone_classes": [dict(item, fragments=item["fragments"][:limit]) for item in classes[:limit]],
+            "most_duplicated_files": [
+                {"file": path, "duplicated_lines": lines, "lines": self.lines.get(path, 0)}
+                for path, lines in most_duplicated
+            ],
+            "build": self.build_stats,
+            "updated_at": self.updated_at
+        }
+
+    def file_report(self, file_path: str, min_tokens: int = MIN_CLONE_TOKENS, limit: int = 100) -> Dict[str, Any]:
+        """与指定文件有关的重复片段"""
+        rel_path = self.relpath(file_path)
+        with self._lock:
+            if rel_path not in self.files:
+                return {"error": f"File is not part of the clone index: {file_path}"}
+            lines = self.lines.get(rel_path, 0)
+        clones = [clone for clone in self.clones()
+                  if clone["tokens"] >= min_tokens and any(path == rel_path for path, _, _ in clone["fragments"])]
+        duplicated = self.duplicated_lines(clones).get(rel_path, 0)
+        return {
+            "project_path": self.project_path,
+            "file": rel_path,
+            "min_tokens": min_tokens,
+            "lines": lines,
+            "duplicated_lines": duplicated,
+            "duplication_ratio": round(duplicated / lines, 4) if lines else 0.0,
+            "clone_pairs_count": len(clones),
+            "clone_pairs": [self._format_clone(clone) for clone in clones[:limit]]
+        }
@@ -7,9 +7,24 @@ import os
 import subprocess
 import json
 import re
-from typing import Dict, List, Any, Optional
+import sqlite3
+import time
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from pathlib import Path
 import logging
+
+from src.tools.analysis_cache import AnalysisCache, content_hash
+from src.tools.clone_detector import CloneIndex, MIN_CLONE_TOKENS, load_fingerprints
+from src.tools.dependency_graph import DependencyGraph, load_imports
+from src.tools.git_source import GitError, GitRepository
+from src.tools.issues import (COMPLEX_FUNCTION_RULE, LONG_LINE_RULE, TOO_MANY_IMPORTS_RULE, IssueReport,
+                              issue_total)
+from src.tools.line_counter import LANGUAGES, load_line_counts, summarize as summarize_lines
+from src.tools.project_aggregate import ProjectAggregate
+from src.tools.quality_history import QualityHistory
+from src.tools.security_rules import DEFAULT_RULES, SEVERITY_LEVELS, rules_file_version, scan_files
+from src.tools.symbol_index import SymbolIndex
+from src.tools.worker_pool import Quarantine, WorkerCrash, WorkerPool, WorkerTimeout, WorkerUnavailable
 """
 代码分析工具模块
 """
@@ -26,12 +41,221 @@ import re
 from typing import Dict, List, Any, Optional
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
+# 遍历项目时跳过的目录
+IGNORED_DIRS = {'node_modules', '__pycache__', 'venv', 'env'}
+
+
+def is_ignored_dir(name: str) -> bool:
+    """判断目录是否应在遍历项目时跳过"""
+    return name.startswith('.') or name in IGNORED_DIRS
+
 
-class CodeAnalyzer:
+class SourceAnalyzer:
+    """源代码分析（不依赖缓存和数据库，隔离模式下工作进程只创建这一部分）"""
+    
+    def analyze_source(self, content: str, file_path: str, file_ext: str) -> Dict[str, Any]:
+        """按文件类型分析源代码文本"""
+        if file_ext == '.py':
+            return self._analyze_python_source(content, file_path)
+        elif file_ext in {'.js', '.ts', '.jsx', '.tsx'}:
+            return self._analyze_javascript_source(content, file_path)
+        else:
+            return {"error": f"Unsupported file type: {file_ext}"}
+    
+    def _analyze_python_source(self, content: str, file_path: str) -> Dict[str, Any]:
+        """分析Python源代码"""
+        try:
+            # AST分析
+            tree = ast.parse(content)
+            
+            # 基础指标
+            metrics = {
+                "file_path": file_path,
+                "language": "python",
+                "lines_of_code": len(content.splitlines()),
+                "functions": self._count_functions(tree),
+                "classes": self._count_classes(tree),
+                "complexity_score": self._calculate_complexity(tree),
+                "issues": []
+            }
+            
+            # 代码质量检查
+            report = self._check_python_issues(content, tree)
+            metrics.update(report.to_dict())
+            metrics["quality_score"] = report.quality_score()
+            
+            return metrics
+            
+        except MemoryError:
+            # 隔离模式下由工作进程池处理（结束进程并隔离该文件）
+            raise
+        except Exception as e:
+            return {"error": f"Analysis failed: {str(e)}"}
+    
+    def _analyze_javascript_source(self, content: str, file_path: str) -> Dict[str, Any]:
+        """分析JavaScript/TypeScript源代码"""
+        try:
+            # 基础指标
+            metrics = {
+                "file_path": file_path,
+                "language": "javascript/typescript",
+                "lines_of_code": len(content.splitlines()),
+                "functions": self._count_js_functions(content),
+                "complexity_score": self._estimate_js_complexity(content),
+                "issues": []
+            }
+            
+            # 简单的代码质量检查
+            report = self._check_js_issues(content)
+            metrics.update(report.to_dict())
+            metrics["quality_score"] = report.quality_score()
+            
+            return metrics
+            
+        except MemoryError:
+            # 隔离模式下由工作进程池处理（结束进程并隔离该文件）
+            raise
+        except Exception as e:
+            return {"error": f"Analysis failed: {str(e)}"}
+    
+    def _count_functions(self, tree: ast.AST) -> int:
+        """计算Python函数数量"""
+        return len([node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)])
+    
+    def _count_classes(self, tree: ast.AST) -> int:
+        """计算Python类数量"""
+        return len([node for node in ast.walk(tree) if isinstance(node, ast.ClassDef)])
+    
+    def _calculate_complexity(self, tree: ast.AST) -> int:
+        """计算圈复杂度（简化版）"""
+        complexity = 1  # 基础复杂度
+        
+        for node in ast.walk(tree):
+            if isinstance(node, (ast.If, ast.While, ast.For, ast.Try, ast.With)):
+                complexity += 1
+            elif isinstance(node, ast.BoolOp):
+                complexity += len(node.values) - 1
+        
+        return complexity
+    
+    def _check_python_issues(self, content: str, tree: ast.AST) -> IssueReport:
+        """检查Python代码问题（按规则计数，每条规则只保留有限条明细）"""
+        report = IssueReport()
+        
+        # 检查长行
+        self._check_long_lines(content, report)
+        
+        # 检查函数复杂度
+        for node in ast.walk(tree):
+            if isinstance(node, ast.FunctionDef):
+                func_complexity = self._calculate_function_complexity(node)
+                if func_complexity > 10:
+                    report.add(COMPLEX_FUNCTION_RULE, "complexity", "warning", node.lineno,
+                               f"Function '{node.name}' is too complex (complexity: {func_complexity})")
+        
+        # 检查未使用的导入（简化版）
+        imports = [node for node in ast.walk(tree) if isinstance(node, (ast.Import, ast.ImportFrom))]
+        if len(imports) > 20:
+            report.add(TOO_MANY_IMPORTS_RULE, "maintainability", "info", 1,
+                       f"Too many imports ({len(imports)}), consider refactoring")
+        
+        # 安全与规范规则（复用已解析的语法树）
+        report.extend(DEFAULT_RULES.iter_findings(content, '.py', tree))
+        
+        return report
+    
+    def _check_long_lines(self, content: str, report: IssueReport, max_length: int = 120):
+        """检查超长行：由正则直接定位超长行，行号按匹配之间的换行数累加，不为每一行创建字符串"""
+        line_number = 1
+        position = 0
+        for match in re.finditer(rf"[^\n]{{{max_length + 1},}}", content):
+            line_number += content.count('\n', position, match.start())
+            position = match.start()
+            length = match.end() - match.start() - (content[match.end() - 1] == '\r')
+            if length > max_length:
+                report.add(LONG_LINE_RULE, "style", "warning", line_number,
+                           f"Line too long ({length} > {max_length} characters)")
+    
+    def _calculate_function_complexity(self, func_node: ast.FunctionDef) -> int:
+        """计算单个函数的复杂度"""
+        complexity = 1
+        for node in ast.walk(func_node):
+            if isinstance(node, (ast.If, ast.While, ast.For, ast.Try, ast.With)):
+                complexity += 1
+        return complexity
+    
+    def _count_js_functions(self, content: str) -> int:
+        """计算JavaScript函数数量（简化版）"""
+        import re
+        function_patterns = [
+            r'function\s+\w+',
+            r'\w+\s*:\s*function',
+            r'=>',
+            r'function\s*\('
+        ]
+        
+        count = 0
+        for pattern in function_patterns:
+            count += len(re.findall(pattern, content))
+        
+        return count
+    
+    def _estimate_js_complexity(self, content: str) -> int:
+        """估算JavaScript复杂度"""
+        complexity_keywords = ['if', 'else', 'while', 'for', 'switch', 'case', 'try', 'catch']
+        
+        complexity = 1
+        for keyword in complexity_keywords:
+            complexity += len(re.findall(rf'\b{keyword}\b', content))
+        
+        return complexity
+    
+    def _check_js_issues(self, content: str) -> IssueReport:
+        """检查JavaScript代码问题（按规则计数，每条规则只保留有限条明细）"""
+        report = IssueReport()
+        
+        # 检查长行
+        self._check_long_lines(content, report)
+        
+        # 安全与规范规则（包括console.log检查），所有文本规则合并为一次扫描
+        report.extend(DEFAULT_RULES.iter_findings(content, '.js'))
+        
+        return report
+
+
+class CodeAnalyzer(SourceAnalyzer):
     """代码分析器"""
     
-    def __init__(self):
+    def __init__(self, isolated: bool = False):
+        """
+        Args:
+            isolated: 为True时在受监管的工作进程中分析（有超时和内存限制），超时或崩溃的文件被隔离
+        """
         self.supported_extensions = {'.py', '.js', '.ts', '.jsx', '.tsx'}
+        self.cache = AnalysisCache()
+        self.project_aggregates: Dict[str, ProjectAggregate] = {}
+        # import记录单独缓存（条目很小，容量按大型仓库的文件数设置）
+        self.import_cache = AnalysisCache(max_entries=200000)
+        self.dependency_graphs: Dict[str, DependencyGraph] = {}
+        self.fingerprint_cache = AnalysisCache(max_entries=200000)
+        # 行数统计覆盖项目中全部可识别语言的文件
+        self.line_cache = AnalysisCache(max_entries=200000)
+        self.clone_indexes: Dict[str, CloneIndex] = {}
+        # 每次项目分析的汇总指标追加到质量历史中
+        self.quality_history = QualityHistory()
+        self._quality_compacted_at = 0.0
+        # 按仓库根目录复用git仓库对象（每个仓库一个常驻的 cat-file 进程），路径到根目录的映射单独缓存
+        self.git_repositories: Dict[str, GitRepository] = {}
+        self._git_roots: Dict[str, str] = {}
+        # 安全检查结果按规则文件分别缓存（""为内置规则），值为 (规则文件版本, 缓存)
+        self.security_caches: Dict[str, Tuple[str, AnalysisCache]] = {}
+        # 符号索引持久化在分析数据库中；已在本进程中同步过的项目由监听器增量维护
+        self.symbol_index = SymbolIndex()
+        self.symbol_projects = set()
+        self.worker_pool = WorkerPool() if isolated else None
+        self.quarantine = Quarantine()
     
     def _resolve_file_path(self, file_path: str) -> str:
         """解析文件路径，支持相对路径和绝对路径"""
@@ -154,196 +378,107 @@ class CodeAnalyzer:
                 **debug_info
             }
         
-        file_path = resolved_path
-        
+        return self.analyze_file(resolved_path)
+    
+    def analyze_file(self, file_path: str) -> Dict[str, Any]:
+        """分析已解析路径的文件，内容未变化时直接返回缓存结果"""
         file_ext = Path(file_path).suffix.lower()
-        
-        if file_ext == '.py':
-            return self._analyze_python_file(file_path)
-        elif file_ext in {'.js', '.ts', '.jsx', '.tsx'}:
-            return self._analyze_javascript_file(file_path)
-        else:
+        if file_ext not in self.supported_extensions:
             return {"error": f"Unsupported file type: {file_ext}"}
-    
-    def _analyze_python_file(self, file_path: str) -> Dict[str, Any]:
-        """分析Python文件"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # AST分析
-            tree = ast.parse(content)
-            
-            # 基础指标
-            metrics = {
-                "file_path": file_path,
-                "language": "python",
-                "lines_of_code": len(content.splitlines()),
-                "functions": self._count_functions(tree),
-                "classes": self._count_classes(tree),
-                "complexity_score": self._calculate_complexity(tree),
-                "issues": []
-            }
-            
-            # 代码质量检查
-            issues = self._check_python_issues(content, tree)
-            metrics["issues"] = issues
-            metrics["quality_score"] = max(0, 100 - len(issues) * 5)
-            
-            return metrics
-            
-        except Exception as e:
-            return {"error": f"Analysis failed: {str(e)}"}
-    
-    def _analyze_javascript_file(self, file_path: str) -> Dict[str, Any]:
-        """分析JavaScript/TypeScript文件"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # 基础指标
-            metrics = {
-                "file_path": file_path,
-                "language": "javascript/typescript",
-                "lines_of_code": len(content.splitlines()),
-                "functions": self._count_js_functions(content),
-                "complexity_score": self._estimate_js_complexity(content),
-                "issues": []
-            }
-            
-            # 简单的代码质量检查
-            issues = self._check_js_issues(content)
-            metrics["issues"] = issues
-            metrics["quality_score"] = max(0, 100 - len(issues) * 5)
-            
-            return metrics
-            
-        except Exception as e:
-            return {"error": f"Analysis failed: {str(e)}"}
-    
-    def _count_functions(self, tree: ast.AST) -> int:
-        """计算Python函数数量"""
-        return len([node for node in ast.walk(tree) if isinstance(node, ast.FunctionDef)])
-    
-    def _count_classes(self, tree: ast.AST) -> int:
-        """计算Python类数量"""
-        return len([node for node in ast.walk(tree) if isinstance(node, ast.ClassDef)])
-    
-    def _calculate_complexity(self, tree: ast.AST) -> int:
-        """计算圈复杂度（简化版）"""
-        complexity = 1  # 基础复杂度
         
-        for node in ast.walk(tree):
-            if isinstance(node, (ast.If, ast.While, ast.For, ast.Try, ast.With)):
-                complexity += 1
-            elif isinstance(node, ast.BoolOp):
-                complexity += len(node.values) - 1
+        cached = self.cache.lookup_path(file_path)
+        if cached is not None:
+            return cached
         
-        return complexity
-    
-    def _check_python_issues(self, content: str, tree: ast.AST) -> List[Dict[str, Any]]:
-        """检查Python代码问题"""
-        issues = []
-        lines = content.splitlines()
+        try:
+            stat = os.stat(file_path)
+            with open(file_path, 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            return {"error": f"Analysis failed: {str(e)}"}
         
-        # 检查长行
-        for i, line in enumerate(lines, 1):
-            if len(line) > 120:
-                issues.append({
-                    "type": "style",
-                    "severity": "warning",
-                    "line": i,
-                    "message": f"Line too long ({len(line)} > 120 characters)"
-                })
+        digest = content_hash(data)
+        cached = self.cache.get(digest, file_path)
+        if cached is not None:
+            self.cache.remember(file_path, stat, digest)
+            return cached
         
-        # 检查函数复杂度
-        for node in ast.walk(tree):
-            if isinstance(node, ast.FunctionDef):
-                func_complexity = self._calculate_function_complexity(node)
-                if func_complexity > 10:
-                    issues.append({
-                        "type": "complexity",
-                        "severity": "warning",
-                        "line": node.lineno,
-                        "message": f"Function '{node.name}' is too complex (complexity: {func_complexity})"
-                    })
-        
-        # 检查未使用的导入（简化版）
-        imports = [node for node in ast.walk(tree) if isinstance(node, (ast.Import, ast.ImportFrom))]
-        if len(imports) > 20:
-            issues.append({
-                "type": "maintainability",
-                "severity": "info",
-                "line": 1,
-                "message": f"Too many imports ({len(imports)}), consider refactoring"
-            })
+        try:
+            content = data.decode('utf-8')
+        except UnicodeDecodeError as e:
+            return {"error": f"Analysis failed: {str(e)}"}
         
-        return issues
-    
-    def _calculate_function_complexity(self, func_node: ast.FunctionDef) -> int:
-        """计算单个函数的复杂度"""
-        complexity = 1
-        for node in ast.walk(func_node):
-            if isinstance(node, (ast.If, ast.While, ast.For, ast.Try, ast.With)):
-                complexity += 1
-        return complexity
+        result = self._run_analysis(content, file_path, file_ext, digest)
+        if "error" not in result:
+            self.cache.put(digest, result, file_path, stat)
+        return result
     
-    def _count_js_functions(self, content: str) -> int:
-        """计算JavaScript函数数量（简化版）"""
-        import re
-        function_patterns = [
-            r'function\s+\w+',
-            r'\w+\s*:\s*function',
-            r'=>',
-            r'function\s*\('
-        ]
-        
-        count = 0
-        for pattern in function_patterns:
-            count += len(re.findall(pattern, content))
+    def analyze_text(self, text: str, name: str,
+                     stats: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        """分析内存中的源代码文本（如编辑器中未保存的内容），按扩展名判断语言
         
-        return count
+        结果与文件分析共用以内容哈希为键的缓存：与磁盘上某个文件或某个git版本内容相同的文本直接命中。
+        """
+        file_ext = Path(name).suffix.lower()
+        if file_ext not in self.supported_extensions:
+            result = {"error": f"Unsupported file type: {file_ext or name}"}
+        else:
+            digest = content_hash(text.encode('utf-8'))
+            cached = self.cache.get(digest, name)
+            if stats is not None:
+                stats["cached" if cached is not None else "analyzed"] += 1
+            if cached is not None:
+                return cached
+            result = self._run_analysis(text, name, file_ext, digest)
+            if "error" not in result:
+                self.cache.put(digest, result)
+                return result
+        if stats is not None:
+            stats["failed"] += 1
+        return result
     
-    def _estimate_js_complexity(self, content: str) -> int:
-        """估算JavaScript复杂度"""
-        complexity_keywords = ['if', 'else', 'while', 'for', 'switch', 'case', 'try', 'catch']
-        
-        complexity = 1
-        for keyword in complexity_keywords:
-            complexity += len(re.findall(rf'\b{keyword}\b', content))
+    def analyze_buffers(self, buffers: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """一次分析多段源代码文本
         
-        return complexity
+        Args:
+            buffers: [{"name": 文件名（决定语言）, "text": 源代码}]
+        """
+        stats = {"buffers": len(buffers), "cached": 0, "analyzed": 0, "failed": 0}
+        results = []
+        for index, buffer in enumerate(buffers):
+            name = buffer.get("name") if isinstance(buffer, dict) else None
+            text = buffer.get("text") if isinstance(buffer, dict) else None
+            if not isinstance(name, str) or not isinstance(text, str):
+                stats["failed"] += 1
+                results.append({"error": f"Buffer {index} must have string 'name' and 'text' fields"})
+                continue
+            results.append(self.analyze_text(text, name, stats))
+        return {"results": results, "cache": stats}
     
-    def _check_js_issues(self, content: str) -> List[Dict[str, Any]]:
-        """检查JavaScript代码问题"""
-        issues = []
-        lines = content.splitlines()
-        
-        # 检查长行
-        for i, line in enumerate(lines, 1):
-            if len(line) > 120:
-                issues.append({
-                    "type": "style",
-                    "severity": "warning",
-                    "line": i,
-                    "message": f"Line too long ({len(line)} > 120 characters)"
-                })
-        
-        # 检查console.log（生产环境不应该有）
-        console_logs = re.finditer(r'console\.log', content)
-        for match in console_logs:
-            line_num = content[:match.start()].count('\n') + 1
-            issues.append({
-                "type": "maintainability",
-                "severity": "info",
-                "line": line_num,
-                "message": "console.log found - consider removing for production"
-            })
-        
-        return issues
+    def _run_analysis(self, content: str, file_path: str, file_ext: str, digest: str) -> Dict[str, Any]:
+        # 隔离模式下在工作进程中分析；超时或崩溃的内容记入隔离表，之后不再重试
+        if self.worker_pool is None:
+            return self.analyze_source(content, file_path, file_ext)
+        quarantined = self.quarantine.get(digest)
+        if quarantined is not None:
+            return {"error": f"Quarantined: {quarantined['reason']}", "quarantined": True}
+        try:
+            return self.worker_pool.call(f"{__name__}:analyze_source_in_worker", content, file_path, file_ext)
+        except (WorkerTimeout, WorkerCrash) as e:
+            logger.warning(f"Quarantining {file_path}: {e}")
+            self.quarantine.add(digest, file_path, str(e))
+            return {"error": f"Analysis failed: {e}", "quarantined": True}
+        except WorkerUnavailable as e:
+            # 工作进程无法启动与文件内容无关，不记入隔离表
+            logger.warning(f"Analysis worker unavailable, analyzing in process: {e}")
+            return self.analyze_source(content, file_path, file_ext)
 
-    def analyze_project_structure(self, project_path: str) -> Dict[str, Any]:
-        """分析项目结构"""
+    def analyze_project_structure(self, project_path: str, count_lines: bool = True,
+                                  max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """分析项目结构
+        
+        count_lines 为True时按语言统计空行、注释行和代码行（逐文件缓存，文件较多时并行统计）。
+        """
         if not os.path.exists(project_path):
             return {"error": f"Project path not found: {project_path}"}
         
@@ -355,10 +490,11 @@ class CodeAnalyzer:
             "directories": [],
             "files_by_type": {}
         }
+        counted_files = []
         
         for root, dirs, files in os.walk(project_path):
             # 跳过隐藏目录和常见的忽略目录
-            dirs[:] = [d for d in dirs if not d.startswith('.') and d not in {'node_modules', '__pycache__', 'venv', 'env'}]
+            dirs[:] = [d for d in dirs if not is_ignored_dir(d)]
             
             rel_root = os.path.relpath(root, project_path)
             if rel_root != '.':
@@ -370,6 +506,8 @@ class CodeAnalyzer:
                 
                 structure["total_files"] += 1
                 file_ext = Path(file).suffix.lower()
+                if file_ext in LANGUAGES:
+                    counted_files.append(os.path.join(root, file))
                 
                 # 统计文件类型
                 if file_ext in structure["files_by_type"]:
@@ -386,8 +524,506 @@ class CodeAnalyzer:
                     else:
                         structure["languages"][lang] = 1
         
+        if count_lines:
+            counts, stats = load_line_counts(counted_files, self.line_cache, max_workers)
+            structure["lines"] = summarize_lines(counts)
+            structure["lines"]["cache"] = stats
         return structure
     
+    def count_file_lines(self, file_path: str) -> Dict[str, Any]:
+        """统计单个文件的空行、注释行和代码行（按内容哈希缓存）"""
+        counts, _ = load_line_counts([file_path], self.line_cache, max_workers=1)
+        if file_path not in counts:
+            return {"error": f"Cannot read {file_path}"}
+        return counts[file_path]
+    
+    def iter_code_files(self, project_path: str):
+        """遍历项目中受支持的代码文件"""
+        for root, dirs, files in os.walk(project_path):
+            dirs[:] = [d for d in dirs if not is_ignored_dir(d)]
+            for file in files:
+                if not file.startswith('.') and os.path.splitext(file)[1].lower() in self.supported_extensions:
+                    yield os.path.join(root, file)
+    
+    def analyze_project(self, project_path: str,
+                        progress: Optional[Callable[[int, int, str], None]] = None,
+                        record_history: bool = True) -> Dict[str, Any]:
+        """分析项目中的全部代码文件并汇总指标
+        
+        Args:
+            project_path: 项目根目录路径
+            progress: 进度回调，参数为 (已完成数, 总数, 当前文件)
+            record_history: 是否记入质量历史（后台预热等非用户发起的分析不记录）
+        """
+        if not os.path.isdir(project_path):
+            return {"error": f"Project path not found: {project_path}"}
+        
+        project_path = os.path.abspath(project_path)
+        aggregate = ProjectAggregate(project_path)
+        files = list(self.iter_code_files(project_path))
+        for index, file_path in enumerate(files):
+            if progress is not None:
+                progress(index, len(files), file_path)
+            aggregate.update(file_path, self.analyze_file(file_path))
+        
+        self.project_aggregates[project_path] = aggregate
+        if record_history:
+            self.record_project_quality(project_path)
+        return aggregate.to_dict()
+    
+    def record_project_quality(self, project_path: str) -> Optional[Dict[str, int]]:
+        """把已汇总的项目指标连同当前HEAD提交记入质量历史，尚未汇总时返回None"""
+        aggregate = self.get_project_aggregate(project_path)
+        if aggregate is None:
+            return None
+        try:
+            commit = self.get_git_repository(aggregate.project_path).resolve("HEAD")
+        except GitError:
+            commit = ""
+        return self.record_quality(aggregate, commit)
+    
+    def record_quality(self, aggregate: ProjectAggregate, commit: str = "",
+                       timestamp: Optional[float] = None) -> Optional[Dict[str, int]]:
+        """把项目汇总指标追加到质量历史（写入失败不影响分析结果）"""
+        summary = aggregate.to_dict(top_n=0)
+        project_metrics = {
+            "files": summary["files_analyzed"],
+            "lines_of_code": summary["total_lines_of_code"],
+            "complexity_score": summary["average_complexity"],
+            "issues": summary["total_issues"],
+            "quality_score": summary["average_quality_score"]
+        }
+        try:
+            recorded = self.quality_history.record(aggregate.project_path, project_metrics,
+                                                   aggregate.file_summaries(), commit, timestamp)
+            # 每天压缩一次较早的记录
+            if time.time() - self._quality_compacted_at > 86400:
+                self.quality_history.compact()
+                self._quality_compacted_at = time.time()
+            return recorded
+        except sqlite3.Error as e:
+            logger.warning(f"Failed to record quality history for {aggregate.project_path}: {e}")
+            return None
+    
+    def quality_history_for(self, path: str, days: float = 0, max_points: int = 200) -> Dict[str, Any]:
+        """文件或项目的质量趋势（项目路径为目录，文件归属于包含它的、已记录历史的项目）"""
+        located = self._locate_history(path)
+        if "error" in located:
+            return located
+        start = time.time() - days * 86400 if days else None
+        end = time.time() if days else None
+        return self.quality_history.history(located["project"], located["path"], start, end, max_points)
+    
+    def quality_report_for(self, path: str, limit: int = 10) -> Dict[str, Any]:
+        """文件或项目的质量报告（由已记录的历史指标计算）"""
+        located = self._locate_history(path)
+        if "error" in located:
+            return located
+        return self.quality_history.report(located["project"], located["path"], limit=limit)
+    
+    def _locate_history(self, path: str) -> Dict[str, str]:
+        path = os.path.abspath(path)
+        if os.path.isdir(path):
+            return {"project": path, "path": ""}
+        # 向上查找已记录历史的项目目录
+        directory = os.path.dirname(path)
+        while True:
+            if self.quality_history.has_project(directory):
+                return {"project": directory, "path": os.path.relpath(path, directory).replace(os.sep, '/')}
+            parent = os.path.dirname(directory)
+            if parent == directory:
+                return {"error": f"No quality history recorded for {path}; run analyze_project on its project first"}
+            directory = parent
+    
+    def get_git_repository(self, path: str) -> GitRepository:
+        """获取路径所在的git仓库
+        
+        Raises:
+            GitError: 路径不在git仓库中
+        """
+        path = os.path.abspath(path)
+        root = self._git_roots.get(path)
+        repository = self.git_repositories.get(root) if root else None
+        if repository is None:
+            # 同一仓库中的文件共用一个对象（和一个常驻的 cat-file 进程）；新建的对象在读取前不启动进程
+            repository = GitRepository(path)
+            repository = self.git_repositories.setdefault(repository.root, repository)
+            self._git_roots[path] = repository.root
+        return repository
+    
+    def _analyze_blob(self, repository: GitRepository, sha: str, rel_path: str,
+                      stats: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+        # blob SHA即内容哈希，任意版本中相同的内容直接命中缓存，无需读取
+        cached = self.cache.get(sha, rel_path)
+        if stats is not None:
+            stats["cached" if cached is not None else "analyzed"] += 1
+        if cached is not None:
+            return cached
+        try:
+            content = repository.read_blob(sha).decode('utf-8')
+        except (GitError, UnicodeDecodeError) as e:
+            return {"error": f"Analysis failed: {str(e)}"}
+        result = self._run_analysis(content, rel_path, Path(rel_path).suffix.lower(), sha)
+        if "error" not in result:
+            self.cache.put(sha, result)
+        return result
+    
+    def _revision_files(self, repository: GitRepository, project_path: str, revision: str) -> List[tuple]:
+        # 返回 [(相对项目根目录的路径, blob SHA)]
+        subdir = repository.relpath(project_path)
+        prefix = subdir + '/' if subdir else ''
+        
+        def accept(path: str) -> bool:
+            parts = path[len(prefix):].split('/')
+            return os.path.splitext(parts[-1])[1].lower() in self.supported_extensions and \
+                not any(is_ignored_dir(part) for part in parts[:-1])
+        return [(path[len(prefix):], sha) for path, sha in repository.list_files(revision, subdir, accept)]
+    
+    def analyze_file_at_revision(self, file_path: str, revision: str) -> Dict[str, Any]:
+        """分析文件在指定版本中的内容（从git对象读取，无需检出）"""
+        file_ext = Path(file_path).suffix.lower()
+        if file_ext not in self.supported_extensions:
+            return {"error": f"Unsupported file type: {file_ext}"}
+        try:
+            repository = self.get_git_repository(file_path)
+            commit = repository.resolve(revision)
+            rel_path = repository.relpath(file_path)
+            sha = repository.blob_sha(commit, rel_path)
+        except GitError as e:
+            return {"error": f"Cannot read {file_path} at {revision}: {e}"}
+        result = self._analyze_blob(repository, sha, rel_path)
+        if "error" not in result:
+            result = dict(result, revision=revision, commit=commit, blob=sha)
+        return result
+    
+    def analyze_project_at_revision(self, project_path: str, revision: str,
+                                    progress: Optional[Callable[[int, int, str], None]] = None,
+                                    record: bool = True) -> Dict[str, Any]:
+        """分析项目在指定版本中的全部代码文件并汇总指标（从git对象读取，无需检出）
+        
+        record 为True时以提交时间把结果回填到质量历史中。
+        """
+        if not os.path.isdir(project_path):
+            return {"error": f"Project path not found: {project_path}"}
+        try:
+            repository = self.get_git_repository(project_path)
+            commit = repository.resolve(revision)
+            files = self._revision_files(repository, project_path, commit)
+            committed_at = float(repository.run("show", "-s", "--format=%ct", commit))
+        except GitError as e:
+            return {"error": f"Cannot read revision {revision}: {e}"}
+        
+        aggregate, stats = self._aggregate_blobs(repository, project_path, files, progress)
+        if record:
+            # 按提交时间回填历史，同一提交重复分析时保留原记录
+            self.record_quality(aggregate, commit, committed_at)
+        result = aggregate.to_dict()
+        result.update(revision=revision, commit=commit, cache=stats)
+        return result
+    
+    def _aggregate_blobs(self, repository: GitRepository, project_path: str, files: List[tuple],
+                         progress: Optional[Callable[[int, int, str], None]] = None):
+        aggregate = ProjectAggregate(os.path.abspath(project_path))
+        stats = {"analyzed": 0, "cached": 0}
+        for index, (rel_path, sha) in enumerate(files):
+            if progress is not None:
+                progress(index, len(files), rel_path)
+            aggregate.update(rel_path, self._analyze_blob(repository, sha, rel_path, stats))
+        return aggregate, stats
+    
+    def compare_revisions(self, project_path: str, base: str, head: str = "HEAD",
+                          limit: int = 20) -> Dict[str, Any]:
+        """比较项目在两个版本之间的质量指标变化
+        
+        Args:
+            project_path: 项目根目录路径（git仓库或其子目录）
+            base: 基准版本
+            head: 对比版本
+            limit: 列出的变化文件数量上限（按质量评分下降最多排序）
+        """
+        if not os.path.isdir(project_path):
+            return {"error": f"Project path not found: {project_path}"}
+        try:
+            repository = self.get_git_repository(project_path)
+            commits = [repository.resolve(base), repository.resolve(head)]
+            file_sets = [dict(self._revision_files(repository, project_path, commit)) for commit in commits]
+        except GitError as e:
+            return {"error": f"Cannot read revisions: {e}"}
+        
+        summaries = []
+        stats = {"analyzed": 0, "cached": 0}
+        for files in file_sets:
+            aggregate, revision_stats = self._aggregate_blobs(repository, project_path, sorted(files.items()))
+            summaries.append(aggregate.to_dict(top_n=0))
+            for key, value in revision_stats.items():
+                stats[key] += value
+        
+        # 相同blob的文件指标必然相同，只比较内容变化的文件
+        base_files, head_files = file_sets
+        counts = {"added": 0, "removed": 0, "modified": 0, "unchanged": 0}
+        changed = []
+        for rel_path in sorted(set(base_files) | set(head_files)):
+            base_sha, head_sha = base_files.get(rel_path), head_files.get(rel_path)
+            if base_sha == head_sha:
+                counts["unchanged"] += 1
+                continue
+            status = "added" if base_sha is None else "removed" if head_sha is None else "modified"
+            counts[status] += 1
+            before = self._analyze_blob(repository, base_sha, rel_path) if base_sha else {}
+            after = self._analyze_blob(repository, head_sha, rel_path) if head_sha else {}
+            entry = {"file_path": rel_path, "status": status}
+            for field in ("quality_score", "complexity_score", "lines_of_code", "issues"):
+                old, new = before.get(field, 0), after.get(field, 0)
+                if field == "issues":
+                    old, new = issue_total(before), issue_total(after)
+                entry[field] = {"base": old, "head": new, "delta": new - old}
+            changed.append(entry)
+        changed.sort(key=lambda item: (item["quality_score"]["delta"], item["file_path"]))
+        
+        delta_fields = ("files_analyzed", "total_lines_of_code", "total_functions", "total_classes",
+                        "total_issues", "average_complexity", "average_quality_score")
+        return {
+            "project_path": os.path.abspath(project_path),
+            "base": {"revision": base, "commit": commits[0], **{field: summaries[0][field] for field in delta_fields}},
+            "head": {"revision": head, "commit": commits[1], **{field: summaries[1][field] for field in delta_fields}},
+            "delta": {field: round(summaries[1][field] - summaries[0][field], 2) for field in delta_fields},
+            "files": counts,
+            "changed_files": changed[:limit],
+            "cache": stats
+        }
+    
+    def close(self):
+        """释放常驻的git进程和工作进程"""
+        for repository in self.git_repositories.values():
+            repository.close()
+        self.git_repositories.clear()
+        self._git_roots.clear()
+        if self.worker_pool is not None:
+            self.worker_pool.close()
+    
+    def list_quarantine(self, limit: int = 100) -> Dict[str, Any]:
+        """列出被隔离的文件及工作进程池状态"""
+        return {
+            "isolated": self.worker_pool is not None,
+            "workers": self.worker_pool.status() if self.worker_pool is not None else None,
+            "quarantined": self.quarantine.list(limit)
+        }
+    
+    def release_quarantine(self, file_path: str = "") -> Dict[str, Any]:
+        """解除隔离，下次分析时重新尝试；未指定路径时解除全部"""
+        return {"released": self.quarantine.release(file_path)}
+    
+    def get_project_aggregate(self, project_path: str) -> Optional[ProjectAggregate]:
+        """获取已汇总的项目指标"""
+        return self.project_aggregates.get(os.path.abspath(project_path))
+    
+    def build_dependency_graph(self, project_path: str, reuse: bool = False,
+                               max_workers: Optional[int] = None) -> DependencyGraph:
+        """建立项目依赖图
+        
+        Args:
+            project_path: 项目根目录路径（需已确认存在）
+            reuse: 已有未过期的依赖图时直接复用（监听中的工作区由监听器增量维护）
+            max_workers: 解析import的进程数，为1时在当前进程中解析
+        """
+        project_path = os.path.abspath(project_path)
+        graph = self.dependency_graphs.get(project_path)
+        if reuse and graph is not None and not graph.stale:
+            return graph
+        
+        started = time.monotonic()
+        files = list(self.iter_code_files(project_path))
+        imports, stats = load_imports(files, self.import_cache, max_workers)
+        graph = DependencyGraph(project_path, files, imports)
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        graph.build_stats = stats
+        self.dependency_graphs[project_path] = graph
+        return graph
+    
+    def refresh_dependencies(self, project_path: str, file_path: str, deleted: bool = False):
+        """文件变化后更新已建立的依赖图"""
+        graph = self.dependency_graphs.get(os.path.abspath(project_path))
+        if graph is None:
+            return
+        if deleted or graph.relpath(file_path) not in graph.files:
+            # 文件增删会改变模块解析结果，下次查询时重建
+            graph.stale = True
+            return
+        imports, _ = load_imports([file_path], self.import_cache, max_workers=1)
+        if file_path in imports:
+            graph.set_imports(file_path, imports[file_path])
+    
+    def analyze_dependencies(self, project_path: str, file_path: str = "", reuse: bool = False,
+                             limit: int = 100, max_depth: int = 0) -> Dict[str, Any]:
+        """分析项目依赖：未指定文件时返回项目概况，否则返回该文件的依赖与传递影响范围"""
+        if not os.path.isdir(project_path):
+            return {"error": f"Project path not found: {project_path}"}
+        
+        graph = self.build_dependency_graph(project_path, reuse=reuse)
+        if not file_path:
+            return graph.summary(limit)
+        if not os.path.isabs(file_path):
+            file_path = os.path.join(graph.project_path, file_path)
+        return graph.file_report(file_path, limit, max_depth)
+    
+    def build_clone_index(self, project_path: str, reuse: bool = False,
+                          max_workers: Optional[int] = None) -> CloneIndex:
+        """建立项目重复代码指纹索引
+        
+        Args:
+            project_path: 项目根目录路径（需已确认存在）
+            reuse: 已有索引时直接复用（监听中的工作区由监听器增量维护）
+            max_workers: 计算指纹的进程数，为1时在当前进程中计算
+        """
+        project_path = os.path.abspath(project_path)
+        index = self.clone_indexes.get(project_path)
+        if reuse and index is not None:
+            return index
+        
+        started = time.monotonic()
+        files = list(self.iter_code_files(project_path))
+        fingerprints, stats = load_fingerprints(files, self.fingerprint_cache, max_workers)
+        index = CloneIndex(project_path, files, fingerprints)
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        index.build_stats = stats
+        self.clone_indexes[project_path] = index
+        return index
+    
+    def refresh_clones(self, project_path: str, file_path: str, deleted: bool = False):
+        """文件变化后替换已建立索引中该文件的指纹"""
+        index = self.clone_indexes.get(os.path.abspath(project_path))
+        if index is None:
+            return
+        if deleted:
+            index.remove_file(file_path)
+            return
+        fingerprints, _ = load_fingerprints([file_path], self.fingerprint_cache, max_workers=1)
+        if file_path in fingerprints:
+            index.set_file(file_path, fingerprints[file_path])
+    
+    def detect_clones(self, project_path: str, file_path: str = "", reuse: bool = False,
+                      min_tokens: int = MIN_CLONE_TOKENS, limit: int = 20) -> Dict[str, Any]:
+        """检测重复代码：未指定文件时返回项目概况和克隆类，否则返回与该文件有关的重复片段"""
+        if not os.path.isdir(project_path):
+            return {"error": f"Project path not found: {project_path}"}
+        
+        index = self.build_clone_index(project_path, reuse=reuse)
+        if not file_path:
+            return index.summary(min_tokens, limit)
+        if not os.path.isabs(file_path):
+            file_path = os.path.join(index.project_path, file_path)
+        return index.file_report(file_path, min_tokens, limit)
+    
+    def check_security(self, path: str, min_severity: str = "info", rules_file: str = "",
+                       limit: int = 100, max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """对文件或项目执行安全与规范规则检查
+        
+        Args:
+            path: 文件或项目根目录路径
+            min_severity: 最低严重程度（info / warning / error）
+            rules_file: 在内置规则之外加载的JSON规则文件
+            limit: 返回的问题数量上限（统计数据不受影响）
+            max_workers: 检查文件的进程数，为1时在当前进程中检查
+        """
+        if min_severity not in SEVERITY_LEVELS:
+            return {"error": f"Invalid severity: {min_severity}. Use: {', '.join(SEVERITY_LEVELS)}"}
+        if rules_file:
+            rules_file = os.path.abspath(rules_file)
+            if not os.path.isfile(rules_file):
+                return {"error": f"Rules file not found: {rules_file}"}
+        if os.path.isdir(path):
+            root = os.path.abspath(path)
+            files = list(self.iter_code_files(root))
+        elif os.path.isfile(path):
+            if Path(path).suffix.lower() not in self.supported_extensions:
+                return {"error": f"Unsupported file type: {Path(path).suffix}"}
+            files = [os.path.abspath(path)]
+            root = os.path.dirname(files[0])
+        else:
+            return {"error": f"Path not found: {path}"}
+        
+        started = time.monotonic()
+        try:
+            # 规则文件修改后换用新的缓存，不再返回按旧规则得到的结果
+            version = rules_file_version(rules_file)
+            cached = self.security_caches.get(rules_file)
+            if cached is None or cached[0] != version:
+                cached = self.security_caches[rules_file] = (version, AnalysisCache(max_entries=200000))
+            results, stats = scan_files(files, cached[1], rules_file, max_workers)
+        except (OSError, ValueError) as e:
+            return {"error": f"Invalid rules file: {e}"}
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        
+        threshold = SEVERITY_LEVELS[min_severity]
+        findings = []
+        by_severity = {level: 0 for level in SEVERITY_LEVELS}
+        by_rule: Dict[str, int] = {}
+        for file_path in files:
+            result = results.get(file_path, {})
+            # 统计来自按规则的计数（每个文件每条规则只缓存有限条明细）
+            for rule, entry in result.get("counts", {}).items():
+                if SEVERITY_LEVELS[entry["severity"]] >= threshold:
+                    by_severity[entry["severity"]] += entry["count"]
+                    by_rule[rule] = by_rule.get(rule, 0) + entry["count"]
+            for finding in result.get("findings", ()):
+                if SEVERITY_LEVELS[finding["severity"]] >= threshold:
+                    findings.append(dict(finding, file=os.path.relpath(file_path, root)))
+        findings.sort(key=lambda item: (-SEVERITY_LEVELS[item["severity"]], item["file"], item["line"]))
+        findings_count = sum(by_rule.values())
+        return {
+            "path": root if os.path.isdir(path) else files[0],
+            "files_scanned": len(files),
+            "findings_count": findings_count,
+            "by_severity": by_severity,
+            "by_rule": dict(sorted(by_rule.items(), key=lambda item: (-item[1], item[0]))),
+            "findings": findings[:limit],
+            "findings_omitted": findings_count - min(len(findings), limit),
+            "scan": stats
+        }
+    
+    def index_symbols(self, project_path: str, reuse: bool = False,
+                      max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """同步项目的符号索引（只重新解析变化的文件）
+        
+        Args:
+            project_path: 项目根目录路径（需已确认存在）
+            reuse: 本进程中已同步过时跳过扫描（监听中的工作区由监听器增量维护）
+            max_workers: 解析符号的进程数，为1时在当前进程中解析
+        """
+        project_path = os.path.abspath(project_path)
+        if reuse and project_path in self.symbol_projects:
+            return {"reused": True}
+        stats = self.symbol_index.update_project(project_path, list(self.iter_code_files(project_path)),
+                                                 max_workers)
+        self.symbol_projects.add(project_path)
+        return stats
+    
+    def refresh_symbols(self, project_path: str, file_path: str):
+        """文件变化后更新已同步项目的符号索引（文件已删除时从索引中移除）"""
+        project_path = os.path.abspath(project_path)
+        if project_path in self.symbol_projects:
+            self.symbol_index.update_files(project_path, [file_path])
+    
+    def find_symbol(self, query: str, project_path: str, kind: str = "", exact: bool = False,
+                    limit: int = 50, reuse: bool = False) -> Dict[str, Any]:
+        """在项目符号索引中查找定义"""
+        if not os.path.isdir(project_path):
+            return {"error": f"Project path not found: {project_path}"}
+        stats = self.index_symbols(project_path, reuse=reuse)
+        result = self.symbol_index.find_symbol(query, os.path.abspath(project_path), kind, exact, limit)
+        result["index"] = stats
+        return result
+    
+    def find_references(self, name: str, project_path: str, prefix: bool = False,
+                        limit: int = 100, reuse: bool = False) -> Dict[str, Any]:
+        """在项目符号索引中查找名称的引用和导入"""
+        if not os.path.isdir(project_path):
+            return {"error": f"Project path not found: {project_path}"}
+        stats = self.index_symbols(project_path, reuse=reuse)
+        result = self.symbol_index.find_references(name, os.path.abspath(project_path), prefix, limit)
+        result["index"] = stats
+        return result
+    
     def _get_language_from_extension(self, ext: str) -> str:
         """根据文件扩展名获取编程语言"""
         mapping = {
@@ -397,4 +1033,15 @@ class CodeAnalyzer:
             '.jsx': 'React JSX',
             '.tsx': 'React TSX'
         }
-        return mapping.get(ext, 'Unknown')
\ No newline at end of file
+        return mapping.get(ext, 'Unknown')
+
+# 工作进程中复用的分析器（每个工作进程一个）
+_worker_analyzer: Optional[SourceAnalyzer] = None
+
+
+def analyze_source_in_worker(content: str, file_path: str, file_ext: str) -> Dict[str, Any]:
+    """隔离模式下工作进程执行的分析入口"""
+    global _worker_analyzer
+    if _worker_analyzer is None:
+        _worker_analyzer = SourceAnalyzer()
+    return _worker_analyzer.analyze_source(content, file_path, file_ext)
@@ -0,0 +1,353 @@
+"""
+依赖关系分析模块
+
+逐文件提取import语句（按内容哈希缓存，未命中的文件较多时用多进程并行解析），
+解析为项目内的模块文件后建立正向/反向依赖图，用于查询直接依赖、被依赖、
+循环依赖（Tarjan强连通分量）以及修改某个文件的传递影响范围，各项查询与图的规模呈线性关系。
+"""
+
+import ast
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from pathlib import Path
+from typing import Dict, Any, Iterable, List, Optional, Set, Tuple
+
+from src.tools.analysis_cache import AnalysisCache, content_hash
+from src.tools.parallel import load_file_results
+
+JS_EXTENSIONS = ('.ts', '.tsx', '.js', '.jsx')
+
+# 标准库模块不计入外部依赖（Python 3.10+ 提供该列表）
+STDLIB_MODULES = frozenset(getattr(sys, "stdlib_module_names", ()))
+
+# import x from 'a' / import 'a' / export ... from 'a' / require('a') / import('a')
+_JS_IMPORT_PATTERN = re.compile(
+    r"""(?:\bimport\s+(?:[\w*{}\s,$]+?\s+from\s+)?"""
+    r"""|\bexport\s+(?:type\s+)?(?:\*(?:\s+as\s+[\w$]+)?|\{[^}]*\})\s*from\s+"""
+    r"""|\brequire\s*\(\s*|\bimport\s*\(\s*)(['"])([^'"\n]+)\1"""
+)
+
+# 每条import记录为 (模块或路径, 相对导入层级, 导入的名称)
+ImportRecord = Tuple[str, int, Tuple[str, ...]]
+
+
+def extract_imports(content: str, file_ext: str) -> List[ImportRecord]:
+    """提取源代码中的import语句
+
+    Raises:
+        SyntaxError: Python源代码无法解析
+    """
+    if file_ext == '.py':
+        records = []
+        for node in ast.walk(ast.parse(content)):
+            if isinstance(node, ast.Import):
+                records.extend((alias.name, 0, ()) for alias in node.names)
+            elif isinstance(node, ast.ImportFrom):
+                records.append((node.module or "", node.level, tuple(alias.name for alias in node.names)))
+        return records
+    return [(match.group(2), 0, ()) for match in _JS_IMPORT_PATTERN.finditer(content)]
+
+
+def _extract_file(file_path: str):
+    """读取并提取单个文件的import（在工作进程中执行），返回 (路径, stat, 内容哈希, 结果)"""
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return file_path, None, None, {"error": str(e)}
+    digest = content_hash(data)
+    try:
+        imports = extract_imports(data.decode('utf-8'), Path(file_path).suffix.lower())
+    except (SyntaxError, ValueError) as e:
+        # 无法解析的文件仍计入依赖图（没有出边），结果同样缓存
+        return file_path, stat, digest, {"imports": [], "error": f"{type(e).__name__}: {e}"}
+    return file_path, stat, digest, {"imports": [list(record) for record in imports]}
+
+
+def load_imports(file_paths: List[str], cache: AnalysisCache,
+                 max_workers: Optional[int] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """批量获取文件的import记录，返回 ({路径: 结果}, 统计)
+
+    路径快照未变化的文件直接命中缓存，其余文件在数量较多时交给进程池并行读取和解析。
+    """
+    return load_file_results(file_paths, cache, _extract_file, max_workers)
+
+
+def _python_module_names(rel_path: str) -> List[str]:
+    parts = rel_path[:-3].split('/')
+    if parts[-1] == '__init__':
+        parts = parts[:-1]
+    return ['.'.join(parts)] if parts else []
+
+
+def strongly_connected_components(nodes: Iterable[str], edges: Dict[str, Set[str]]) -> List[List[str]]:
+    """Tarjan强连通分量（迭代实现，大型项目不会触发递归深度限制）"""
+    index: Dict[str, int] = {}
+    low: Dict[str, int] = {}
+    stack: List[str] = []
+    on_stack: Set[str] = set()
+    components = []
+    for start in nodes:
+        if start in index:
+            continue
+        index[start] = low[start] = len(index)
+        stack.append(start)
+        on_stack.add(start)
+        work = [(start, iter(edges.get(start, ())))]
+        while work:
+            node, children = work[-1]
+            for child in children:
+                if child not in index:
+                    index[child] = low[child] = len(index)
+                    stack.append(child)
+                    on_stack.add(child)
+                    work.append((child, iter(edges.get(child, ()))))
+                    break
+                if child in on_stack:
+                    low[node] = min(low[node], index[child])
+            else:
+                work.pop()
+                if work:
+                    parent = work[-1][0]
+                    low[parent] = min(low[parent], low[node])
+                if low[node] == index[node]:
+                    component = []
+                    while True:
+                        member = stack.pop()
+                        on_stack.discard(member)
+                        component.append(member)
+                        if member == node:
+                            break
+                    components.append(component)
+    return components
+
+
+class DependencyGraph:
+    """项目内文件级依赖图
+
+    节点为相对项目根目录的路径（以 / 分隔）。单个文件内容变化时只重新解析它的出边；
+    文件增删会改变模块解析结果，此时标记为过期，下次查询时重建（未变化的文件命中缓存）。
+    """
+
+    def __init__(self, project_path: str, file_paths: List[str], imports: Dict[str, Dict[str, Any]]):
+        self.project_path = project_path
+        self.files: Set[str] = set()
+        self.modules: Dict[str, str] = {}
+        self.edges: Dict[str, Set[str]] = {}
+        self.reverse: Dict[str, Set[str]] = {}
+        self.external: Dict[str, Set[str]] = {}
+        self.errors: Dict[str, str] = {}
+        self.stale = False
+        self.build_stats: Dict[str, Any] = {}
+        self._lock = threading.RLock()
+        self._prefix = os.path.join(project_path, '')
+
+        for file_path in file_paths:
+            self.files.add(self.relpath(file_path))
+        self._index_modules()
+        for file_path in file_paths:
+            result = imports.get(file_path)
+            if result is not None:
+                self.set_imports(file_path, result)
+        self.updated_at = time.time()
+
+    def relpath(self, file_path: str) -> str:
+        """转换为相对项目根目录的路径"""
+        # 遍历得到的路径都以项目根目录开头，直接截取，避免大型项目中大量调用 os.path.relpath
+        if file_path.startswith(self._prefix):
+            rel_path = file_path[len(self._prefix):]
+        else:
+            rel_path = os.path.relpath(os.path.abspath(file_path), self.project_path)
+        return rel_path.replace(os.sep, '/') if os.sep != '/' else rel_path
+
+    def _index_modules(self):
+        # 模块名按项目根目录计算；src布局（src下不是包）时同时按src计算，项目根目录本身是包时加上包名前缀
+        prefixes = [""]
+        for source_root in ("src", "lib"):
+            if not os.path.exists(os.path.join(self.project_path, source_root, "__init__.py")):
+                prefixes.append(source_root + "/")
+        root_package = ""
+        if os.path.exists(os.path.join(self.project_path, "__init__.py")):
+            root_package = os.path.basename(self.project_path.rstrip(os.sep)) + "."
+        for rel_path in sorted(self.files):
+            if not rel_path.endswith('.py'):
+                continue
+            for prefix in prefixes:
+                if prefix and not rel_path.startswith(prefix):
+                    continue
+                for name in _python_module_names(rel_path[len(prefix):]):
+                    self.modules.setdefault(name, rel_path)
+                    if root_package and not prefix:
+                        self.modules.setdefault(root_package + name, rel_path)
+
+    def set_imports(self, file_path: str, result: Dict[str, Any]):
+        """用文件的import记录更新其出边"""
+        rel_path = self.relpath(file_path)
+        targets: Set[str] = set()
+        external: Set[str] = set()
+        for module, level, names in result.get("imports", []):
+            if rel_path.endswith('.py'):
+                resolved, package = self._resolve_python(rel_path, module, level, names)
+            else:
+                resolved, package = self._resolve_js(rel_path, module)
+            targets.update(resolved)
+            if package:
+                external.add(package)
+        targets.discard(rel_path)
+
+        with self._lock:
+            for target in self.edges.get(rel_path, ()):
+                dependents = self.reverse.get(target)
+                if dependents is not None:
+                    dependents.discard(rel_path)
+                    if not dependents:
+                        del self.reverse[target]
+            self.edges[rel_path] = targets
+            for target in targets:
+                self.reverse.setdefault(target, set()).add(rel_path)
+            self.external[rel_path] = external
+            if "error" in result:
+                self.errors[rel_path] = result["error"]
+            else:
+                self.errors.pop(rel_path, None)
+            self.updated_at = time.time()
+
+    def _resolve_python(self, rel_path: str, module: str, level: int,
+                        names: Iterable[str]) -> Tuple[Set[str], Optional[str]]:
+        if level:
+            package = _python_module_names(rel_path)
+            parts = package[0].split('.') if package and package[0] else []
+            if not rel_path.endswith('__init__.py'):
+                parts = parts[:-1]
+            if level - 1 > len(parts):
+                return set(), None
+            base = parts[:len(parts) - (level - 1)] + (module.split('.') if module else [])
+        else:
+            base = module.split('.')
+
+        resolved = set()
+        for name in names:
+            submodule = self.modules.get('.'.join(base + [name]))
+            if submodule:
+                resolved.add(submodule)
+        # 导入模块时会依次执行各级父包的 __init__.py
+        for depth in range(1, len(base) + 1):
+            target = self.modules.get('.'.join(base[:depth]))
+            if target:
+                resolved.add(target)
+        if not resolved and not level and base and base[0] and base[0] not in STDLIB_MODULES:
+            return resolved, base[0]
+        return resolved, None
+
+    def _resolve_js(self, rel_path: str, specifier: str) -> Tuple[Set[str], Optional[str]]:
+        if not specifier.startswith('.'):
+            parts = specifier.split('/')
+            package = '/'.join(parts[:2]) if specifier.startswith('@') else parts[0]
+            return set(), package or None
+        target = os.path.normpath(os.path.join(os.path.dirname(rel_path), specifier)).replace(os.sep, '/')
+        stem = target
+        # TypeScript的ESM写法中 './a.js' 指向 a.ts
+        if target.endswith(('.js', '.jsx')):
+            stem = target.rsplit('.', 1)[0]
+        candidates = [target] + [stem + ext for ext in JS_EXTENSIONS] + [target + '/index' + ext for ext in JS_EXTENSIONS]
+        for candidate in candidates:
+            if candidate in self.files:
+                return {candidate}, None
+        return set(), None
+
+    def remove_file(self, file_path: str):
+        """移除文件，模块解析结果随之变化，标记为过期"""
+        with self._lock:
+            rel_path = self.relpath(file_path)
+            if rel_path in self.files:
+                self.stale = True
+
+    # 查询
+
+    def dependencies(self, file_path: str) -> List[str]:
+        """文件直接依赖的项目内文件"""
+        with self._lock:
+            return sorted(self.edges.get(self.relpath(file_path), ()))
+
+    def dependents(self, file_path: str) -> List[str]:
+        """直接依赖该文件的项目内文件"""
+        with self._lock:
+            return sorted(self.reverse.get(self.relpath(file_path), ()))
+
+    def impact(self, file_path: str, max_depth: int = 0) -> Dict[str, int]:
+        """修改文件后受影响的全部文件（沿反向边广度优先遍历），返回 {文件: 距离}"""
+        start = self.relpath(file_path)
+        with self._lock:
+            distances = {start: 0}
+            queue = deque([start])
+            while queue:
+                node = queue.popleft()
+                depth = distances[node]
+                if max_depth and depth >= max_depth:
+                    continue
+                for dependent in self.reverse.get(node, ()):
+                    if dependent not in distances:
+                        distances[dependent] = depth + 1
+                        queue.append(dependent)
+        del distances[start]
+        return distances
+
+    def cycles(self) -> List[List[str]]:
+        """循环依赖：成员多于一个的强连通分量，以及直接导入自身的文件"""
+        with self._lock:
+            components = strongly_connected_components(sorted(self.files), self.edges)
+            cycles = [sorted(component) for component in components
+                      if len(component) > 1 or component[0] in self.edges.get(component[0], ())]
+        return sorted(cycles, key=lambda cycle: (-len(cycle), cycle))
+
+    def summary(self, limit: int = 20) -> Dict[str, Any]:
+        """项目依赖概况"""
+        cycles = self.cycles()
+        with self._lock:
+            packages: Dict[str, int] = {}
+            for names in self.external.values():
+                for name in names:
+                    packages[name] = packages.get(name, 0) + 1
+            most_depended = sorted(self.reverse.items(), key=lambda item: (-len(item[1]), item[0]))[:limit]
+            return {
+                "project_path": self.project_path,
+                "files": len(self.files),
+                "internal_edges": sum(len(targets) for targets in self.edges.values()),
+                "external_packages": dict(sorted(packages.items(), key=lambda item: (-item[1], item[0]))[:limit]),
+                "external_packages_count": len(packages),
+                "cycles_count": len(cycles),
+                "cycles": cycles[:limit],
+                "most_depended_on": [{"file": path, "dependents": len(dependents)} for path, dependents in most_depended],
+                "parse_errors": [{"file": path, "error": error} for path, error in sorted(self.errors.items())[:limit]],
+                "build": self.build_stats,
+                "updated_at": self.updated_at
+            }
+
+    def file_report(self, file_path: str, limit: int = 100, max_depth: int = 0) -> Dict[str, Any]:
+        """单个文件的依赖、被依赖和传递影响范围"""
+        rel_path = self.relpath(file_path)
+        with self._lock:
+            if rel_path not in self.files:
+                return {"error": f"File is not part of the dependency graph: {file_path}"}
+            external = sorted(self.external.get(rel_path, ()))
+        impact = self.impact(file_path, max_depth)
+        in_cycle = next((cycle for cycle in self.cycles() if rel_path in cycle), [])
+        return {
+            "project_path": self.project_path,
+            "file": rel_path,
+            "imports": self.dependencies(file_path),
+            "external_imports": external,
+            "imported_by": self.dependents(file_path),
+            "impact": {
+                "count": len(impact),
+                "max_depth": max(impact.values(), default=0),
+                "files": [{"file": path, "depth": depth}
+                          for path, depth in sorted(impact.items(), key=lambda item: (item[1], item[0]))[:limit]]
+            },
+            "in_cycle": in_cycle
+        }
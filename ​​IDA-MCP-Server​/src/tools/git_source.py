@@ -0,0 +1,137 @@
+"""
+Git源代码读取模块
+
+直接从git对象库读取任意版本的文件，无需检出：文件列表来自 git ls-tree，
+文件内容通过常驻的 git cat-file --batch 进程读取（一个进程服务全部请求）。
+blob的SHA-1与分析缓存的内容哈希一致，已分析过的内容（任意分支、任意版本）无需再读取。
+"""
+
+import os
+import subprocess
+import threading
+from typing import Callable, List, Optional, Tuple
+
+
+class GitError(Exception):
+    """git命令执行失败"""
+
+
+class GitRepository:
+    """git仓库的只读访问"""
+
+    def __init__(self, path: str):
+        # 文件或目录可能只存在于历史版本中，从最近的现存上级目录定位仓库
+        start = os.path.abspath(path)
+        while not os.path.isdir(start) and os.path.dirname(start) != start:
+            start = os.path.dirname(start)
+        self.root = os.path.realpath(self._git(["rev-parse", "--show-toplevel"], cwd=start).strip())
+        self._batch: Optional[subprocess.Popen] = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _git(args: List[str], cwd: str) -> str:
+        try:
+            completed = subprocess.run(["git", *args], cwd=cwd, capture_output=True, text=True, check=False)
+        except OSError as e:
+            raise GitError(f"Cannot run git: {e}") from e
+        if completed.returncode != 0:
+            raise GitError(completed.stderr.strip() or f"git {args[0]} failed")
+        return completed.stdout
+
+    def run(self, *args: str) -> str:
+        """在仓库根目录执行git命令，返回标准输出"""
+        return self._git(list(args), cwd=self.root)
+
+    def relpath(self, path: str) -> str:
+        """工作区路径转换为仓库内路径（以 / 分隔）"""
+        rel_path = os.path.relpath(os.path.realpath(path), self.root)
+        return "" if rel_path == "." else rel_path.replace(os.sep, "/")
+
+    def resolve(self, revision: str) -> str:
+        """解析为提交SHA
+
+        Raises:
+            GitError: 版本不存在
+        """
+        try:
+            return self.run("rev-parse", "--verify", "--quiet", f"{revision}^{{commit}}").strip()
+        except GitError:
+            raise GitError(f"Unknown revision: {revision}") from None
+
+    def list_files(self, revision: str, subdir: str = "",
+                   accept: Optional[Callable[[str], bool]] = None) -> List[Tuple[str, str]]:
+        """列出某个版本中的文件，返回 [(仓库内路径, blob SHA)]
+
+        Args:
+            revision: 提交、分支或标签
+            subdir: 只列出该目录（仓库内路径）下的文件
+            accept: 路径过滤函数
+        """
+        args = ["ls-tree", "-r", "-z", "--full-tree", revision]
+        if subdir:
+            args += ["--", subdir]
+        files = []
+        for entry in self.run(*args).split("\0"):
+            if not entry:
+                continue
+            meta, path = entry.split("\t", 1)
+            _, object_type, sha = meta.split()
+            if object_type == "blob" and (accept is None or accept(path)):
+                files.append((path, sha))
+        return files
+
+    def blob_sha(self, revision: str, path: str) -> str:
+        """某个版本中文件的blob SHA
+
+        Raises:
+            GitError: 该版本中不存在此文件
+        """
+        try:
+            return self.run("rev-parse", "--verify", "--quiet", f"{revision}:{path}").strip()
+        except GitError:
+            raise GitError(f"File {path} does not exist in {revision}") from None
+
+    def read_blob(self, sha: str) -> bytes:
+        """通过常驻的 cat-file 进程读取blob内容"""
+        with self._lock:
+            process = self._batch_process()
+            try:
+                process.stdin.write(sha.encode("ascii") + b"\n")
+                process.stdin.flush()
+                header = process.stdout.readline().decode("ascii", "replace").split()
+                if len(header) != 3:
+                    raise GitError(f"Object not found: {sha}")
+                size = int(header[2])
+                data = process.stdout.read(size)
+                process.stdout.read(1)
+            except (OSError, ValueError) as e:
+                # 进程异常退出时丢弃，下次读取重新启动
+                self._close_batch()
+                raise GitError(f"git cat-file failed: {e}") from e
+        if header[1] != "blob":
+            raise GitError(f"Object {sha} is a {header[1]}, not a blob")
+        return data
+
+    def _batch_process(self) -> subprocess.Popen:
+        if self._batch is None or self._batch.poll() is not None:
+            try:
+                self._batch = subprocess.Popen(["git", "cat-file", "--batch"], cwd=self.root,
+                                               stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                               stderr=subprocess.DEVNULL)
+            except OSError as e:
+                raise GitError(f"Cannot run git: {e}") from e
+        return self._batch
+
+    def _close_batch(self):
+        if self._batch is not None:
+            try:
+                self._batch.stdin.close()
+                self._batch.wait(timeout=5)
+            except (OSError, subprocess.TimeoutExpired):
+                self._batch.kill()
+            self._batch = None
+
+    def close(self):
+        """结束常驻的 cat-file 进程"""
+        with self._lock:
+            self._close_batch()
@@ -0,0 +1,131 @@
+"""
+问题记录模块
+
+分析发现的问题按规则计数，每条规则只保留前若干条明细（使用 __slots__ 的紧凑记录），
+压缩或生成的文件即使有成千上万处同类问题（超长行、console.log等），
+内存占用和返回的JSON大小也只与规则数量有关，与文件大小无关；计数始终完整。
+"""
+
+import math
+import os
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+SEVERITY_LEVELS = {"info": 0, "warning": 1, "error": 2}
+
+# 每条规则保留的问题明细数量上限，可通过环境变量配置
+DEFAULT_DETAIL_CAP = int(os.environ.get("IDA_ISSUE_DETAIL_CAP", "20"))
+
+# 质量评分中各严重程度的扣分
+SEVERITY_WEIGHTS = {"info": 1, "warning": 3, "error": 8}
+
+# 分析器自身检查使用的规则ID
+LONG_LINE_RULE = "LINT001"
+COMPLEX_FUNCTION_RULE = "LINT002"
+TOO_MANY_IMPORTS_RULE = "LINT003"
+
+
+class Issue:
+    """单条问题明细"""
+
+    __slots__ = ("line", "rule", "type", "severity", "message")
+
+    def __init__(self, rule: str, type: str, severity: str, line: int, message: str):
+        self.rule = rule
+        self.type = type
+        self.severity = severity
+        self.line = line
+        self.message = message
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"type": self.type, "severity": self.severity, "line": self.line,
+                "message": self.message, "rule": self.rule}
+
+
+class _RuleIssues:
+    __slots__ = ("type", "severity", "count", "details")
+
+    def __init__(self, type: str, severity: str):
+        self.type = type
+        self.severity = severity
+        self.count = 0
+        self.details: List[Issue] = []
+
+
+class IssueReport:
+    """按规则汇总问题：计数完整，明细每条规则最多保留 detail_cap 条"""
+
+    def __init__(self, detail_cap: int = DEFAULT_DETAIL_CAP):
+        self.detail_cap = max(0, detail_cap)
+        self._rules: Dict[str, _RuleIssues] = {}
+
+    def add(self, rule: str, type: str, severity: str, line: int, message: str):
+        entry = self._rules.get(rule)
+        if entry is None:
+            entry = self._rules[rule] = _RuleIssues(type, severity)
+        entry.count += 1
+        if len(entry.details) < self.detail_cap:
+            entry.details.append(Issue(rule, type, severity, line, message))
+
+    def extend(self, findings: Iterable[Tuple[int, str, str, str, str]]):
+        """添加规则引擎返回的 (行号, 规则ID, 类别, 严重程度, 说明)"""
+        for line, rule, type, severity, message in findings:
+            self.add(rule, type, severity, line, message)
+
+    @property
+    def total(self) -> int:
+        return sum(entry.count for entry in self._rules.values())
+
+    def quality_score(self) -> int:
+        """质量评分：按严重程度扣分，同一规则的重复问题按对数递减，避免一个规则把评分直接扣到0"""
+        penalty = sum(SEVERITY_WEIGHTS.get(entry.severity, 3) * (1 + math.log2(entry.count))
+                      for entry in self._rules.values())
+        return max(0, round(100 - penalty))
+
+    def to_dict(self) -> Dict[str, Any]:
+        """分析结果中的问题字段：明细（按行排列）、按规则的计数、总数和未返回明细的数量"""
+        issues = sorted((issue for entry in self._rules.values() for issue in entry.details),
+                        key=lambda issue: (issue.line, issue.rule))
+        total = self.total
+        return {
+            "issues": [issue.to_dict() for issue in issues],
+            "issue_counts": {
+                rule: {"type": entry.type, "severity": entry.severity, "count": entry.count}
+                for rule, entry in sorted(self._rules.items(), key=lambda item: (-item[1].count, item[0]))
+            },
+            "total_issues": total,
+            "issues_omitted": total - len(issues)
+        }
+
+
+def issue_total(result: Dict[str, Any]) -> int:
+    """分析结果中的问题总数（包括未保留明细的问题）"""
+    if "total_issues" in result:
+        return result["total_issues"]
+    return len(result.get("issues") or ())
+
+
+def page_issues(result: Dict[str, Any], offset: int = 0, limit: Optional[int] = None,
+                rule: str = "", min_severity: str = "info") -> Dict[str, Any]:
+    """按规则和严重程度筛选分析结果中的问题明细并分页，返回不修改原结果的副本
+
+    只能翻阅保留了明细的问题（每条规则最多 detail_cap 条）；分页信息中 matched 为可翻阅的明细数，
+    matched_total 为符合条件的问题总数（按规则计数），omitted 为其中没有保留明细、无法翻阅到的数量
+    """
+    threshold = SEVERITY_LEVELS.get(min_severity, 0)
+    issues = [issue for issue in result.get("issues", ())
+              if (not rule or issue.get("rule") == rule)
+              and SEVERITY_LEVELS.get(issue["severity"], 0) >= threshold]
+    counts = result.get("issue_counts")
+    if counts is None:
+        matched_total = len(issues)
+    else:
+        matched_total = sum(entry["count"] for name, entry in counts.items()
+                            if (not rule or name == rule) and SEVERITY_LEVELS.get(entry["severity"], 0) >= threshold)
+    offset = max(0, offset)
+    end = len(issues) if limit is None else offset + max(0, limit)
+    paged = dict(result)
+    paged["issues"] = issues[offset:end]
+    paged["issues_page"] = {"offset": offset, "returned": len(paged["issues"]), "matched": len(issues),
+                            "has_more": end < len(issues), "matched_total": matched_total,
+                            "omitted": matched_total - len(issues)}
+    return paged
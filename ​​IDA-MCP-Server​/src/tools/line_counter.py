@@ -0,0 +1,192 @@
+"""
+代码行统计模块
+
+按语言统计总行数、空行、注释行和代码行（与cloc的口径相近），直接扫描字节内容，不做语法分析：
+每个文件一次读入，总行数和空行由 bytes.count 与正则在C层完成；不含注释标记的文件不再逐行处理，
+其余文件中也只有包含标记的行才进入状态机（处理跨行的块注释和Python文档字符串）。
+"""
+
+import os
+import re
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.tools.analysis_cache import AnalysisCache, content_hash
+from src.tools.parallel import load_file_results
+
+_C_STYLE = ((b"//",), ((b"/*", b"*/", True),))
+_HASH_STYLE = ((b"#",), ())
+
+# 扩展名 -> (语言, 行注释标记, 块注释 (开始, 结束, 出现在行中间时是否仍为注释))
+# Python的三引号出现在行首时视为文档字符串（注释），出现在代码之后时为多行字符串（代码）
+LANGUAGES: Dict[str, Tuple[str, Tuple[bytes, ...], Tuple[Tuple[bytes, bytes, bool], ...]]] = {
+    ".py": ("Python", (b"#",), ((b'"""', b'"""', False), (b"'''", b"'''", False))),
+    ".js": ("JavaScript", *_C_STYLE),
+    ".jsx": ("React JSX", *_C_STYLE),
+    ".ts": ("TypeScript", *_C_STYLE),
+    ".tsx": ("React TSX", *_C_STYLE),
+    ".c": ("C", *_C_STYLE),
+    ".h": ("C/C++ Header", *_C_STYLE),
+    ".cpp": ("C++", *_C_STYLE),
+    ".cc": ("C++", *_C_STYLE),
+    ".hpp": ("C/C++ Header", *_C_STYLE),
+    ".java": ("Java", *_C_STYLE),
+    ".go": ("Go", *_C_STYLE),
+    ".rs": ("Rust", *_C_STYLE),
+    ".cs": ("C#", *_C_STYLE),
+    ".kt": ("Kotlin", *_C_STYLE),
+    ".swift": ("Swift", *_C_STYLE),
+    ".css": ("CSS", (), ((b"/*", b"*/", True),)),
+    ".scss": ("SCSS", *_C_STYLE),
+    ".sh": ("Shell", *_HASH_STYLE),
+    ".rb": ("Ruby", *_HASH_STYLE),
+    ".pl": ("Perl", *_HASH_STYLE),
+    ".yaml": ("YAML", *_HASH_STYLE),
+    ".yml": ("YAML", *_HASH_STYLE),
+    ".toml": ("TOML", *_HASH_STYLE),
+    ".sql": ("SQL", (b"--",), ((b"/*", b"*/", True),)),
+    ".html": ("HTML", (), ((b"<!--", b"-->", True),)),
+    ".xml": ("XML", (), ((b"<!--", b"-->", True),)),
+    ".vue": ("Vue", (b"//",), ((b"<!--", b"-->", True), (b"/*", b"*/", True))),
+    ".md": ("Markdown", (), ()),
+    ".json": ("JSON", (), ()),
+}
+
+# 只含空白的行（多行模式下逐行匹配）
+_BLANK_LINE = re.compile(rb"^[ \t\r\f\v]*$", re.MULTILINE)
+_WHITESPACE = b" \t\r\f\v"
+
+# 每种语言的注释标记合并为一个正则，逐行查找最靠前的标记
+_MARKER_PATTERNS: Dict[str, "re.Pattern[bytes]"] = {}
+
+
+def _marker_pattern(ext: str) -> Optional["re.Pattern[bytes]"]:
+    pattern = _MARKER_PATTERNS.get(ext)
+    if pattern is None:
+        _, line_markers, blocks = LANGUAGES[ext]
+        markers = list(line_markers) + [block[0] for block in blocks]
+        if not markers:
+            return None
+        # 较长的标记在前，避免 / 抢先匹配 //
+        markers.sort(key=len, reverse=True)
+        pattern = _MARKER_PATTERNS[ext] = re.compile(b"|".join(re.escape(marker) for marker in markers))
+    return pattern
+
+
+def _classify_line(line: bytes, state, pattern, line_markers, blocks) -> Tuple[bool, bool, Any]:
+    """扫描一行，返回 (含代码, 含注释, 行尾状态)；状态为 (块结束标记, 是否为注释) 或 None"""
+    code = comment = False
+    pos = 0
+    length = len(line)
+    while True:
+        if state is not None:
+            close, is_comment = state
+            end = line.find(close, pos)
+            if end >= 0 or line[pos:].strip():
+                if is_comment:
+                    comment = True
+                else:
+                    code = True
+            if end < 0:
+                return code, comment, state
+            pos = end + len(close)
+            state = None
+        while pos < length and line[pos] in _WHITESPACE:
+            pos += 1
+        if pos >= length:
+            return code, comment, None
+        match = pattern.search(line, pos)
+        if match is None:
+            return True, comment, None
+        if match.start() > pos:
+            code = True
+        marker = match.group()
+        if marker in line_markers:
+            return code, True, None
+        for open_marker, close, comment_mid_line in blocks:
+            if marker == open_marker:
+                state = (close, comment_mid_line or not code)
+                break
+        pos = match.end()
+
+
+def count_lines(data: bytes, ext: str) -> Optional[Dict[str, Any]]:
+    """统计一段内容的行数，不支持的扩展名返回None"""
+    spec = LANGUAGES.get(ext)
+    if spec is None:
+        return None
+    language, line_markers, blocks = spec
+    total = data.count(b"\n")
+    if data and not data.endswith(b"\n"):
+        total += 1
+    blank = len(_BLANK_LINE.findall(data))
+    # 以换行结尾时，最后一个换行之后的空位置也会匹配
+    if not data or data.endswith(b"\n"):
+        blank -= 1
+    blank = max(blank, 0)
+
+    pattern = _marker_pattern(ext)
+    comment = 0
+    if pattern is not None and pattern.search(data):
+        # 只有包含注释标记的文件才逐行扫描
+        blank = comment = code = 0
+        state = None
+        lines = data.split(b"\n")
+        if data.endswith(b"\n"):
+            lines.pop()
+        for line in lines:
+            if state is None and pattern.search(line) is None:
+                if line.strip():
+                    code += 1
+                else:
+                    blank += 1
+                continue
+            has_code, has_comment, state = _classify_line(line, state, pattern, line_markers, blocks)
+            if has_code:
+                code += 1
+            elif has_comment:
+                comment += 1
+            else:
+                blank += 1
+    else:
+        code = total - blank
+    return {"language": language, "total": total, "blank": blank, "comment": comment, "code": code}
+
+
+def _count_file(file_path: str):
+    """读取并统计单个文件（在工作进程中执行），返回 (路径, stat, 内容哈希, 结果)"""
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return file_path, None, None, {"error": str(e)}
+    result = count_lines(data, os.path.splitext(file_path)[1].lower())
+    if result is None:
+        result = {"error": f"Unsupported file type: {file_path}"}
+    return file_path, stat, content_hash(data), result
+
+
+def load_line_counts(file_paths: List[str], cache: AnalysisCache,
+                     max_workers: Optional[int] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """批量统计文件行数（按内容哈希缓存，未命中的文件较多时并行统计），返回 ({路径: 结果}, 统计)"""
+    return load_file_results(file_paths, cache, _count_file, max_workers)
+
+
+def summarize(counts: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    """汇总为总计和按语言的统计（语言按代码行数降序）"""
+    totals = {"files": 0, "total": 0, "blank": 0, "comment": 0, "code": 0}
+    languages: Dict[str, Dict[str, int]] = {}
+    for result in counts.values():
+        if "error" in result:
+            continue
+        entry = languages.setdefault(result["language"], {"files": 0, "blank": 0, "comment": 0, "code": 0})
+        entry["files"] += 1
+        totals["files"] += 1
+        totals["total"] += result["total"]
+        for field in ("blank", "comment", "code"):
+            entry[field] += result[field]
+            totals[field] += result[field]
+    return {
+        "totals": totals,
+        "by_language": dict(sorted(languages.items(), key=lambda item: (-item[1]["code"], item[0])))
+    }
@@ -0,0 +1,64 @@
+"""
+并行执行模块
+
+AST解析等CPU密集的逐文件处理交给进程池执行（线程受GIL限制无法并行）。
+"""
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, TypeVar
+
+from src.tools.analysis_cache import AnalysisCache
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+# 待处理项达到该数量时才启用进程池（进程启动本身有开销）
+PARALLEL_THRESHOLD = 200
+
+
+def parallel_map(func: Callable[[T], R], items: Sequence[T], max_workers: Optional[int] = None,
+                 threshold: int = PARALLEL_THRESHOLD, chunksize: int = 32) -> List[R]:
+    """按输入顺序返回 func(item) 的结果
+
+    func 必须是模块级函数（可被子进程导入）。数量较少、max_workers 为1
+    或无法创建子进程（如受限环境）时在当前进程中执行。
+    """
+    if len(items) >= threshold and max_workers != 1:
+        try:
+            with ProcessPoolExecutor(max_workers=max_workers) as pool:
+                return list(pool.map(func, items, chunksize=chunksize))
+        except (OSError, BrokenProcessPool):
+            pass
+    return [func(item) for item in items]
+
+
+def load_file_results(file_paths: Sequence[str], cache: AnalysisCache,
+                      extract: Callable[[str], Tuple[str, Any, Optional[str], Dict[str, Any]]],
+                      max_workers: Optional[int] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """批量获取逐文件的处理结果，返回 ({路径: 结果}, 统计)
+
+    路径快照未变化的文件直接命中缓存，其余文件在数量较多时交给进程池并行处理。
+    extract 为模块级函数，返回 (路径, stat, 内容哈希, 结果)，无法读取时 stat 为 None；
+    结果中带 "error" 的文件计入失败数，但结果同样缓存。
+    """
+    results: Dict[str, Dict[str, Any]] = {}
+    misses = []
+    for file_path in file_paths:
+        cached = cache.lookup_path(file_path)
+        if cached is not None:
+            results[file_path] = cached
+        else:
+            misses.append(file_path)
+    stats = {"files": len(file_paths), "cached": len(results), "parsed": 0, "failed": 0}
+
+    for file_path, stat, digest, result in parallel_map(extract, misses, max_workers):
+        if stat is None:
+            stats["failed"] += 1
+            continue
+        cache.put(digest, result, file_path, stat)
+        results[file_path] = result
+        stats["parsed"] += 1
+        if "error" in result:
+            stats["failed"] += 1
+    return results, stats
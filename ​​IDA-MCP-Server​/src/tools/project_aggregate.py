@@ -0,0 +1,108 @@
+"""
+项目级指标汇总模块
+"""
+
+import os
+import threading
+import time
+from typing import Dict, Any, List
+
+from src.tools.issues import issue_total
+
+
+class ProjectAggregate:
+    """项目指标汇总
+
+    保存每个文件的摘要指标并维护累计值，单个文件变化时可增量更新，
+    无需重新遍历整个项目。
+    """
+
+    SUMMARY_FIELDS = ("lines_of_code", "functions", "classes", "complexity_score", "quality_score")
+
+    def __init__(self, project_path: str):
+        self.project_path = project_path
+        self._files: Dict[str, Dict[str, Any]] = {}
+        self._failed: Dict[str, str] = {}
+        self._totals: Dict[str, int] = {field: 0 for field in self.SUMMARY_FIELDS}
+        self._totals["issues"] = 0
+        self._languages: Dict[str, int] = {}
+        self._lock = threading.RLock()
+        self.updated_at = None
+
+    def update(self, file_path: str, analysis: Dict[str, Any]):
+        """用单个文件的分析结果更新汇总"""
+        with self._lock:
+            self._discard(file_path)
+            if "error" in analysis:
+                self._failed[file_path] = analysis["error"]
+            else:
+                summary = {field: analysis.get(field, 0) for field in self.SUMMARY_FIELDS}
+                summary["issues"] = issue_total(analysis)
+                summary["language"] = analysis.get("language", "unknown")
+                self._files[file_path] = summary
+                for field, value in summary.items():
+                    if field in self._totals:
+                        self._totals[field] += value
+                self._languages[summary["language"]] = self._languages.get(summary["language"], 0) + 1
+            self.updated_at = time.time()
+
+    def remove(self, file_path: str):
+        """从汇总中移除文件"""
+        with self._lock:
+            self._discard(file_path)
+            self.updated_at = time.time()
+
+    def file_summaries(self) -> Dict[str, Dict[str, Any]]:
+        """每个文件的摘要指标，键为相对项目根目录的路径"""
+        prefix = os.path.join(self.project_path, '')
+        with self._lock:
+            return {
+                (path[len(prefix):] if path.startswith(prefix) else path).replace(os.sep, '/'):
+                    dict(summary, files=1)
+                for path, summary in self._files.items()
+            }
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._files)
+
+    def __contains__(self, file_path: str) -> bool:
+        with self._lock:
+            return file_path in self._files or file_path in self._failed
+
+    def to_dict(self, top_n: int = 10) -> Dict[str, Any]:
+        """输出项目汇总指标"""
+        with self._lock:
+            files_count = len(self._files)
+            worst_files: List[Dict[str, Any]] = sorted(
+                ({"file_path": path, **summary} for path, summary in self._files.items()),
+                key=lambda item: (item["quality_score"], -item["complexity_score"])
+            )[:top_n]
+
+            return {
+                "project_path": self.project_path,
+                "files_analyzed": files_count,
+                "failed_files": [{"file_path": path, "error": error} for path, error in sorted(self._failed.items())],
+                "languages": dict(self._languages),
+                "total_lines_of_code": self._totals["lines_of_code"],
+                "total_functions": self._totals["functions"],
+                "total_classes": self._totals["classes"],
+                "total_issues": self._totals["issues"],
+                "average_complexity": round(self._totals["complexity_score"] / max(files_count, 1), 2),
+                "average_quality_score": round(self._totals["quality_score"] / max(files_count, 1), 2),
+                "worst_files": worst_files,
+                "updated_at": self.updated_at
+            }
+
+    def _discard(self, file_path: str):
+        self._failed.pop(file_path, None)
+        summary = self._files.pop(file_path, None)
+        if summary is None:
+            return
+        for field, value in summary.items():
+            if field in self._totals:
+                self._totals[field] -= value
+        language = summary["language"]
+        self._languages[language] -= 1
+        if not self._languages[language]:
+            del self._languages[language]
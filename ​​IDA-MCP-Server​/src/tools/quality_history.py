@@ -0,0 +1,354 @@
+"""
+质量历史模块
+
+每次项目分析后追加一条项目级指标和（有变化的）文件级指标，按 (序列, 时间) 聚簇存储，
+时间范围查询只扫描对应的索引区间。较早的原始记录压缩为按小时、再按天的汇总，
+每个序列的最新记录始终保留；趋势和报告直接由已存储的指标计算，不重新分析历史版本。
+"""
+
+import threading
+import time
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+from src.tools.storage import connect
+
+# 记录的指标（项目级记录中复杂度和质量评分为文件平均值）
+METRICS = ("files", "lines_of_code", "complexity_score", "issues", "quality_score")
+
+HOUR = 3600
+DAY = 86400
+# 原始记录保留时间，之后压缩为小时汇总
+RAW_RETENTION = 30 * DAY
+# 小时汇总保留时间，之后压缩为天汇总
+HOURLY_RETENTION = 365 * DAY
+
+
+def _metrics_row(metrics: Dict[str, Any]) -> Tuple:
+    return tuple(metrics.get(field, 0) for field in METRICS)
+
+
+class QualityHistory:
+    """只追加的质量指标时间序列"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self._init_tables(conn)
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def _init_tables(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS quality_series (
+                id INTEGER PRIMARY KEY,
+                project TEXT NOT NULL,
+                path TEXT NOT NULL,
+                last_metrics TEXT,
+                last_ts REAL,
+                UNIQUE (project, path)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS quality_samples (
+                series_id INTEGER NOT NULL,
+                ts REAL NOT NULL,
+                commit_sha TEXT,
+                files INTEGER,
+                lines_of_code INTEGER,
+                complexity_score REAL,
+                issues INTEGER,
+                quality_score REAL,
+                PRIMARY KEY (series_id, ts)
+            ) WITHOUT ROWID
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS quality_rollups (
+                series_id INTEGER NOT NULL,
+                resolution INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+                files REAL,
+                lines_of_code REAL,
+                complexity_score REAL,
+                issues REAL,
+                quality_score REAL,
+                quality_min REAL,
+                quality_max REAL,
+                PRIMARY KEY (series_id, resolution, bucket)
+            ) WITHOUT ROWID
+        ''')
+        conn.commit()
+
+    def record(self, project_path: str, project_metrics: Dict[str, Any],
+               file_metrics: Dict[str, Dict[str, Any]], commit: str = "",
+               timestamp: Optional[float] = None) -> Dict[str, int]:
+        """追加一次分析的指标
+
+        Args:
+            project_path: 项目根目录路径
+            project_metrics: 项目级指标（字段见 METRICS）
+            file_metrics: {相对路径: 指标}；与该文件上一条（更早的）记录相同的不再写入，
+                项目级指标和提交都与上一条记录相同时同样不再写入
+            commit: 对应的提交SHA
+            timestamp: 记录时间（按版本回填时为提交时间），默认为当前时间
+        """
+        timestamp = time.time() if timestamp is None else timestamp
+        conn = self._connect()
+        try:
+            with conn:
+                series = {path: (series_id, last, last_ts) for series_id, path, last, last_ts in conn.execute(
+                    "SELECT id, path, last_metrics, last_ts FROM quality_series WHERE project = ?", (project_path,))}
+                samples = []
+                updates = []
+                project_series_id, _, project_last_ts = series.get("", (None, None, None))
+                last_commit = conn.execute(
+                    "SELECT commit_sha FROM quality_samples WHERE series_id = ? AND ts = ?",
+                    (project_series_id, project_last_ts)).fetchone() if project_series_id is not None else None
+
+                def append(path: str, row: Tuple):
+                    encoded = repr(row)
+                    series_id, last, last_ts = series.get(path, (None, None, None))
+                    # 指标只在变化时写入（项目级还要求提交相同）；回填更早的版本时不能依赖之后的记录，照常写入
+                    newer = last_ts is None or timestamp >= last_ts
+                    if newer and encoded == last and (path or last_commit == (commit,)):
+                        return
+                    if series_id is None:
+                        series_id = conn.execute(
+                            "INSERT INTO quality_series (project, path) VALUES (?, ?)", (project_path, path)).lastrowid
+                    samples.append((series_id, timestamp, commit) + row)
+                    if newer:
+                        updates.append((encoded, timestamp, series_id))
+
+                for path, metrics in [("", project_metrics)] + sorted(file_metrics.items()):
+                    append(path, _metrics_row(metrics))
+                # 已不在项目中的文件追加一条全零记录（files 为0表示文件已删除）
+                removed = (0,) * len(METRICS)
+                for path in list(series):
+                    if path and path not in file_metrics:
+                        append(path, removed)
+                # 同一时间点已有记录（如重复回填同一提交）时保留原记录
+                conn.executemany('''
+                    INSERT OR IGNORE INTO quality_samples
+                    (series_id, ts, commit_sha, files, lines_of_code, complexity_score, issues, quality_score)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+                ''', samples)
+                conn.executemany("UPDATE quality_series SET last_metrics = ?, last_ts = ? WHERE id = ?", updates)
+        finally:
+            conn.close()
+        return {"samples": len(samples)}
+
+    def compact(self, now: Optional[float] = None) -> Dict[str, int]:
+        """压缩较早的记录：原始记录 -> 小时汇总 -> 天汇总（每个序列的最新记录保留）"""
+        now = time.time() if now is None else now
+        averaged = ", ".join(METRICS)
+        merged = ", ".join(
+            f"{field} = ({field} * samples + excluded.{field} * excluded.samples) / (samples + excluded.samples)"
+            for field in METRICS)
+        upsert = f'''
+            ON CONFLICT (series_id, resolution, bucket) DO UPDATE SET
+            {merged},
+            quality_min = MIN(quality_min, excluded.quality_min),
+            quality_max = MAX(quality_max, excluded.quality_max),
+            samples = samples + excluded.samples
+        '''
+        raw_condition = '''
+            ts < ? AND ts < (SELECT MAX(latest.ts) FROM quality_samples latest
+                             WHERE latest.series_id = quality_samples.series_id)
+        '''
+        conn = self._connect()
+        try:
+            with conn:
+                raw_cutoff = now - RAW_RETENTION
+                conn.execute(f'''
+                    INSERT INTO quality_rollups
+                    (series_id, resolution, bucket, samples, {averaged}, quality_min, quality_max)
+                    SELECT series_id, {HOUR}, CAST(ts / {HOUR} AS INTEGER) * {HOUR}, COUNT(*),
+                           {", ".join(f"AVG({field})" for field in METRICS)},
+                           MIN(quality_score), MAX(quality_score)
+                    FROM quality_samples WHERE {raw_condition}
+                    GROUP BY series_id, CAST(ts / {HOUR} AS INTEGER)
+                    {upsert}
+                ''', (raw_cutoff,))
+                raw = conn.execute(f"DELETE FROM quality_samples WHERE {raw_condition}", (raw_cutoff,)).rowcount
+
+                hourly_cutoff = now - HOURLY_RETENTION
+                conn.execute(f'''
+                    INSERT INTO quality_rollups
+                    (series_id, resolution, bucket, samples, {averaged}, quality_min, quality_max)
+                    SELECT series_id, {DAY}, CAST(bucket / {DAY} AS INTEGER) * {DAY}, SUM(samples),
+                           {", ".join(f"SUM({field} * samples) / SUM(samples)" for field in METRICS)},
+                           MIN(quality_min), MAX(quality_max)
+                    FROM quality_rollups WHERE resolution = {HOUR} AND bucket < ?
+                    GROUP BY series_id, CAST(bucket / {DAY} AS INTEGER)
+                    {upsert}
+                ''', (hourly_cutoff,))
+                hourly = conn.execute(f"DELETE FROM quality_rollups WHERE resolution = {HOUR} AND bucket < ?",
+                                      (hourly_cutoff,)).rowcount
+        finally:
+            conn.close()
+        return {"raw_samples_compacted": raw, "hourly_rollups_compacted": hourly}
+
+    def has_project(self, project_path: str) -> bool:
+        """项目是否已有历史记录"""
+        conn = self._connect()
+        try:
+            return self._series_id(conn, project_path, "") is not None
+        finally:
+            conn.close()
+
+    def _series_id(self, conn, project_path: str, path: str) -> Optional[int]:
+        row = conn.execute("SELECT id FROM quality_series WHERE project = ? AND path = ?",
+                           (project_path, path)).fetchone()
+        return row[0] if row else None
+
+    def history(self, project_path: str, path: str = "", start: Optional[float] = None,
+                end: Optional[float] = None, max_points: int = 200) -> Dict[str, Any]:
+        """查询时间范围内的指标趋势，点数超过 max_points 时按等宽时间段合并"""
+        conn = self._connect()
+        try:
+            series_id = self._series_id(conn, project_path, path)
+            if series_id is None:
+                return {"error": f"No quality history recorded for {path or project_path}"}
+            if start is None or end is None:
+                first, last = conn.execute('''
+                    SELECT MIN(ts), MAX(ts) FROM (
+                        SELECT ts FROM quality_samples WHERE series_id = ?
+                        UNION ALL SELECT bucket FROM quality_rollups WHERE series_id = ?
+                    )
+                ''', (series_id, series_id)).fetchone()
+                start = first if start is None else start
+                end = last if end is None else end
+            width = max((end - start) / max(max_points, 1), 1.0)
+
+            # 原始记录与汇总记录在各自的主键区间内分段聚合，再按时间段合并（按记录数加权）
+            buckets: Dict[int, List[float]] = {}
+            rows = list(conn.execute(f'''
+                SELECT CAST((ts - ?) / ? AS INTEGER) AS b, COUNT(*), MAX(ts),
+                       {", ".join(f"SUM({field})" for field in METRICS)}, MIN(quality_score), MAX(quality_score)
+                FROM quality_samples WHERE series_id = ? AND ts BETWEEN ? AND ?
+                GROUP BY b
+            ''', (start, width, series_id, start, end)))
+            rows += conn.execute(f'''
+                SELECT CAST((bucket - ?) / ? AS INTEGER) AS b, SUM(samples), MAX(bucket),
+                       {", ".join(f"SUM({field} * samples)" for field in METRICS)}, MIN(quality_min), MAX(quality_max)
+                FROM quality_rollups WHERE series_id = ? AND bucket BETWEEN ? AND ?
+                GROUP BY b
+            ''', (start, width, series_id, start, end)).fetchall()
+            for bucket, count, latest, *values in rows:
+                entry = buckets.get(bucket)
+                if entry is None:
+                    buckets[bucket] = [count, latest] + values
+                    continue
+                entry[0] += count
+                entry[1] = max(entry[1], latest)
+                for i in range(len(METRICS)):
+                    entry[2 + i] += values[i]
+                entry[-2] = min(entry[-2], values[-2])
+                entry[-1] = max(entry[-1], values[-1])
+
+            latest = self._sample_at(conn, series_id, end)
+        finally:
+            conn.close()
+
+        points = []
+        for bucket in sorted(buckets):
+            count, latest_ts, *values = buckets[bucket]
+            point = {"timestamp": latest_ts, "samples": count}
+            for i, field in enumerate(METRICS):
+                point[field] = round(values[i] / count, 2)
+            point["quality_min"], point["quality_max"] = values[-2], values[-1]
+            points.append(point)
+        return {
+            "project_path": project_path,
+            "path": path,
+            "start": start,
+            "end": end,
+            "bucket_seconds": round(width, 1),
+            "points": points,
+            "latest": latest
+        }
+
+    @staticmethod
+    def _sample_at(conn, series_id: int, timestamp: float) -> Optional[Dict[str, Any]]:
+        """不晚于给定时间的最近一条记录（原始记录已压缩时取汇总值）"""
+        row = conn.execute(f'''
+            SELECT ts, commit_sha, {", ".join(METRICS)} FROM quality_samples
+            WHERE series_id = ? AND ts <= ? ORDER BY ts DESC LIMIT 1
+        ''', (series_id, timestamp)).fetchone()
+        if row is None:
+            row = conn.execute(f'''
+                SELECT bucket, NULL, {", ".join(METRICS)} FROM quality_rollups
+                WHERE series_id = ? AND bucket <= ? ORDER BY bucket DESC LIMIT 1
+            ''', (series_id, timestamp)).fetchone()
+        if row is None:
+            return None
+        return {"timestamp": row[0], "commit": row[1], **dict(zip(METRICS, row[2:]))}
+
+    def _file_values(self, conn, project_path: str, timestamp: float) -> Dict[str, Tuple[float, int]]:
+        # 每个文件在给定时间点的 (质量评分, 问题数)，取各序列不晚于该时间的最后一条原始记录
+        # （SQLite中与 MAX() 一起查询的其他列取自最大值所在的行）
+        return {path: (quality, issues) for path, files, quality, issues, _ in conn.execute('''
+            SELECT s.path, q.files, q.quality_score, q.issues, MAX(q.ts)
+            FROM quality_series s JOIN quality_samples q ON q.series_id = s.id
+            WHERE s.project = ? AND s.path != '' AND q.ts <= ?
+            GROUP BY s.id
+        ''', (project_path, timestamp)) if files}
+
+    def report(self, project_path: str, path: str = "", windows: Iterable[int] = (7, 30),
+               limit: int = 10, now: Optional[float] = None) -> Dict[str, Any]:
+        """质量报告：最新指标、与若干天前相比的变化；项目报告另含质量下降最多和最差的文件"""
+        now = time.time() if now is None else now
+        conn = self._connect()
+        try:
+            series_id = self._series_id(conn, project_path, path)
+            if series_id is None:
+                return {"error": f"No quality history recorded for {path or project_path}"}
+            current = self._sample_at(conn, series_id, now)
+            first = conn.execute("SELECT MIN(ts), COUNT(*) FROM quality_samples WHERE series_id = ?",
+                                 (series_id,)).fetchone()
+            trends = {}
+            for days in windows:
+                past = self._sample_at(conn, series_id, now - days * DAY)
+                if past is None or current is None:
+                    trends[f"{days}d"] = None
+                    continue
+                trends[f"{days}d"] = {
+                    "since": past["timestamp"],
+                    **{field: round(current[field] - past[field], 2) for field in METRICS}
+                }
+            result = {
+                "project_path": project_path,
+                "path": path,
+                "current": current,
+                "first_recorded": first[0],
+                "raw_samples": first[1],
+                "trends": trends
+            }
+            if not path:
+                latest_files = self._file_values(conn, project_path, now)
+                window = min(windows, default=7)
+                past_files = self._file_values(conn, project_path, now - window * DAY)
+                changes = [
+                    {"file_path": file_path, "quality_score": quality, "quality_delta": round(quality - past[0], 2),
+                     "issues_delta": issues - past[1]}
+                    for file_path, (quality, issues) in latest_files.items()
+                    for past in [past_files.get(file_path)] if past is not None and quality < past[0]
+                ]
+                changes.sort(key=lambda item: (item["quality_delta"], item["file_path"]))
+                result[f"regressions_{window}d"] = changes[:limit]
+                result["worst_files"] = [
+                    {"file_path": file_path, "quality_score": quality, "issues": issues}
+                    for file_path, (quality, issues) in sorted(latest_files.items(),
+                                                               key=lambda item: (item[1][0], item[0]))[:limit]
+                ]
+        finally:
+            conn.close()
+        return result
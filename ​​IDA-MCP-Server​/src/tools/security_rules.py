@@ -0,0 +1,394 @@
+"""
+安全与代码规范规则引擎
+
+文本规则中必然出现的字面量按语言合并为一个字典树正则，每个文件只扫描一遍，
+只有锚点命中的规则才执行完整的正则表达式（规则数量增加基本不增加扫描开销）；
+Python另有基于AST的规则（eval/exec、shell=True、不安全的反序列化、拼接SQL等），
+与其他AST分析共用同一棵语法树。项目扫描按文件并行，结果按内容哈希缓存。
+"""
+
+import ast
+import bisect
+import json
+import os
+import re
+from functools import partial
+from pathlib import Path
+from typing import Dict, Any, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    from re import _constants as sre_constants, _parser as sre_parse
+except ImportError:  # Python 3.10及以前
+    import sre_constants
+    import sre_parse
+
+from src.tools.analysis_cache import AnalysisCache, content_hash
+from src.tools.issues import SEVERITY_LEVELS, IssueReport
+from src.tools.parallel import load_file_results
+
+PYTHON_EXTENSIONS = ('.py',)
+
+# 内置文本规则：(规则ID, 适用语言, 类别, 严重程度, 正则表达式, 说明)，语言为 "py" / "js" / "*"
+DEFAULT_TEXT_RULES: List[Tuple[str, str, str, str, str, str]] = [
+    ("SEC001", "*", "security", "error", r"\bAKIA[0-9A-Z]{16}\b", "Hardcoded AWS access key"),
+    ("SEC002", "*", "security", "error", r"-----BEGIN (?:RSA |EC |DSA |OPENSSH )?PRIVATE KEY-----",
+     "Private key embedded in source"),
+    ("SEC003", "*", "security", "warning",
+     r"""\b(?i:password|passwd|secret|api_?key|access_?token)\b\s*[:=]\s*['"][^'"\s]{6,}['"]""",
+     "Possible hardcoded credential"),
+    ("SEC004", "*", "security", "info", r"\bhttp://(?!localhost\b|127\.0\.0\.1\b)[\w.-]+",
+     "Plain HTTP URL - consider HTTPS"),
+    ("SEC101", "js", "security", "error", r"\beval\s*\(", "Use of eval()"),
+    ("SEC102", "js", "security", "error", r"\bnew\s+Function\s*\(", "Dynamic code via new Function()"),
+    ("SEC103", "js", "security", "warning", r"\.(?:innerHTML|outerHTML)\s*\+?=(?!=)",
+     "Assignment to innerHTML/outerHTML (XSS risk)"),
+    ("SEC104", "js", "security", "warning", r"\bdocument\.write(?:ln)?\s*\(", "Use of document.write()"),
+    ("SEC105", "js", "security", "warning", r"\bdangerouslySetInnerHTML\b", "Use of dangerouslySetInnerHTML"),
+    ("SEC106", "js", "security", "error", r"\b(?:setTimeout|setInterval)\s*\(\s*['\"`]",
+     "String passed to setTimeout/setInterval is evaluated as code"),
+    ("SEC107", "js", "security", "warning", r"\bchild_process\b[\s\S]{0,80}?\bexec(?:Sync)?\s*\(",
+     "Shell command via child_process.exec"),
+    ("SEC108", "js", "security", "warning", r"\bMath\.random\s*\(\s*\)[\s\S]{0,40}?\b(?:token|secret|password)\b",
+     "Math.random() is not suitable for secrets"),
+    ("LINT101", "js", "maintainability", "info", r"console\.log",
+     "console.log found - consider removing for production"),
+]
+
+# 通过AST识别的Python调用：限定名 -> (规则ID, 严重程度, 说明)
+_PYTHON_CALL_RULES = {
+    "eval": ("SEC201", "error", "Use of eval()"),
+    "exec": ("SEC202", "error", "Use of exec()"),
+    "os.system": ("SEC203", "error", "Shell command via os.system()"),
+    "os.popen": ("SEC203", "error", "Shell command via os.popen()"),
+    "pickle.loads": ("SEC205", "error", "Deserializing with pickle can execute arbitrary code"),
+    "pickle.load": ("SEC205", "error", "Deserializing with pickle can execute arbitrary code"),
+    "cPickle.loads": ("SEC205", "error", "Deserializing with pickle can execute arbitrary code"),
+    "marshal.loads": ("SEC205", "error", "Deserializing with marshal can execute arbitrary code"),
+    "shelve.open": ("SEC205", "warning", "shelve uses pickle; only open trusted files"),
+    "tempfile.mktemp": ("SEC207", "warning", "tempfile.mktemp() is insecure, use mkstemp()"),
+    "hashlib.md5": ("SEC208", "info", "Weak hash algorithm (MD5)"),
+    "hashlib.sha1": ("SEC208", "info", "Weak hash algorithm (SHA-1)"),
+}
+_SUBPROCESS_CALLS = {"subprocess." + name for name in ("run", "call", "check_call", "check_output", "Popen")}
+_SQL_METHODS = {"execute", "executemany", "executescript"}
+_SQL_KEYWORDS = re.compile(r"\b(?:SELECT|INSERT|UPDATE|DELETE|REPLACE|CREATE|DROP|ALTER|WHERE)\b", re.I)
+
+
+# 作为预筛选锚点的字面量最短长度
+MIN_ANCHOR_LENGTH = 3
+
+
+def _required_literals(items, ignore_case: bool = False) -> Optional[List[Tuple[str, bool]]]:
+    """从解析后的正则表达式中找出必然出现的字面量（分支时为各分支字面量的集合）
+
+    返回 [(字面量, 是否忽略大小写)]，取最短字面量最长的一组；找不到足够长的字面量时返回 None。
+    """
+    best: Optional[List[Tuple[str, bool]]] = None
+
+    def consider(candidates):
+        nonlocal best
+        if candidates and min(len(text) for text, _ in candidates) >= MIN_ANCHOR_LENGTH and (
+                best is None or min(len(t) for t, _ in candidates) > min(len(t) for t, _ in best)):
+            best = candidates
+
+    run: List[str] = []
+    for op, av in items:
+        if op is sre_constants.LITERAL:
+            run.append(chr(av))
+            continue
+        if op is sre_constants.AT:
+            # \b 等零宽断言不影响相邻字面量
+            continue
+        consider([("".join(run), ignore_case)])
+        run = []
+        if op is sre_constants.SUBPATTERN:
+            _, add_flags, del_flags, sub_items = av
+            sub_ignore = (ignore_case or bool(add_flags & re.IGNORECASE)) and not del_flags & re.IGNORECASE
+            consider(_required_literals(sub_items, sub_ignore))
+        elif op is sre_constants.BRANCH:
+            alternatives = [_required_literals(alternative, ignore_case) for alternative in av[1]]
+            if all(alternatives):
+                consider([literal for alternative in alternatives for literal in alternative])
+        elif op in (sre_constants.MAX_REPEAT, sre_constants.MIN_REPEAT) and av[0] >= 1:
+            consider(_required_literals(av[2], ignore_case))
+    consider([("".join(run), ignore_case)])
+    return best
+
+
+def _trie_pattern(words: Iterable[str]) -> str:
+    """把字面量集合编译为按字符逐层分支的正则表达式（共享前缀只比较一次）"""
+    trie: Dict[str, Any] = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = {}
+
+    def emit(node: Dict[str, Any]) -> str:
+        alternatives = [re.escape(char) + emit(child) for char, child in sorted(node.items()) if char]
+        if not alternatives:
+            return ""
+        if "" in node:
+            return "(?:" + "|".join(alternatives) + ")?"
+        return alternatives[0] if len(alternatives) == 1 else "(?:" + "|".join(alternatives) + ")"
+
+    return emit(trie)
+
+
+class _TextMatcher:
+    """一种语言的文本规则
+
+    所有规则中必然出现的字面量合并为一个字典树正则，每个文件只扫描一遍找出命中的锚点，
+    再只对锚点命中的规则执行完整的正则表达式（没有可用锚点的规则每个文件都执行）。
+    逐条规则扫描整个文件的开销随规则数线性增长，而锚点扫描的开销基本不随规则数变化；
+    直接把全部规则拼成一个多选分支的正则则更慢（每个位置都要逐个尝试所有分支）。
+    """
+
+    def __init__(self, rules: Sequence[Tuple[str, str, str, str, str, str]]):
+        self.rules = [(re.compile(rule[4]), (rule[0], rule[2], rule[3], rule[5])) for rule in rules]
+        self.unanchored: List[int] = []
+        self.anchors: Dict[str, List[int]] = {}
+        self.ignore_case_anchors: Dict[str, List[int]] = {}
+        for index, (compiled, _) in enumerate(self.rules):
+            parsed = sre_parse.parse(compiled.pattern, compiled.flags)
+            # 开头的 (?i) 等全局内联标志记录在解析状态中，不出现在各个节点上
+            ignore_case = bool((compiled.flags | parsed.state.flags) & re.IGNORECASE)
+            literals = _required_literals(parsed, ignore_case)
+            if literals is None:
+                self.unanchored.append(index)
+                continue
+            for literal, ignore_case in literals:
+                if ignore_case:
+                    self.ignore_case_anchors.setdefault(literal.lower(), []).append(index)
+                else:
+                    self.anchors.setdefault(literal, []).append(index)
+        # 零宽先行断言使每个位置都能命中，锚点相互重叠时不会漏掉
+        self.prefilter = re.compile(f"(?=({_trie_pattern(self.anchors)}))") if self.anchors else None
+        self.ignore_case_prefilter = re.compile(f"(?=({_trie_pattern(self.ignore_case_anchors)}))", re.I) \
+            if self.ignore_case_anchors else None
+
+    def candidates(self, content: str) -> List[int]:
+        """锚点命中的规则"""
+        selected = set(self.unanchored)
+        for prefilter, anchors, fold in ((self.prefilter, self.anchors, False),
+                                         (self.ignore_case_prefilter, self.ignore_case_anchors, True)):
+            if prefilter is None:
+                continue
+            for hit in set(prefilter.findall(content)):
+                if fold:
+                    hit = hit.lower()
+                # 字典树匹配取最长的锚点，同一位置上作为其前缀的较短锚点也算命中
+                for length in range(MIN_ANCHOR_LENGTH, len(hit) + 1):
+                    selected.update(anchors.get(hit[:length], ()))
+        return sorted(selected)
+
+    def scan(self, content: str) -> Iterator[Tuple[int, Tuple[str, str, str, str]]]:
+        """逐条返回 (匹配位置, 规则信息)"""
+        for index in self.candidates(content):
+            compiled, rule = self.rules[index]
+            for match in compiled.finditer(content):
+                yield match.start(), rule
+
+
+class RuleSet:
+    """编译后的规则集"""
+
+    def __init__(self, text_rules: Sequence[Tuple[str, str, str, str, str, str]] = DEFAULT_TEXT_RULES,
+                 python_ast_rules: bool = True):
+        self.text_rules = list(text_rules)
+        self.python_ast_rules = python_ast_rules
+        self._matchers = {language: _TextMatcher([rule for rule in self.text_rules if rule[1] in (language, "*")])
+                          for language in ("py", "js")}
+
+    @classmethod
+    def from_file(cls, rules_file: str) -> "RuleSet":
+        """在内置规则之外加载JSON规则文件
+
+        文件内容为规则列表，每条规则包含 id、pattern、message，可选 language（py / js / *）、
+        category、severity。
+
+        Raises:
+            ValueError: 规则格式不正确或正则表达式无效
+        """
+        with open(rules_file, "r", encoding="utf-8") as f:
+            entries = json.load(f)
+        if not isinstance(entries, list):
+            raise ValueError("Rules file must contain a JSON list")
+        rules = list(DEFAULT_TEXT_RULES)
+        for number, entry in enumerate(entries, 1):
+            try:
+                rule = (str(entry["id"]), entry.get("language", "*"), entry.get("category", "security"),
+                        entry.get("severity", "warning"), entry["pattern"], entry["message"])
+            except (KeyError, TypeError, AttributeError):
+                raise ValueError(f"Rule {number}: id, pattern and message are required")
+            if rule[1] not in ("py", "js", "*") or rule[3] not in SEVERITY_LEVELS:
+                raise ValueError(f"Rule {rule[0]}: invalid language or severity")
+            try:
+                re.compile(rule[4])
+            except re.error as e:
+                raise ValueError(f"Rule {rule[0]}: invalid pattern: {e}")
+            rules.append(rule)
+        return cls(rules)
+
+    def check(self, content: str, file_ext: str, tree: Optional[ast.AST] = None) -> List[Dict[str, Any]]:
+        """检查源代码，返回按行排列的问题列表
+
+        Python文件可传入已解析的语法树，避免重复解析；未传入时自行解析（语法错误时只做文本检查）。
+        """
+        findings = sorted(self.iter_findings(content, file_ext, tree), key=lambda finding: finding[:2])
+        return [_finding(*finding) for finding in findings]
+
+    def iter_findings(self, content: str, file_ext: str,
+                      tree: Optional[ast.AST] = None) -> Iterator[Tuple[int, str, str, str, str]]:
+        """逐条返回 (行号, 规则ID, 类别, 严重程度, 说明)，不排序也不构造字典，供按规则计数的调用方使用"""
+        language = "py" if file_ext in PYTHON_EXTENSIONS else "js"
+        yield from self._check_text(content, language)
+        if language == "py" and self.python_ast_rules:
+            if tree is None:
+                try:
+                    tree = ast.parse(content)
+                except (SyntaxError, ValueError):
+                    tree = None
+            if tree is not None:
+                visitor = _PythonRuleVisitor()
+                visitor.visit(tree)
+                yield from visitor.findings
+
+    def _check_text(self, content: str, language: str) -> Iterator[Tuple[int, str, str, str, str]]:
+        line_starts = None
+        for position, (rule_id, category, severity, message) in self._matchers[language].scan(content):
+            if line_starts is None:
+                line_starts = [0] + [match.end() for match in re.finditer(r"\n", content)]
+            yield bisect.bisect_right(line_starts, position), rule_id, category, severity, message
+
+
+def _finding(line: int, rule_id: str, category: str, severity: str, message: str) -> Dict[str, Any]:
+    return {"type": category, "severity": severity, "line": line, "message": message, "rule": rule_id}
+
+
+class _PythonRuleVisitor(ast.NodeVisitor):
+    """Python AST规则：调用名按import别名还原为限定名后匹配"""
+
+    def __init__(self):
+        self.findings: List[Tuple[int, str, str, str, str]] = []
+        self._aliases: Dict[str, str] = {}
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            if alias.asname:
+                self._aliases[alias.asname] = alias.name
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        if node.module and not node.level:
+            for alias in node.names:
+                self._aliases[alias.asname or alias.name] = f"{node.module}.{alias.name}"
+
+    def _qualname(self, node: ast.AST) -> str:
+        parts = []
+        while isinstance(node, ast.Attribute):
+            parts.append(node.attr)
+            node = node.value
+        if not isinstance(node, ast.Name):
+            return ""
+        parts.append(self._aliases.get(node.id, node.id))
+        return ".".join(reversed(parts))
+
+    def _add(self, node: ast.AST, rule_id: str, severity: str, message: str):
+        self.findings.append((node.lineno, rule_id, "security", severity, message))
+
+    def visit_Call(self, node: ast.Call):
+        name = self._qualname(node.func)
+        keywords = {keyword.arg: keyword.value for keyword in node.keywords if keyword.arg}
+        rule = _PYTHON_CALL_RULES.get(name)
+        if rule is not None:
+            self._add(node, *rule)
+        elif name in _SUBPROCESS_CALLS:
+            shell = keywords.get("shell")
+            if isinstance(shell, ast.Constant) and shell.value is True:
+                self._add(node, "SEC204", "error", f"{name}() with shell=True")
+        elif name in ("yaml.load", "yaml.load_all"):
+            loader = self._qualname(keywords["Loader"]) if "Loader" in keywords else ""
+            if not loader.endswith("SafeLoader"):
+                self._add(node, "SEC206", "error", f"{name}() without SafeLoader can construct arbitrary objects")
+        elif name.startswith("requests.") and "verify" in keywords:
+            verify = keywords["verify"]
+            if isinstance(verify, ast.Constant) and verify.value is False:
+                self._add(node, "SEC209", "warning", "TLS certificate verification disabled (verify=False)")
+        elif isinstance(node.func, ast.Attribute) and node.func.attr in _SQL_METHODS and node.args:
+            if _is_formatted_sql(node.args[0]):
+                self._add(node, "SEC210", "warning",
+                          "SQL built with string formatting - pass values as query parameters")
+        self.generic_visit(node)
+
+
+def _is_formatted_sql(node: ast.AST) -> bool:
+    """SQL语句是否由运行时的值拼接而成（f-string插值、% 格式化、+ 拼接或 .format()）"""
+    if isinstance(node, ast.JoinedStr):
+        literal = "".join(part.value for part in node.values
+                          if isinstance(part, ast.Constant) and isinstance(part.value, str))
+        return any(isinstance(part, ast.FormattedValue) for part in node.values) and \
+            bool(_SQL_KEYWORDS.search(literal))
+    if isinstance(node, ast.BinOp) and isinstance(node.op, (ast.Mod, ast.Add)):
+        literal = node.left
+        while isinstance(literal, ast.BinOp):
+            literal = literal.left
+        return isinstance(literal, ast.Constant) and isinstance(literal.value, str) and \
+            bool(_SQL_KEYWORDS.search(literal.value))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == "format":
+        literal = node.func.value
+        return isinstance(literal, ast.Constant) and isinstance(literal.value, str) and \
+            bool(_SQL_KEYWORDS.search(literal.value))
+    return False
+
+
+DEFAULT_RULES = RuleSet()
+
+# 工作进程中按规则文件缓存编译结果：路径 -> (文件版本, 规则集)
+_rule_sets: Dict[str, Tuple[str, RuleSet]] = {"": ("", DEFAULT_RULES)}
+
+
+def rules_file_version(rules_file: str) -> str:
+    """规则文件的版本（修改时间和大小），文件修改后重新加载规则、不再使用按旧规则得到的检查结果
+
+    Raises:
+        OSError: 规则文件无法访问
+    """
+    if not rules_file:
+        return ""
+    stat = os.stat(rules_file)
+    return f"{stat.st_mtime_ns}:{stat.st_size}"
+
+
+def get_rule_set(rules_file: str = "") -> RuleSet:
+    """获取规则集（内置规则，或内置规则加上规则文件中的规则）"""
+    version = rules_file_version(rules_file)
+    cached = _rule_sets.get(rules_file)
+    if cached is None or cached[0] != version:
+        cached = _rule_sets[rules_file] = (version, RuleSet.from_file(rules_file))
+    return cached[1]
+
+
+def _scan_file(file_path: str, rules_file: str = ""):
+    """读取并检查单个文件（在工作进程中执行），返回 (路径, stat, 内容哈希, 结果)"""
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return file_path, None, None, {"error": str(e)}
+    digest = content_hash(data)
+    try:
+        content = data.decode("utf-8")
+    except UnicodeDecodeError as e:
+        return file_path, stat, digest, {"findings": [], "error": str(e)}
+    # 每条规则只缓存有限条明细，压缩文件中的大量同类问题只计数
+    report = IssueReport()
+    report.extend(get_rule_set(rules_file).iter_findings(content, Path(file_path).suffix.lower()))
+    issues = report.to_dict()
+    return file_path, stat, digest, {"findings": issues["issues"], "counts": issues["issue_counts"]}
+
+
+def scan_files(file_paths: List[str], cache: AnalysisCache, rules_file: str = "",
+               max_workers: Optional[int] = None) -> Tuple[Dict[str, Dict[str, Any]], Dict[str, int]]:
+    """批量检查文件，返回 ({路径: 结果}, 统计)；缓存需按规则文件区分"""
+    return load_file_results(file_paths, cache, partial(_scan_file, rules_file=rules_file), max_workers)
@@ -0,0 +1,19 @@
+"""
+分析数据库模块
+"""
+
+import os
+import sqlite3
+
+# 项目根目录（main.py所在目录）
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 分析数据库路径，可通过 IDA_ANALYSIS_DB 环境变量覆盖
+ANALYSIS_DB_PATH = os.environ.get("IDA_ANALYSIS_DB", os.path.join(PROJECT_ROOT, "analysis.db"))
+
+
+def connect(db_path: str = None) -> sqlite3.Connection:
+    """连接分析数据库"""
+    conn = sqlite3.connect(db_path or ANALYSIS_DB_PATH, timeout=30.0)
+    conn.execute("PRAGMA journal_mode=WAL")
+    return conn
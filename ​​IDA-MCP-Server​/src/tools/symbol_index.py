@@ -0,0 +1,455 @@
+"""
+符号索引模块
+
+从Python AST和JavaScript/TypeScript词法分析中提取定义、导入和名称引用，
+持久化到分析数据库中（按名称建立索引，前缀查询走索引范围扫描）。
+文件按 (mtime, size) 和内容哈希判断是否变化，只重新解析变化的文件。
+"""
+
+import ast
+import bisect
+import os
+import re
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+from src.tools.analysis_cache import content_hash
+from src.tools.parallel import parallel_map
+from src.tools.storage import connect
+
+# 每条符号记录为 (名称, 限定名, 类别, 角色, 行号, 列号)，角色为 def / import / ref
+SymbolRecord = Tuple[str, str, str, str, int, int]
+
+SYMBOL_ROLES = ("def", "import", "ref")
+
+# 前缀查询的上界：U+10FFFF 的UTF-8编码大于任何以相同前缀开头的字符串
+_PREFIX_END = "\U0010ffff"
+
+
+class _PythonSymbolVisitor(ast.NodeVisitor):
+    """收集Python定义、导入和引用"""
+
+    def __init__(self):
+        self.symbols: List[SymbolRecord] = []
+        self._scope: List[Tuple[str, bool]] = []
+
+    def _qualname(self, name: str) -> str:
+        return ".".join([scope for scope, _ in self._scope] + [name])
+
+    def _in_class_or_module(self) -> bool:
+        return not self._scope or self._scope[-1][1]
+
+    def _visit_function(self, node):
+        kind = "method" if self._scope and self._scope[-1][1] else "function"
+        self.symbols.append((node.name, self._qualname(node.name), kind, "def", node.lineno, node.col_offset))
+        self._scope.append((node.name, False))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    visit_FunctionDef = _visit_function
+    visit_AsyncFunctionDef = _visit_function
+
+    def visit_ClassDef(self, node: ast.ClassDef):
+        self.symbols.append((node.name, self._qualname(node.name), "class", "def", node.lineno, node.col_offset))
+        self._scope.append((node.name, True))
+        self.generic_visit(node)
+        self._scope.pop()
+
+    def _visit_assignment(self, node):
+        # 只记录模块级和类级的变量定义，函数内的局部变量不作为符号
+        if self._in_class_or_module():
+            targets = node.targets if isinstance(node, ast.Assign) else [node.target]
+            for target in targets:
+                for name_node in ast.walk(target):
+                    if isinstance(name_node, ast.Name):
+                        self.symbols.append((name_node.id, self._qualname(name_node.id), "variable", "def",
+                                             name_node.lineno, name_node.col_offset))
+        self.generic_visit(node)
+
+    visit_Assign = _visit_assignment
+    visit_AnnAssign = _visit_assignment
+
+    def visit_Import(self, node: ast.Import):
+        for alias in node.names:
+            local = alias.asname or alias.name.split(".")[0]
+            self.symbols.append((local, alias.name, "module", "import", node.lineno, node.col_offset))
+
+    def visit_ImportFrom(self, node: ast.ImportFrom):
+        module = "." * node.level + (node.module or "")
+        for alias in node.names:
+            if alias.name == "*":
+                continue
+            qualname = f"{module}.{alias.name}" if node.module else module + alias.name
+            self.symbols.append((alias.asname or alias.name, qualname, "name", "import", node.lineno, node.col_offset))
+
+    def visit_Name(self, node: ast.Name):
+        if not isinstance(node.ctx, ast.Store):
+            self.symbols.append((node.id, node.id, "name", "ref", node.lineno, node.col_offset))
+
+    def visit_Attribute(self, node: ast.Attribute):
+        self.generic_visit(node)
+        if not isinstance(node.ctx, ast.Store) and node.end_lineno is not None:
+            self.symbols.append((node.attr, node.attr, "attribute", "ref", node.end_lineno,
+                                 node.end_col_offset - len(node.attr)))
+
+
+_JS_TOKEN_PATTERN = re.compile(r"""
+    (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>'(?:\\.|[^'\\\n])*'|"(?:\\.|[^"\\\n])*"|`(?:\\.|[^`\\])*`)
+  | (?P<number>\d[\w.]*)
+  | (?P<ident>[A-Za-z_$][\w$]*)
+  | (?P<punct>[{}()\[\];,.=:*])
+""", re.S | re.X)
+
+_JS_KEYWORDS = frozenset("""
+    abstract as async await break case catch class const continue debugger default delete do else enum export
+    extends false finally for from function get if implements import in instanceof interface let new null of
+    package private protected public readonly return set static super switch this throw true try type typeof
+    undefined var void while with yield constructor
+""".split())
+
+_JS_METHOD_PREFIXES = frozenset(("{", "}", ";", "static", "async", "get", "set", "*", "public", "private",
+                                 "protected", "readonly"))
+
+
+def _extract_js_symbols(content: str) -> List[SymbolRecord]:
+    """基于词法记号提取JavaScript/TypeScript符号（不构建语法树）"""
+    tokens = [(match.lastgroup, match.group(), match.start()) for match in _JS_TOKEN_PATTERN.finditer(content)]
+    tokens = [token for token in tokens if token[0] != "comment"]
+    line_starts = [0] + [match.end() for match in re.finditer(r"\n", content)]
+
+    def position(offset: int) -> Tuple[int, int]:
+        line = bisect.bisect_right(line_starts, offset)
+        return line, offset - line_starts[line - 1]
+
+    def value(index: int) -> str:
+        return tokens[index][1] if 0 <= index < len(tokens) else ""
+
+    symbols: List[SymbolRecord] = []
+    consumed = set()
+    classes: List[Tuple[str, int]] = []
+    pending_class = None
+    depth = 0
+
+    def add(index: int, qualname: str, kind: str, role: str):
+        line, col = position(tokens[index][2])
+        symbols.append((tokens[index][1], qualname, kind, role, line, col))
+        consumed.add(index)
+
+    for i, (kind, text, _) in enumerate(tokens):
+        if kind == "punct":
+            if text == "{":
+                depth += 1
+                if pending_class is not None:
+                    classes.append((pending_class, depth))
+                    pending_class = None
+            elif text == "}":
+                if classes and classes[-1][1] == depth:
+                    classes.pop()
+                depth -= 1
+            continue
+        if kind != "ident" or i in consumed:
+            continue
+
+        if text in ("function", "class") and tokens[i + 1:i + 2] and value(i + 1) != "(":
+            name_index = i + 2 if value(i + 1) == "*" else i + 1
+            if name_index < len(tokens) and tokens[name_index][0] == "ident":
+                name = tokens[name_index][1]
+                qualname = f"{classes[-1][0]}.{name}" if classes and text == "function" else name
+                add(name_index, qualname, text, "def")
+                if text == "class":
+                    pending_class = name
+        elif text in ("const", "let", "var"):
+            names = []
+            j = i + 1
+            if value(j) == "{":
+                # 解构：const { a, b: c } = require('m')
+                j += 1
+                while j < len(tokens) and value(j) != "}":
+                    if tokens[j][0] == "ident":
+                        if value(j + 1) == ":":
+                            j += 2
+                            continue
+                        names.append(j)
+                    j += 1
+                j += 1
+            elif tokens[j:j + 1] and tokens[j][0] == "ident":
+                names.append(j)
+                j += 1
+            if value(j) == "=" and value(j + 1) == "require" and value(j + 2) == "(" and \
+                    tokens[j + 3:j + 4] and tokens[j + 3][0] == "string":
+                module = tokens[j + 3][1][1:-1]
+                for index in names:
+                    add(index, f"{module}.{tokens[index][1]}" if value(i + 1) == "{" else module, "module", "import")
+            elif depth == 0:
+                for index in names:
+                    add(index, tokens[index][1], "variable", "def")
+        elif text == "import" and value(i + 1) not in ("(", "."):
+            # import X, { a as b } from 'm' / import * as ns from 'm'
+            # 默认导入和命名空间导入的限定名为模块本身，具名导入为 模块.原名
+            imported = []
+            in_braces = False
+            j = i + 1
+            while j < len(tokens) and value(j) != "from" and tokens[j][0] != "string" and value(j) != ";":
+                if value(j) in ("{", "}"):
+                    in_braces = value(j) == "{"
+                elif tokens[j][0] == "ident" and value(j) not in ("type", "as") and value(j + 1) != "as":
+                    original = value(j - 2) if value(j - 1) == "as" else value(j)
+                    imported.append((j, original if in_braces else None))
+                j += 1
+            if value(j) == "from":
+                j += 1
+            if j < len(tokens) and tokens[j][0] == "string":
+                module = tokens[j][1][1:-1]
+                for index, original in imported:
+                    add(index, f"{module}.{original}" if original else module, "name", "import")
+                consumed.update(range(i, j + 1))
+        elif classes and classes[-1][1] == depth and value(i + 1) == "(" and text not in _JS_KEYWORDS \
+                and value(i - 1) in _JS_METHOD_PREFIXES:
+            # 类体中的方法定义：name(...) {
+            j, nesting = i + 1, 0
+            while j < len(tokens):
+                if value(j) == "(":
+                    nesting += 1
+                elif value(j) == ")":
+                    nesting -= 1
+                    if not nesting:
+                        break
+                j += 1
+            if value(j + 1) in ("{", ":"):
+                add(i, f"{classes[-1][0]}.{text}", "method", "def")
+
+        if i not in consumed and text not in _JS_KEYWORDS:
+            line, col = position(tokens[i][2])
+            ref_kind = "attribute" if value(i - 1) == "." else "name"
+            symbols.append((text, text, ref_kind, "ref", line, col))
+    return symbols
+
+
+def extract_symbols(content: str, file_ext: str) -> List[SymbolRecord]:
+    """提取源代码中的符号
+
+    Raises:
+        SyntaxError: Python源代码无法解析
+    """
+    if file_ext == ".py":
+        visitor = _PythonSymbolVisitor()
+        visitor.visit(ast.parse(content))
+        return visitor.symbols
+    return _extract_js_symbols(content)
+
+
+def _extract_file(task: Tuple[str, Optional[str]]):
+    """读取并提取单个文件的符号（在工作进程中执行）
+
+    内容哈希与已索引的相同时不再解析，返回的符号为 None。
+    """
+    file_path, known_digest = task
+    try:
+        stat = os.stat(file_path)
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        return file_path, None, None, None, str(e)
+    digest = content_hash(data)
+    signature = (stat.st_mtime_ns, stat.st_size)
+    if digest == known_digest:
+        return file_path, signature, digest, None, None
+    try:
+        return file_path, signature, digest, extract_symbols(data.decode("utf-8"), Path(file_path).suffix.lower()), None
+    except (SyntaxError, ValueError) as e:
+        # 无法解析的文件记录为没有符号，内容变化后再重新解析
+        return file_path, signature, digest, [], f"{type(e).__name__}: {e}"
+
+
+class SymbolIndex:
+    """持久化符号索引"""
+
+    def __init__(self, db_path: Optional[str] = None):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._initialized = False
+
+    def _connect(self):
+        conn = connect(self.db_path)
+        if not self._initialized:
+            with self._lock:
+                if not self._initialized:
+                    self._init_tables(conn)
+                    self._initialized = True
+        return conn
+
+    @staticmethod
+    def _init_tables(conn):
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS symbol_files (
+                id INTEGER PRIMARY KEY,
+                project TEXT NOT NULL,
+                path TEXT NOT NULL,
+                digest TEXT,
+                mtime_ns INTEGER,
+                size INTEGER,
+                error TEXT,
+                indexed_at REAL,
+                UNIQUE (project, path)
+            )
+        ''')
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS symbols (
+                file_id INTEGER NOT NULL,
+                name TEXT NOT NULL,
+                qualname TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                role TEXT NOT NULL,
+                line INTEGER NOT NULL,
+                col INTEGER NOT NULL
+            )
+        ''')
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_symbols_name ON symbols (role, name)")
+        # 查询以绑定参数指定角色，SQLite无法据此使用部分索引（WHERE role = 'def'），改为普通的复合索引
+        conn.execute("DROP INDEX IF EXISTS idx_symbols_qualname")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_symbols_role_qualname ON symbols (role, qualname)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_symbols_file ON symbols (file_id)")
+        conn.commit()
+
+    def update_project(self, project_path: str, file_paths: Sequence[str],
+                       max_workers: Optional[int] = None) -> Dict[str, Any]:
+        """增量更新项目索引：只解析变化的文件，并移除已不存在的文件"""
+        return self._update(project_path, file_paths, remove_missing=True, max_workers=max_workers)
+
+    def update_files(self, project_path: str, file_paths: Sequence[str]) -> Dict[str, Any]:
+        """更新项目中的部分文件（文件已删除时从索引中移除）"""
+        return self._update(project_path, file_paths, remove_missing=False, max_workers=1)
+
+    def _update(self, project_path: str, file_paths: Sequence[str], remove_missing: bool,
+                max_workers: Optional[int]) -> Dict[str, Any]:
+        started = time.monotonic()
+        stats = {"files": len(file_paths), "updated": 0, "unchanged": 0, "removed": 0, "failed": 0}
+        conn = self._connect()
+        try:
+            known = {path: (file_id, digest, (mtime_ns, size)) for file_id, path, digest, mtime_ns, size in conn.execute(
+                "SELECT id, path, digest, mtime_ns, size FROM symbol_files WHERE project = ?", (project_path,))}
+
+            tasks = []
+            removed = []
+            for file_path in file_paths:
+                entry = known.get(file_path)
+                try:
+                    stat = os.stat(file_path)
+                except OSError:
+                    if entry is not None:
+                        removed.append(entry[0])
+                    continue
+                if entry is not None and entry[2] == (stat.st_mtime_ns, stat.st_size):
+                    stats["unchanged"] += 1
+                else:
+                    tasks.append((file_path, entry[1] if entry else None))
+            if remove_missing:
+                current = set(file_paths)
+                removed.extend(entry[0] for path, entry in known.items() if path not in current)
+
+            results = parallel_map(_extract_file, tasks, max_workers)
+            now = time.time()
+            with conn:
+                for file_id in removed:
+                    conn.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+                    conn.execute("DELETE FROM symbol_files WHERE id = ?", (file_id,))
+                stats["removed"] = len(removed)
+                for file_path, signature, digest, symbols, error in results:
+                    if signature is None:
+                        stats["failed"] += 1
+                        continue
+                    entry = known.get(file_path)
+                    if symbols is None:
+                        # 只是修改时间变化，内容未变
+                        conn.execute("UPDATE symbol_files SET mtime_ns = ?, size = ? WHERE id = ?",
+                                     (signature[0], signature[1], entry[0]))
+                        stats["unchanged"] += 1
+                        continue
+                    if entry is not None:
+                        file_id = entry[0]
+                        conn.execute("DELETE FROM symbols WHERE file_id = ?", (file_id,))
+                        conn.execute('''
+                            UPDATE symbol_files SET digest = ?, mtime_ns = ?, size = ?, error = ?, indexed_at = ?
+                            WHERE id = ?
+                        ''', (digest, signature[0], signature[1], error, now, file_id))
+                    else:
+                        file_id = conn.execute('''
+                            INSERT INTO symbol_files (project, path, digest, mtime_ns, size, error, indexed_at)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)
+                        ''', (project_path, file_path, digest, signature[0], signature[1], error, now)).lastrowid
+                    conn.executemany('''
+                        INSERT INTO symbols (file_id, name, qualname, kind, role, line, col)
+                        VALUES (?, ?, ?, ?, ?, ?, ?)
+                    ''', [(file_id,) + tuple(symbol) for symbol in symbols])
+                    stats["updated"] += 1
+                    if error:
+                        stats["failed"] += 1
+        finally:
+            conn.close()
+        stats["seconds"] = round(time.monotonic() - started, 3)
+        return stats
+
+    def find_symbol(self, query: str, project_path: str = "", kind: str = "", exact: bool = False,
+                    limit: int = 50) -> Dict[str, Any]:
+        """查找定义：默认按名称前缀匹配，查询中包含 '.' 时按限定名匹配（如 Class.method）"""
+        column = "qualname" if "." in query else "name"
+        return self._query(column, query, ("def",), project_path, kind, exact, limit)
+
+    def find_references(self, name: str, project_path: str = "", prefix: bool = False,
+                        limit: int = 100) -> Dict[str, Any]:
+        """查找名称的引用和导入位置"""
+        return self._query("name", name, ("ref", "import"), project_path, "", not prefix, limit)
+
+    def _query(self, column: str, query: str, roles: Tuple[str, ...], project_path: str, kind: str,
+               exact: bool, limit: int) -> Dict[str, Any]:
+        if exact:
+            condition, params = f"s.{column} = ?", [query]
+        else:
+            condition, params = f"s.{column} >= ? AND s.{column} < ?", [query, query + _PREFIX_END]
+        sql = f'''
+            FROM symbols s JOIN symbol_files f ON f.id = s.file_id
+            WHERE s.role IN ({",".join("?" * len(roles))}) AND {condition}
+        '''
+        params = list(roles) + params
+        if project_path:
+            sql += " AND f.project = ?"
+            params.append(project_path)
+        if kind:
+            sql += " AND s.kind = ?"
+            params.append(kind)
+
+        conn = self._connect()
+        try:
+            total = conn.execute(f"SELECT COUNT(*) {sql}", params).fetchone()[0]
+            rows = conn.execute(f'''
+                SELECT s.name, s.qualname, s.kind, s.role, f.path, s.line, s.col {sql}
+                ORDER BY s.name, f.path, s.line, s.col LIMIT ?
+            ''', params + [limit]).fetchall()
+        finally:
+            conn.close()
+        return {
+            "query": query,
+            "total": total,
+            "results": [
+                {"name": name, "qualname": qualname, "kind": kind, "role": role, "file": path, "line": line,
+                 "column": col}
+                for name, qualname, kind, role, path, line, col in rows
+            ]
+        }
+
+    def status(self, project_path: str = "") -> Dict[str, Any]:
+        """索引规模统计"""
+        conn = self._connect()
+        try:
+            where, params = ("WHERE project = ?", (project_path,)) if project_path else ("", ())
+            files, failed = conn.execute(
+                f"SELECT COUNT(*), COUNT(error) FROM symbol_files {where}", params).fetchone()
+            symbols = conn.execute(f'''
+                SELECT COUNT(*) FROM symbols WHERE file_id IN (SELECT id FROM symbol_files {where})
+            ''', params).fetchone()[0]
+        finally:
+            conn.close()
+        return {"files": files, "failed_files": failed, "symbols": symbols}
@@ -0,0 +1,289 @@
+"""
+工作区监听模块
+
+监听工作区文件变化并在后台重新分析，使分析缓存和项目汇总保持最新。
+优先使用watchdog（Linux下基于inotify），不可用时退化为纯Python轮询。
+"""
+
+import heapq
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional, Tuple
+
+from src.tools.code_analyzer import CodeAnalyzer, is_ignored_dir
+
+# 尝试导入可选依赖
+watchdog_available = False
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+    watchdog_available = True
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+logger = logging.getLogger(__name__)
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """将watchdog事件转交给监听器"""
+
+    def __init__(self, watcher: "WorkspaceWatcher", root: str):
+        self.watcher = watcher
+        self.root = root
+
+    def on_any_event(self, event):
+        if event.is_directory:
+            return
+        if event.event_type == "deleted":
+            self.watcher.notify(self.root, event.src_path, deleted=True)
+        elif event.event_type == "moved":
+            self.watcher.notify(self.root, event.src_path, deleted=True)
+            self.watcher.notify(self.root, event.dest_path)
+        else:
+            self.watcher.notify(self.root, event.src_path)
+
+
+class WorkspaceWatcher:
+    """工作区监听器
+
+    文件变化事件先进入待处理队列，在静默期（debounce）内的重复事件会被合并；
+    后台线程按速率上限依次重新分析，并更新分析缓存与项目汇总。
+    """
+
+    def __init__(self, analyzer: CodeAnalyzer, debounce: float = 0.5, max_rate: float = 20.0,
+                 poll_interval: float = 2.0, use_native: bool = True):
+        self.analyzer = analyzer
+        self.debounce = debounce
+        self.max_rate = max_rate
+        self.poll_interval = poll_interval
+        self.use_native = use_native and watchdog_available
+        self._roots: Dict[str, Dict[str, Any]] = {}
+        self._pending: Dict[Tuple[str, str], Tuple[float, bool]] = {}
+        self._deadlines: List[Tuple[float, Tuple[str, str]]] = []
+        self._condition = threading.Condition()
+        self._worker: Optional[threading.Thread] = None
+        self._poller: Optional[threading.Thread] = None
+        self._observer = None
+        self._running = False
+        self.processed = 0
+
+    def watch(self, root: str) -> Dict[str, Any]:
+        """开始监听工作区根目录，并在后台完成首次全量分析"""
+        if not os.path.isdir(root):
+            return {"error": f"Project path not found: {root}"}
+
+        root = os.path.abspath(root)
+        with self._condition:
+            if root in self._roots:
+                return self._root_status(root)
+            self._start()
+            self._roots[root] = {"primed": False, "snapshot": {}, "mode": "native" if self.use_native else "polling"}
+            self._schedule((root, ""), time.monotonic(), False)
+
+        if self.use_native:
+            self._observer.schedule(_ChangeHandler(self, root), root, recursive=True)
+        return self._root_status(root)
+
+    def unwatch(self, root: str) -> Dict[str, Any]:
+        """停止监听工作区根目录"""
+        root = os.path.abspath(root)
+        with self._condition:
+            if self._roots.pop(root, None) is None:
+                return {"error": f"Path is not being watched: {root}"}
+            for key in [key for key in self._pending if key[0] == root]:
+                del self._pending[key]
+        if self.use_native and self._observer is not None:
+            # watchdog不支持按路径取消，重新调度剩余根目录
+            self._observer.unschedule_all()
+            for remaining in list(self._roots):
+                self._observer.schedule(_ChangeHandler(self, remaining), remaining, recursive=True)
+        return {"success": True, "root": root}
+
+    def is_primed(self, root: str) -> bool:
+        """工作区是否已完成首次分析"""
+        with self._condition:
+            state = self._roots.get(os.path.abspath(root))
+            return bool(state and state["primed"])
+
+    def notify(self, root: str, file_path: str, deleted: bool = False):
+        """记录文件变化，静默期内的重复事件会被合并"""
+        if not self._is_tracked(root, file_path):
+            return
+        with self._condition:
+            if root not in self._roots:
+                return
+            self._schedule((root, file_path), time.monotonic() + self.debounce, deleted)
+
+    def status(self) -> Dict[str, Any]:
+        """获取监听状态"""
+        with self._condition:
+            roots = list(self._roots)
+            pending = len(self._pending)
+        return {
+            "running": self._running,
+            "backend": "watchdog" if self.use_native else "polling",
+            "debounce_seconds": self.debounce,
+            "max_rate_per_second": self.max_rate,
+            "pending_changes": pending,
+            "processed_changes": self.processed,
+            "roots": [self._root_status(root) for root in roots],
+            "cache": self.analyzer.cache.get_stats()
+        }
+
+    def stop(self):
+        """停止全部监听"""
+        with self._condition:
+            self._running = False
+            self._roots.clear()
+            self._pending.clear()
+            self._deadlines.clear()
+            self._condition.notify_all()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+            self._observer = None
+        for thread in (self._worker, self._poller):
+            if thread is not None:
+                thread.join()
+        self._worker = None
+        self._poller = None
+
+    def _start(self):
+        if self._running:
+            return
+        self._running = True
+        self._worker = threading.Thread(target=self._process_loop, name="workspace-watcher", daemon=True)
+        self._worker.start()
+        if self.use_native:
+            self._observer = Observer()
+            self._observer.start()
+        else:
+            self._poller = threading.Thread(target=self._poll_loop, name="workspace-poller", daemon=True)
+            self._poller.start()
+
+    def _root_status(self, root: str) -> Dict[str, Any]:
+        state = self._roots.get(root, {})
+        aggregate = self.analyzer.get_project_aggregate(root)
+        return {
+            "root": root,
+            "mode": state.get("mode"),
+            "primed": state.get("primed", False),
+            "files_analyzed": len(aggregate) if aggregate else 0
+        }
+
+    def _is_tracked(self, root: str, file_path: str) -> bool:
+        if Path(file_path).suffix.lower() not in self.analyzer.supported_extensions:
+            return False
+        rel_parts = Path(os.path.relpath(file_path, root)).parts
+        return not any(is_ignored_dir(part) for part in rel_parts[:-1]) and not rel_parts[-1].startswith('.')
+
+    def _schedule(self, key: Tuple[str, str], deadline: float, deleted: bool):
+        # 调用方需持有锁；旧的截止时间留在堆中，出堆时按 _pending 校验后丢弃
+        self._pending[key] = (deadline, deleted)
+        heapq.heappush(self._deadlines, (deadline, key))
+        self._condition.notify()
+
+    def _next_due(self) -> Optional[Tuple[Tuple[str, str], bool]]:
+        """取出一个已过静默期的变更，没有时等待"""
+        with self._condition:
+            while self._running:
+                timeout = 1.0
+                while self._deadlines:
+                    deadline, key = self._deadlines[0]
+                    entry = self._pending.get(key)
+                    if entry is None or entry[0] != deadline:
+                        heapq.heappop(self._deadlines)
+                        continue
+                    timeout = deadline - time.monotonic()
+                    if timeout <= 0:
+                        heapq.heappop(self._deadlines)
+                        del self._pending[key]
+                        return key, entry[1]
+                    break
+                self._condition.wait(timeout=timeout)
+        return None
+
+    def _process_loop(self):
+        interval = 1.0 / self.max_rate if self.max_rate > 0 else 0.0
+        while True:
+            item = self._next_due()
+            if item is None:
+                return
+            (root, file_path), deleted = item
+            started = time.monotonic()
+            try:
+                if file_path:
+                    self._refresh_file(root, file_path, deleted)
+                else:
+                    self._prime(root)
+            except Exception as e:
+                logger.error(f"Background analysis failed for {file_path or root}: {e}")
+            self.processed += 1
+            # 速率限制：两次分析之间至少间隔 1/max_rate 秒
+            elapsed = time.monotonic() - started
+            if elapsed < interval:
+                time.sleep(interval - elapsed)
+
+    def _prime(self, root: str):
+        # 后台预热不记入质量历史，历史只记录用户发起的分析
+        self.analyzer.analyze_project(root, record_history=False)
+        snapshot = self._snapshot(root) if not self.use_native else {}
+        with self._condition:
+            if root in self._roots:
+                self._roots[root]["primed"] = True
+                self._roots[root]["snapshot"] = snapshot
+        logger.info(f"Workspace primed: {root}")
+
+    def _refresh_file(self, root: str, file_path: str, deleted: bool):
+        aggregate = self.analyzer.get_project_aggregate(root)
+        if deleted or not os.path.exists(file_path):
+            self.analyzer.cache.invalidate(file_path)
+            self.analyzer.import_cache.invalidate(file_path)
+            self.analyzer.fingerprint_cache.invalidate(file_path)
+            self.analyzer.line_cache.invalidate(file_path)
+            if aggregate is not None:
+                aggregate.remove(file_path)
+            self.analyzer.refresh_dependencies(root, file_path, deleted=True)
+            self.analyzer.refresh_clones(root, file_path, deleted=True)
+            self.analyzer.refresh_symbols(root, file_path)
+            return
+        result = self.analyzer.analyze_file(file_path)
+        if aggregate is not None:
+            aggregate.update(file_path, result)
+        self.analyzer.refresh_dependencies(root, file_path)
+        self.analyzer.refresh_clones(root, file_path)
+        self.analyzer.refresh_symbols(root, file_path)
+
+    def _snapshot(self, root: str) -> Dict[str, Tuple[int, int]]:
+        snapshot = {}
+        for file_path in self.analyzer.iter_code_files(root):
+            try:
+                stat = os.stat(file_path)
+            except OSError:
+                continue
+            snapshot[file_path] = (stat.st_mtime_ns, stat.st_size)
+        return snapshot
+
+    def _poll_loop(self):
+        while self._running:
+            time.sleep(self.poll_interval)
+            with self._condition:
+                roots = [root for root, state in self._roots.items() if state["primed"]]
+            for root in roots:
+                current = self._snapshot(root)
+                with self._condition:
+                    state = self._roots.get(root)
+                    if state is None:
+                        continue
+                    previous = state["snapshot"]
+                    state["snapshot"] = current
+                for file_path, signature in current.items():
+                    if previous.get(file_path) != signature:
+                        self.notify(root, file_path)
+                for file_path in previous.keys() - current.keys():
+                    self.notify(root, file_path, deleted=True)
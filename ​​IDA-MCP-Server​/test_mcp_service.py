@@ -4,10 +4,20 @@ MCP服务测试脚本
 
 import sys
 import os
+import sqlite3
+import subprocess
+import tempfile
 sys.path.append('.')
 
 from src.tools.code_analyzer import CodeAnalyzer
+from src.tools.issues import DEFAULT_DETAIL_CAP, page_issues
+from src.tools.line_counter import count_lines
+from src.tools.quality_history import QualityHistory
+from src.tools.symbol_index import SymbolIndex
+from src.tools import worker_pool
+from src.tools.worker_pool import Quarantine, WorkerPool, WorkerTimeout, WorkerUnavailable
 import json
+import time
 
 
 def test_code_analyzer():
@@ -36,12 +46,455 @@ def test_main_py_analysis():
     print(json.dumps(result, indent=2, ensure_ascii=False))
 
 
+def test_analysis_cache():
+    """测试分析结果缓存与项目汇总"""
+    print("\n🗃️ 测试分析缓存:")
+    
+    analyzer = CodeAnalyzer()
+    first = analyzer.analyze_code_quality("test_example.py")
+    second = analyzer.analyze_code_quality("test_example.py")
+    print(f"✅ 结果一致: {first == second}")
+    print(f"✅ 缓存统计: {analyzer.cache.get_stats()}")
+    assert first == second
+    assert analyzer.cache.get_stats()["hits"] >= 1
+    
+    summary = analyzer.analyze_project(".")
+    print(f"✅ 项目汇总: {summary['files_analyzed']} 个文件, {summary['total_lines_of_code']} 行代码")
+    assert summary["files_analyzed"] > 0
+    
+    # 内存中的文本与同内容的文件共用缓存
+    with open("test_example.py", encoding="utf-8") as f:
+        text = f.read()
+    buffers = analyzer.analyze_buffers([
+        {"name": "unsaved.py", "text": text},
+        {"name": "edited.js", "text": "function f() { eval(x); }\n"},
+        {"name": "notes.txt", "text": ""},
+        {"text": "x = 1"}
+    ])
+    print(f"✅ 文本分析: {buffers['cache']}")
+    assert buffers["results"][0]["file_path"] == "unsaved.py"
+    assert buffers["results"][0]["quality_score"] == first["quality_score"]
+    assert buffers["results"][1]["language"] == "javascript/typescript"
+    assert buffers["cache"] == {"buffers": 4, "cached": 1, "analyzed": 1, "failed": 2}
+
+
+def test_line_counter():
+    """测试代码行统计（空行、注释、文档字符串与块注释）"""
+    print("\n📏 测试代码行统计:")
+    
+    python_source = b'"""module doc\n\nmore\n"""\nx = """\ntext\n"""\n\n# comment\ny = 1  # trailing\n'
+    counts = count_lines(python_source, ".py")
+    print(f"✅ Python: {counts}")
+    assert (counts["total"], counts["blank"], counts["comment"], counts["code"]) == (10, 2, 4, 4)
+    c_source = b"/* a\n * b\n */\nint x; /* c\nd */ int y;\n// e\n  \n"
+    counts = count_lines(c_source, ".js")
+    assert (counts["blank"], counts["comment"], counts["code"]) == (1, 4, 2)
+    
+    project = tempfile.mkdtemp()
+    with open(os.path.join(project, "a.py"), "wb") as f:
+        f.write(python_source)
+    with open(os.path.join(project, "b.js"), "wb") as f:
+        f.write(c_source)
+    analyzer = CodeAnalyzer()
+    structure = analyzer.analyze_project_structure(project)
+    assert structure["lines"]["totals"] == {"files": 2, "total": 17, "blank": 3, "comment": 8, "code": 6}
+    assert structure["lines"]["by_language"]["Python"]["code"] == 4
+    # 未变化的文件直接命中缓存
+    assert analyzer.analyze_project_structure(project)["lines"]["cache"]["cached"] == 2
+
+
+def test_dependency_graph():
+    """测试依赖图、循环依赖与影响范围"""
+    print("\n🕸️ 测试依赖分析:")
+    
+    project = tempfile.mkdtemp()
+    os.makedirs(os.path.join(project, "pkg"))
+    files = {
+        "pkg/__init__.py": "",
+        "pkg/a.py": "from . import b\nimport requests\n",
+        "pkg/b.py": "from pkg.a import value\n",
+        "main.py": "import pkg.b\n",
+        "web/app.ts": "import { util } from './util';\nimport React from 'react';\n",
+        "web/util.ts": "export const util = 1;\n"
+    }
+    for path, content in files.items():
+        os.makedirs(os.path.dirname(os.path.join(project, path)), exist_ok=True)
+        with open(os.path.join(project, path), "w") as f:
+            f.write(content)
+    
+    analyzer = CodeAnalyzer()
+    summary = analyzer.analyze_dependencies(project)
+    print(f"✅ 循环依赖: {summary['cycles']}, 外部依赖: {summary['external_packages']}")
+    assert summary["cycles"] == [["pkg/a.py", "pkg/b.py"]]
+    assert set(summary["external_packages"]) == {"requests", "react"}
+    
+    report = analyzer.analyze_dependencies(project, "web/util.ts")
+    assert report["imported_by"] == ["web/app.ts"]
+    report = analyzer.analyze_dependencies(project, "pkg/a.py")
+    assert [item["file"] for item in report["impact"]["files"]] == ["pkg/b.py", "main.py"]
+    print(f"✅ pkg/a.py 影响范围: {report['impact']['count']} 个文件")
+
+
+def test_git_revisions():
+    """测试按git版本分析与版本对比"""
+    print("\n🕰️ 测试版本对比:")
+    
+    repo = tempfile.mkdtemp()
+    
+    def commit(files, message):
+        for path, content in files.items():
+            with open(os.path.join(repo, path), "w") as f:
+                f.write(content)
+        subprocess.run(["git", "add", "-A"], cwd=repo, check=True)
+        subprocess.run(["git", "-c", "user.name=test", "-c", "user.email=test@example.com",
+                        "commit", "-q", "-m", message], cwd=repo, check=True)
+    
+    subprocess.run(["git", "init", "-q"], cwd=repo, check=True)
+    commit({"app.py": "def main():\n    return 1\n", "util.py": "X = 1\n"}, "first")
+    commit({"app.py": "def main():\n    return eval(input())\n", "new.py": "Y = 2\n"}, "second")
+    
+    analyzer = CodeAnalyzer()
+    try:
+        old = analyzer.analyze_file_at_revision(os.path.join(repo, "app.py"), "HEAD~1")
+        assert old["quality_score"] == 100 and old["commit"]
+        result = analyzer.compare_revisions(repo, "HEAD~1", "HEAD")
+        print(f"✅ 文件变化: {result['files']}, 质量评分变化: {result['delta']['average_quality_score']}")
+        assert result["files"] == {"added": 1, "removed": 0, "modified": 1, "unchanged": 1}
+        assert result["changed_files"][0]["file_path"] == "app.py"
+        assert result["changed_files"][0]["quality_score"]["delta"] < 0
+        # 未变化的文件和已分析过的版本直接命中缓存
+        assert result["cache"]["cached"] >= 2
+        assert "error" in analyzer.analyze_project_at_revision(repo, "no-such-branch")
+        # 同一仓库中的文件共用一个仓库对象（一个常驻的 cat-file 进程）
+        assert "error" not in analyzer.analyze_file_at_revision(os.path.join(repo, "util.py"), "HEAD")
+        assert len(analyzer.git_repositories) == 1
+    finally:
+        analyzer.close()
+
+
+def test_quality_history():
+    """测试质量历史记录、趋势与压缩"""
+    print("\n📈 测试质量历史:")
+    
+    project = tempfile.mkdtemp()
+    with open(os.path.join(project, "a.py"), "w") as f:
+        f.write("def f():\n    return 1\n")
+    with open(os.path.join(project, "b.py"), "w") as f:
+        f.write("X = 1\n")
+    
+    analyzer = CodeAnalyzer()
+    history = QualityHistory(os.path.join(project, "history.db"))
+    analyzer.quality_history = history
+    def samples(path):
+        return sum(point["samples"] for point in analyzer.quality_history_for(path).get("points", ()))
+    
+    # 后台预热不记录历史；重复分析未变化的项目只记录一次
+    analyzer.analyze_project(project, record_history=False)
+    assert samples(project) == 0
+    analyzer.analyze_project(project)
+    analyzer.analyze_project(project)
+    assert samples(os.path.join(project, "b.py")) == 1 and samples(project) == 1
+    with open(os.path.join(project, "b.py"), "a") as f:
+        f.write("Y = 2\n")
+    analyzer.analyze_project(project)
+    assert samples(project) == 2 and samples(os.path.join(project, "a.py")) == 1
+    
+    # 按时间回填：十天前质量较高，之后 a.py 引入问题
+    now = time.time()
+    day = 86400
+    metrics = {"files": 2, "lines_of_code": 3, "complexity_score": 1, "issues": 0, "quality_score": 100}
+    history.record("/backfilled", metrics, {"a.py": metrics}, "c1", now - 10 * day)
+    worse = dict(metrics, issues=3, quality_score=70)
+    history.record("/backfilled", worse, {"a.py": worse}, "c2", now - day)
+    report = history.report("/backfilled", now=now)
+    print(f"✅ 7天趋势: {report['trends']['7d']}")
+    assert report["trends"]["7d"]["quality_score"] < 0
+    assert report["regressions_7d"][0]["file_path"] == "a.py"
+    
+    # 压缩后趋势仍可由汇总记录计算
+    compacted = history.compact(now=now + 400 * day)
+    assert compacted["raw_samples_compacted"] > 0
+    points = history.history("/backfilled", "a.py", max_points=10)["points"]
+    assert sum(point["samples"] for point in points) == 2
+    assert history.report("/backfilled", now=now)["current"]["quality_score"] == 70
+    assert "error" in analyzer.quality_report_for(tempfile.mkdtemp())
+
+
+def test_worker_isolation():
+    """测试隔离模式：超时、内存超限与隔离表"""
+    print("\n🧯 测试隔离执行:")
+    
+    analyzer = CodeAnalyzer(isolated=True)
+    analyzer.quarantine = Quarantine(os.path.join(tempfile.mkdtemp(), "quarantine.db"))
+    analyzer.worker_pool = WorkerPool(max_workers=1, timeout=5, memory_limit=200 * 1024 * 1024)
+    try:
+        assert analyzer.analyze_text("def f():\n    return 1\n", "ok.py")["quality_score"] == 100
+        try:
+            analyzer.worker_pool.call("time:sleep", 2, timeout=0.5)
+            assert False, "expected timeout"
+        except WorkerTimeout:
+            pass
+        
+        # 展开后超出内存限制的生成代码：工作进程被结束，内容被隔离且不再重试
+        generated = "x = [" + "1," * 2000000 + "]\n"
+        first = analyzer.analyze_text(generated, "generated.py")
+        second = analyzer.analyze_text(generated, "generated.py")
+        print(f"✅ 隔离结果: {first['error']} / {second['error']}")
+        assert first["quarantined"] and second["error"].startswith("Quarantined")
+        status = analyzer.list_quarantine()
+        assert status["workers"]["crashes"] == 1 and status["workers"]["timeouts"] == 1
+        assert status["quarantined"][0]["file_path"] == "generated.py"
+        
+        # 工作进程重新启动后继续服务
+        assert analyzer.analyze_text("y = 2\n", "after.py")["quality_score"] == 100
+        
+        # 目标无法导入、进程池已关闭等与内容无关的失败不隔离，改为在当前进程中分析
+        try:
+            analyzer.worker_pool.call("no_such_module:run")
+            assert False, "expected unavailable"
+        except WorkerUnavailable:
+            pass
+        analyzer.worker_pool.close()
+        assert analyzer.analyze_text("z = 3\n", "closed.py")["quality_score"] == 100
+        assert len(analyzer.list_quarantine()["quarantined"]) == 1
+        assert analyzer.release_quarantine("generated.py") == {"released": 1}
+    finally:
+        analyzer.close()
+    
+    # 启动工作进程时的任何异常都归还名额，之后的调用不会一直等待
+    def broken_worker(memory_limit):
+        raise AssertionError("pass_fds not supported on Windows.")
+    
+    pool = WorkerPool(max_workers=1)
+    original = worker_pool._Worker
+    worker_pool._Worker = broken_worker
+    try:
+        for _ in range(3):
+            try:
+                pool.call("time:sleep", 0)
+                assert False, "expected start failure"
+            except AssertionError as e:
+                assert "pass_fds" in str(e)
+    finally:
+        worker_pool._Worker = original
+        pool.close()
+
+
+def test_security_rules():
+    """测试安全规则引擎与check_security"""
+    print("\n🛡️ 测试安全扫描:")
+    
+    project = tempfile.mkdtemp()
+    with open(os.path.join(project, "db.py"), "w") as f:
+        f.write(
+            "import subprocess as sp\n"
+            "def run(cursor, name):\n"
+            "    sp.call(name, shell=True)\n"
+            "    cursor.execute(f\"SELECT * FROM users WHERE name = '{name}'\")\n"
+            "    cursor.execute(\"SELECT * FROM users WHERE name LIKE ?\", [f'%{name}%'])\n"
+        )
+    with open(os.path.join(project, "view.js"), "w") as f:
+        f.write("el.innerHTML = input;\nconsole.log(input);\n")
+    rules_file = os.path.join(project, "rules.json")
+    with open(rules_file, "w") as f:
+        json.dump([{"id": "CUSTOM1", "pattern": r"\bTODO_SECURITY\b", "message": "Custom rule"}], f)
+    with open(os.path.join(project, "notes.py"), "w") as f:
+        f.write("# TODO_SECURITY: review\n")
+    
+    analyzer = CodeAnalyzer()
+    result = analyzer.check_security(project, min_severity="warning")
+    rules = {(item["file"], item["line"], item["rule"]) for item in result["findings"]}
+    print(f"✅ 发现问题: {result['by_rule']}")
+    assert rules == {("db.py", 3, "SEC204"), ("db.py", 4, "SEC210"), ("view.js", 1, "SEC103")}
+    
+    result = analyzer.check_security(project, rules_file=rules_file)
+    assert result["by_rule"]["CUSTOM1"] == 1 and result["by_rule"]["LINT101"] == 1
+    print(f"✅ 自定义规则: {result['by_rule']['CUSTOM1']} 处")
+    
+    # 修改规则文件后重新加载；全局内联标志 (?i) 同样作用于预筛选锚点
+    with open(os.path.join(project, "settings.py"), "w") as f:
+        f.write("PASSWORD = 1\n")
+    with open(rules_file, "w") as f:
+        json.dump([{"id": "CUSTOM2", "pattern": r"(?i)password\s*=", "message": "Password assignment"}], f)
+    result = analyzer.check_security(project, rules_file=rules_file)
+    assert result["by_rule"].get("CUSTOM2") == 1 and "CUSTOM1" not in result["by_rule"]
+
+
+def test_issue_limits():
+    """测试大量同类问题的计数、明细上限与分页"""
+    print("\n📉 测试问题明细上限:")
+    
+    # 模拟压缩/生成的文件：每行既超长又包含console.log
+    generated = "".join(f"console.log('{'x' * 130}', {i});\n" for i in range(5000))
+    analyzer = CodeAnalyzer()
+    result = analyzer.analyze_text(generated, "bundle.min.js")
+    counts = {rule: entry["count"] for rule, entry in result["issue_counts"].items()}
+    print(f"✅ 问题总数: {result['total_issues']}, 返回明细: {len(result['issues'])}, 评分: {result['quality_score']}")
+    assert counts == {"LINT001": 5000, "LINT101": 5000} and result["total_issues"] == 10000
+    assert len(result["issues"]) == 2 * DEFAULT_DETAIL_CAP
+    assert result["issues_omitted"] == 10000 - 2 * DEFAULT_DETAIL_CAP
+    assert result["issues"][0]["line"] == 1 and result["issues"][-1]["line"] == DEFAULT_DETAIL_CAP
+    assert 0 < result["quality_score"] < 100
+    
+    page = page_issues(result, offset=5, limit=3, rule="LINT001")
+    assert [issue["line"] for issue in page["issues"]] == [6, 7, 8] and page["issues_page"]["has_more"]
+    assert page_issues(result, min_severity="warning")["issues_page"]["matched"] == DEFAULT_DETAIL_CAP
+    # 超出保留明细的页为空，但分页信息说明还有多少问题没有明细
+    beyond = page_issues(result, offset=DEFAULT_DETAIL_CAP, limit=10, rule="LINT001")["issues_page"]
+    assert beyond["returned"] == 0 and not beyond["has_more"]
+    assert beyond["matched_total"] == 5000 and beyond["omitted"] == 5000 - DEFAULT_DETAIL_CAP
+    
+    project = tempfile.mkdtemp()
+    with open(os.path.join(project, "bundle.js"), "w") as f:
+        f.write(generated)
+    scan = analyzer.check_security(project)
+    assert scan["findings_count"] == 5000 and len(scan["findings"]) == DEFAULT_DETAIL_CAP
+    print(f"✅ 安全扫描: {scan['findings_count']} 处, 省略明细 {scan['findings_omitted']} 处")
+
+
+def test_clone_detection():
+    """测试重复代码检测与增量更新"""
+    print("\n🧬 测试重复代码检测:")
+    
+    body = "\n".join(f"    total = total + values[{i}] * weights[{i}]" for i in range(8))
+    project = tempfile.mkdtemp()
+    files = {
+        "a.py": f"def score(values, weights):\n    total = 0\n{body}\n    return total\n",
+        "b.py": f"def rank(items, factors):\n    total = 0\n{body.replace('values', 'items')}\n    return total\n",
+        "c.py": "def unrelated():\n    return 42\n"
+    }
+    for path, content in files.items():
+        with open(os.path.join(project, path), "w") as f:
+            f.write(content)
+    
+    analyzer = CodeAnalyzer()
+    summary = analyzer.detect_clones(project, min_tokens=30)
+    print(f"✅ 克隆类: {summary['clone_classes_count']}, 重复行比例: {summary['duplication_ratio']}")
+    assert summary["clone_classes_count"] == 1
+    assert {item["file"] for item in summary["clone_classes"][0]["fragments"]} == {"a.py", "b.py"}
+    
+    # 修改文件后只替换该文件的指纹
+    with open(os.path.join(project, "b.py"), "w") as f:
+        f.write(files["c.py"])
+    analyzer.refresh_clones(project, os.path.join(project, "b.py"))
+    report = analyzer.detect_clones(project, "a.py", reuse=True, min_tokens=30)
+    assert all(item["file"] == "a.py" for pair in report["clone_pairs"] for item in pair["fragments"])
+    print("✅ 增量更新后 a.py 与 b.py 不再重复")
+
+
+def test_symbol_index():
+    """测试符号索引的前缀查询与增量更新"""
+    print("\n🔎 测试符号索引:")
+    
+    project = tempfile.mkdtemp()
+    with open(os.path.join(project, "shapes.py"), "w") as f:
+        f.write("class Shape:\n    def area(self):\n        return 0\n\ndef area_of(shape):\n    return shape.area()\n")
+    with open(os.path.join(project, "app.js"), "w") as f:
+        f.write("import { area_of } from './shapes';\nfunction render() { return area_of(1); }\n")
+    
+    analyzer = CodeAnalyzer()
+    analyzer.symbol_index = SymbolIndex(os.path.join(project, "index.db"))
+    result = analyzer.find_symbol("area", project)
+    assert {item["qualname"] for item in result["results"]} == {"Shape.area", "area_of"}
+    assert analyzer.find_symbol("Shape.ar", project)["total"] == 1
+    # 限定名查询（角色为绑定参数）使用 (role, qualname) 索引
+    with sqlite3.connect(os.path.join(project, "index.db")) as conn:
+        plan = conn.execute("EXPLAIN QUERY PLAN SELECT name FROM symbols WHERE role IN (?) "
+                            "AND qualname >= ? AND qualname < ?", ("def", "Shape.ar", "Shape.ar￿")).fetchall()
+    assert "idx_symbols_role_qualname" in str(plan)
+    refs = analyzer.find_references("area_of", project)
+    assert {(os.path.basename(item["file"]), item["role"]) for item in refs["results"]} == {
+        ("app.js", "import"), ("app.js", "ref")}
+    print(f"✅ 前缀查询 'area': {result['total']} 个定义, area_of 引用 {refs['total']} 处")
+    
+    # 只重新解析变化的文件
+    with open(os.path.join(project, "app.js"), "a") as f:
+        f.write("const total = area_of(2);\n")
+    stats = analyzer.index_symbols(project)
+    assert stats["updated"] == 1 and stats["unchanged"] == 1
+    assert analyzer.find_references("area_of", project)["total"] == 3
+    print(f"✅ 增量更新: {stats}")
+
+
+def test_job_queue():
+    """测试后台分析任务：提交、轮询、取消，以及中断次数上限"""
+    print("\n⏳ 测试后台任务...")
+    
+    import main
+    from src.tools.job_queue import JobQueue
+    
+    project = tempfile.mkdtemp()
+    with open(os.path.join(project, "app.py"), "w", encoding="utf-8") as f:
+        f.write("def area(r):\n    return 3.14 * r * r\n")
+    db_path = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    
+    def make_queue(**kwargs):
+        queue = JobQueue(db_path, **kwargs)
+        queue.register("analyze_project", main._run_analyze_project_job)
+        queue.register("analyze_project_structure", main._run_project_structure_job)
+        return queue
+    
+    def wait_for(job_id, statuses):
+        for _ in range(100):
+            status = json.loads(main.get_job_status(job_id))
+            if status["status"] in statuses:
+                break
+            time.sleep(0.1)
+        return status
+    
+    saved = main.job_queue
+    main.job_queue = queue = make_queue()
+    try:
+        # 队列未启动时任务保持排队，可直接取消
+        job = json.loads(main.submit_project_analysis(project))
+        assert job["status"] == "queued"
+        assert json.loads(main.cancel_job(job["id"]))["status"] == "cancelled"
+        
+        queue.start()
+        job = json.loads(main.submit_project_analysis(project))
+        status = wait_for(job["id"], ("completed", "failed"))
+        print(f"✅ 任务状态: {status['status']}, 进度: {status['progress']}/{status['total']}")
+        assert status["status"] == "completed" and status["result"]["files_analyzed"] == 1
+        assert json.loads(main.get_job_resource(job["id"]))["result"] == status["result"]
+        assert "not found" in json.loads(main.get_job_status("missing"))["error"]
+        queue.stop(timeout=5)
+        
+        # 模拟服务进程在任务执行中退出：所属进程已不存在，执行次数未达上限的重新排队，达到上限的标记为失败
+        stale = [json.loads(main.submit_project_analysis(project, structure_only=True))["id"] for _ in range(2)]
+        conn = sqlite3.connect(db_path)
+        conn.executemany("UPDATE jobs SET status = 'running', owner_pid = ?, attempts = ? WHERE id = ?",
+                         [(os.getpid(), 1, stale[0]), (os.getpid(), 3, stale[1])])
+        conn.commit()
+        conn.close()
+        main.job_queue = queue = make_queue(max_attempts=3)
+        queue.start()
+        resumed = wait_for(stale[0], ("completed", "failed"))
+        abandoned = json.loads(main.get_job_status(stale[1]))
+        print(f"✅ 中断的任务: {resumed['status']} / {abandoned['status']}: {abandoned['error']}")
+        assert resumed["status"] == "completed" and resumed["attempts"] == 2
+        assert abandoned["status"] == "failed" and "Interrupted 3 times" in abandoned["error"]
+    finally:
+        queue.stop(timeout=5)
+        main.job_queue = saved
+
+
 if __name__ == "__main__":
     print("🚀 开始测试智能开发助手MCP服务")
     print("=" * 50)
     
     test_code_analyzer()
     test_main_py_analysis()
+    test_analysis_cache()
+    test_line_counter()
+    test_dependency_graph()
+    test_git_revisions()
+    test_quality_history()
+    test_worker_isolation()
+    test_security_rules()
+    test_issue_limits()
+    test_clone_detection()
+    test_symbol_index()
+    test_job_queue()
     
     print("\n✅ 测试完成!")
     print("\n💡 使用方法:")
@@ -49,4 +502,6 @@ if __name__ == "__main__":
     print("2. 连接AI助手，使用以下工具:")
     print("   - analyze_code(file_path): 分析代码质量")
     print("   - analyze_project_structure(project_path): 分析项目结构")
-    print("   - calculate_complexity(file_path): 计算复杂度")
\ No newline at end of file
+    print("   - calculate_complexity(file_path): 计算复杂度")
+    print("   - analyze_project(project_path): 汇总项目质量指标")
+    print("   - watch_workspace(project_path): 监听工作区并保持分析结果最新")
\ No newline at end of file
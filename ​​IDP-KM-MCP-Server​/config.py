@@ -18,7 +18,39 @@ DOCUMENT_CONFIG = {
     "supported_extensions": [".txt", ".pdf", ".docx", ".doc"],
     "encoding_fallbacks": ["utf-8", "gbk", "gb2312", "latin-1"],
     "max_keywords": 20,
-    "max_summary_sentences": 5
+    "max_summary_sentences": 5,
+    "summary_chunk_sentences": 200,  # TextRank单次排序的句子数上限，超过时分块排序后合并
+    "summary_max_input_sentences": 5000,  # 每篇文档参与摘要排序的句子数上限
+    # 隔离模式（默认关闭）：文本提取在受监管的工作进程中执行，超时或内存超限的文件被隔离，不再重试
+    "isolate_extraction": False,
+    "extraction_workers": 2,
+    "extraction_timeout": 120.0,  # 单个文件的提取时间上限（秒）
+    "extraction_memory_mb": 2048  # 工作进程的内存上限（resource.setrlimit）
+}
+
+# 语义检索配置（本地哈希n-gram向量，无需联网）
+SEMANTIC_CONFIG = {
+    "vectors_dir": "",  # 向量文件目录，为空时与数据库同目录
+    "dim": 1024,  # 向量维度（2的幂），修改后旧索引会被清空，服务启动时在后台重建
+    "chunk_size": 1000,  # 分块长度（字符）
+    "chunk_overlap": 150,
+    "nprobe": 8  # 构建IVF索引后，检索时探查的聚类数
+}
+
+# 分词配置（jieba）
+TOKENIZER_CONFIG = {
+    "dictionary": "",  # 主词典路径，为空时使用jieba自带词典
+    "user_dicts": [],  # 自定义词典路径列表（jieba用户词典格式：词 [词频] [词性]）
+    "stopwords_files": [],  # 关键词提取的停用词表路径列表（每行一个词）
+    "cache_file": "",  # 合并自定义词典后的词典缓存文件，多个进程共用；为空时使用临时目录
+    "segment_cache_entries": 4096  # 缓存分词结果的文本行数，为0时不缓存
+}
+
+# 检索结果缓存配置（数据写入后缓存自动失效）
+QUERY_CACHE_CONFIG = {
+    "max_entries": 1024,
+    "max_bytes": 16 * 1024 * 1024,
+    "ttl": 300.0  # 秒
 }
 
 # 服务器配置
@@ -26,7 +58,12 @@ SERVER_CONFIG = {
     "name": "DocumentProcessor",
     "version": "1.0.0",
     "description": "智能文档处理与知识管理MCP服务器",
-    "transport": "stdio"  # 可选: stdio, sse
+    "transport": "stdio",  # 可选: stdio, sse, streamable-http
+    # 以下配置用于共享服务模式（sse / streamable-http）：多个客户端会话共用一个常驻进程
+    "host": "127.0.0.1",
+    "port": 8765,
+    "max_concurrency": 8,  # 同时执行的工具调用数量上限
+    "warm_on_start": True  # 启动时预加载分词词典（含自定义词典和停用词表），避免首个请求承担冷启动开销
 }
 
 # 日志配置
@@ -63,6 +100,12 @@ def get_config(section: str = None):
         return DATABASE_CONFIG
     elif section == "document":
         return DOCUMENT_CONFIG
+    elif section == "semantic":
+        return SEMANTIC_CONFIG
+    elif section == "cache":
+        return QUERY_CACHE_CONFIG
+    elif section == "tokenizer":
+        return TOKENIZER_CONFIG
     elif section == "server":
         return SERVER_CONFIG
     elif section == "logging":
@@ -75,6 +118,9 @@ def get_config(section: str = None):
         return {
             "database": DATABASE_CONFIG,
             "document": DOCUMENT_CONFIG,
+            "semantic": SEMANTIC_CONFIG,
+            "cache": QUERY_CACHE_CONFIG,
+            "tokenizer": TOKENIZER_CONFIG,
             "server": SERVER_CONFIG,
             "logging": LOGGING_CONFIG,
             "features": FEATURES,
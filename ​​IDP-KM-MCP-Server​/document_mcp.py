@@ -6,9 +6,13 @@
 """
 
 import os
+import csv
 import json
 import hashlib
 import sqlite3
+import functools
+import threading
+import logging
 from datetime import datetime
 from pathlib import Path
 from typing import List, Dict, Any, Optional
@@ -22,6 +26,20 @@ except ImportError:
     print("错误：无法导入 FastMCP，请确保已安装 fastmcp")
     sys.exit(1)
 
+import anyio
+
+from config import DATABASE_CONFIG, DOCUMENT_CONFIG, QUERY_CACHE_CONFIG, SEMANTIC_CONFIG, SERVER_CONFIG, TOKENIZER_CONFIG
+from job_queue import JobQueue, JobContext, JOB_STATUSES
+from minhash import MinHasher, group_pairs
+from file_hashing import FileHashError, hash_file, iter_file_hashes, is_legacy_hash
+from semantic_index import SemanticIndex, SOURCES as SEMANTIC_SOURCES
+from tokenizer import TextTokenizer
+from summarizer import TextRankSummarizer
+from query_cache import QueryCache, normalize_query
+from extractors import extract_docx, extract_pdf, extract_text, extract_txt
+from text_reader import ExtractionError
+from worker_pool import WorkerCrash, WorkerPool, WorkerTimeout, WorkerUnavailable
+
 try:
     from mcp.types import TextContent, ImageContent, EmbeddedResource
 except ImportError:
@@ -30,23 +48,9 @@ except ImportError:
     ImageContent = str
     EmbeddedResource = str
 
-# 尝试导入可选依赖
-pdf_available = False
-docx_available = False
+# 尝试导入可选依赖（PDF和DOCX解析库在 extractors 中导入）
 jieba_available = False
 
-try:
-    import PyPDF2
-    pdf_available = True
-except ImportError:
-    PyPDF2 = None
-
-try:
-    from docx import Document
-    docx_available = True
-except ImportError:
-    Document = None
-
 try:
     import jieba
     import jieba.analyse
@@ -54,17 +58,351 @@ try:
 except ImportError:
     jieba = None
 
-# 创建MCP服务器
-mcp = FastMCP("DocumentProcessor")
+logger = logging.getLogger(__name__)
+
+SUPPORTED_TRANSPORTS = ("stdio", "sse", "streamable-http")
+
+# 创建MCP服务器（host/port 仅在共享服务模式下生效）
+mcp = FastMCP(
+    SERVER_CONFIG.get("name", "DocumentProcessor"),
+    host=SERVER_CONFIG.get("host", "127.0.0.1"),
+    port=SERVER_CONFIG.get("port", 8765)
+)
+
+# 工具调用的并发上限，在事件循环中首次使用时创建
+_tool_limiter: Optional[anyio.CapacityLimiter] = None
+
+def mcp_tool(*args, **kwargs):
+    """注册MCP工具，同步实现放到工作线程执行
+    
+    FastMCP会在事件循环中直接调用同步工具，共享服务模式下一个耗时调用会阻塞所有会话；
+    这里注册一个异步包装，被装饰的函数本身保持不变，仍可在模块内直接调用。
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def run_in_thread(*call_args, **call_kwargs):
+            global _tool_limiter
+            if _tool_limiter is None:
+                _tool_limiter = anyio.CapacityLimiter(SERVER_CONFIG.get("max_concurrency", 8))
+            return await anyio.to_thread.run_sync(
+                functools.partial(fn, *call_args, **call_kwargs), limiter=_tool_limiter
+            )
+        mcp.tool(*args, **kwargs)(run_in_thread)
+        return fn
+    return decorator
 
 # 数据库初始化
-DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "documents.db")
+DB_PATH = DATABASE_CONFIG.get("path", "documents.db")
+if not os.path.isabs(DB_PATH):
+    DB_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), DB_PATH)
+
+def connect_db() -> sqlite3.Connection:
+    """打开数据库连接"""
+    return sqlite3.connect(DB_PATH, timeout=DATABASE_CONFIG.get("timeout", 30.0))
+
+# 语义检索向量索引（向量文件默认与数据库同目录）
+semantic_index = SemanticIndex(
+    SEMANTIC_CONFIG.get("vectors_dir") or os.path.dirname(DB_PATH),
+    dim=SEMANTIC_CONFIG.get("dim", 1024),
+    chunk_size=SEMANTIC_CONFIG.get("chunk_size", 1000),
+    chunk_overlap=SEMANTIC_CONFIG.get("chunk_overlap", 150)
+)
+
+def _config_path(path: str) -> str:
+    """配置中的相对路径按脚本所在目录解析"""
+    if path and not os.path.isabs(path):
+        path = os.path.join(os.path.dirname(os.path.abspath(__file__)), path)
+    return path
+
+# 全文索引和关键词提取共用的分词器（有jieba时中文分词，否则按字符三元组切分）
+text_tokenizer = TextTokenizer(
+    dictionary=_config_path(TOKENIZER_CONFIG.get("dictionary", "")),
+    user_dicts=[_config_path(path) for path in TOKENIZER_CONFIG.get("user_dicts", [])],
+    stopwords_files=[_config_path(path) for path in TOKENIZER_CONFIG.get("stopwords_files", [])],
+    cache_file=_config_path(TOKENIZER_CONFIG.get("cache_file", "")),
+    segment_cache_entries=TOKENIZER_CONFIG.get("segment_cache_entries", 4096)
+)
+
+# 全文索引表及其建立索引的文本来源
+FULLTEXT_TABLES = {
+    "documents": ("documents_fts", "content"),
+    "knowledge_base": ("knowledge_fts", "title || char(10) || content")
+}
+
+# SQLite是否支持FTS5，不支持时检索退回 LIKE 匹配
+fulltext_available = False
+
+def _init_fulltext_index(cursor: sqlite3.Cursor) -> bool:
+    """创建全文索引表；分词器变化（如安装或卸载jieba）时重建索引"""
+    cursor.execute("CREATE TABLE IF NOT EXISTS index_meta (name TEXT PRIMARY KEY, value TEXT)")
+    cursor.execute("SELECT value FROM index_meta WHERE name = 'fulltext_tokenizer'")
+    row = cursor.fetchone()
+    rebuild = row is None or row[0] != text_tokenizer.name
+    try:
+        for source, (table, _) in FULLTEXT_TABLES.items():
+            if rebuild:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            # 无内容表：只保存倒排索引，rowid 与源表 id 对应
+            cursor.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5(body, content='')")
+    except sqlite3.OperationalError as e:
+        logger.warning(f"FTS5 not available, search falls back to LIKE: {e}")
+        return False
+    
+    if rebuild:
+        for source, (table, text_sql) in FULLTEXT_TABLES.items():
+            cursor.execute(f"SELECT id, {text_sql} FROM {source} WHERE content IS NOT NULL")
+            cursor.executemany(f"INSERT INTO {table} (rowid, body) VALUES (?, ?)",
+                               [(row_id, text_tokenizer.index_text(text)) for row_id, text in cursor.fetchall()])
+        cursor.execute("INSERT OR REPLACE INTO index_meta (name, value) VALUES ('fulltext_tokenizer', ?)",
+                       (text_tokenizer.name,))
+    return True
+
+def _index_fulltext(cursor: sqlite3.Cursor, source: str, row_id: int, words: List[str]) -> None:
+    """写入全文索引，words 为已有的分词结果"""
+    if fulltext_available:
+        cursor.execute(f"INSERT INTO {FULLTEXT_TABLES[source][0]} (rowid, body) VALUES (?, ?)",
+                       (row_id, " ".join(text_tokenizer.index_terms(words))))
+
+# 标签/关键词关联表：(源表, 关联表, 关联表中的记录ID列)
+TAG_TABLES = {
+    "documents": ("document_tags", "doc_id"),
+    "knowledge_base": ("knowledge_tags", "entry_id")
+}
+
+def _normalize_tag(name: Any) -> str:
+    """标签统一为小写并合并空白"""
+    return " ".join(str(name).split()).lower()
+
+def _store_tags(cursor: sqlite3.Cursor, source: str, row_id: int, names: List[Any], kind: str = "tag") -> None:
+    """写入记录的标签（kind 为 tag 或 keyword），替换该记录原有的同类标签"""
+    table, id_column = TAG_TABLES[source]
+    names = sorted({_normalize_tag(name) for name in names if _normalize_tag(name)})
+    cursor.execute(f"DELETE FROM {table} WHERE {id_column} = ? AND kind = ?", (row_id, kind))
+    cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(name,) for name in names])
+    cursor.executemany(f'''
+        INSERT OR IGNORE INTO {table} (tag_id, kind, {id_column})
+        SELECT id, ?, ? FROM tags WHERE name = ?
+    ''', [(kind, row_id, name) for name in names])
+
+def _store_tags_many(cursor: sqlite3.Cursor, source: str, items: List[tuple], kind: str = "tag") -> None:
+    """批量写入新记录的标签，items 为 (记录ID, 标签列表)"""
+    table, id_column = TAG_TABLES[source]
+    pairs = {(row_id, _normalize_tag(name)) for row_id, names in items for name in names if _normalize_tag(name)}
+    names = sorted({name for _, name in pairs})
+    cursor.executemany("INSERT OR IGNORE INTO tags (name) VALUES (?)", [(name,) for name in names])
+    tag_ids = {}
+    for offset in range(0, len(names), 500):
+        batch = names[offset:offset + 500]
+        cursor.execute(f"SELECT name, id FROM tags WHERE name IN ({','.join('?' * len(batch))})", batch)
+        tag_ids.update(cursor.fetchall())
+    cursor.executemany(f"INSERT OR IGNORE INTO {table} (tag_id, kind, {id_column}) VALUES (?, ?, ?)",
+                       [(tag_ids[name], kind, row_id) for row_id, name in sorted(pairs)])
+
+def _tag_filter(source: str, tags: Optional[List[str]], alias: str) -> tuple:
+    """生成“包含全部指定标签”的过滤条件，返回 (SQL片段, 参数)"""
+    names = sorted({_normalize_tag(tag) for tag in tags or [] if _normalize_tag(tag)})
+    if not names:
+        return "", []
+    table, id_column = TAG_TABLES[source]
+    placeholders = ",".join("?" * len(names))
+    sql = f'''
+        AND {alias}.id IN (
+            SELECT r.{id_column} FROM {table} r JOIN tags t ON t.id = r.tag_id
+            WHERE t.name IN ({placeholders})
+            GROUP BY r.{id_column} HAVING COUNT(DISTINCT t.id) = ?
+        )'''
+    return sql, names + [len(names)]
+
+def _backfill_tags(cursor: sqlite3.Cursor) -> None:
+    """将JSON列中已有的标签和关键词写入关联表"""
+    for source, columns in (("documents", ("tags", "keywords")), ("knowledge_base", ("tags",))):
+        for column in columns:
+            kind = "keyword" if column == "keywords" else "tag"
+            cursor.execute(f"SELECT id, {column} FROM {source} WHERE {column} IS NOT NULL AND {column} NOT IN ('', '[]')")
+            for row_id, value in cursor.fetchall():
+                try:
+                    names = json.loads(value)
+                except ValueError:
+                    continue
+                if isinstance(names, list):
+                    _store_tags(cursor, source, row_id, names, kind)
+
+# 由触发器维护的统计计数：scope 为统计类别，key 为分组值（整体统计为空字符串）
+STATISTICS_TRIGGERS = {
+    "documents": [
+        ("documents", "''", "COALESCE({row}.file_size, 0)", "{row}.created_at"),
+        ("document_type", "COALESCE({row}.file_type, '')", "COALESCE({row}.file_size, 0)", "{row}.created_at")
+    ],
+    "knowledge_base": [
+        ("knowledge_base", "''", "0", "{row}.created_at"),
+        ("category", "COALESCE({row}.category, '')", "0", "{row}.created_at")
+    ],
+    "semantic_chunks": [("index", "'semantic_chunks'", "0", "NULL")],
+    "document_tags": [("index", "'document_tags'", "0", "NULL")],
+    "knowledge_tags": [("index", "'knowledge_tags'", "0", "NULL")]
+}
+
+def _init_statistics(cursor: sqlite3.Cursor) -> None:
+    """创建统计表及维护计数的触发器"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS statistics (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            bytes INTEGER NOT NULL DEFAULT 0,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (scope, key)
+        )
+    ''')
+    for table, counters in STATISTICS_TRIGGERS.items():
+        def statements(row: str, sign: str) -> str:
+            sql = ""
+            for scope, key, size, timestamp in counters:
+                key, size, timestamp = (expr.format(row=row) for expr in (key, size, timestamp))
+                # 记录最近一次写入时间；删除时保持不变
+                updated_at = ("CASE WHEN excluded.updated_at > COALESCE(updated_at, '') THEN excluded.updated_at "
+                              "ELSE updated_at END") if sign == "+" else "updated_at"
+                sql += f'''
+                INSERT INTO statistics (scope, key, count, bytes, updated_at)
+                VALUES ('{scope}', {key}, {sign}1, {sign}{size}, {timestamp})
+                ON CONFLICT (scope, key) DO UPDATE SET
+                    count = count + excluded.count, bytes = bytes + excluded.bytes,
+                    updated_at = {updated_at};'''
+            return sql
+        
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_insert AFTER INSERT ON {table} "
+                       f"BEGIN {statements('NEW', '+')} END")
+        cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_delete AFTER DELETE ON {table} "
+                       f"BEGIN {statements('OLD', '-')} END")
+        if table in ("documents", "knowledge_base"):
+            columns = "file_type, file_size" if table == "documents" else "category"
+            cursor.execute(f"CREATE TRIGGER IF NOT EXISTS trg_{table}_stats_update AFTER UPDATE OF {columns} ON {table} "
+                           f"BEGIN {statements('OLD', '-')} {statements('NEW', '+')} END")
+
+def _recompute_statistics(cursor: sqlite3.Cursor) -> None:
+    """全量重新计算统计表"""
+    cursor.execute("DELETE FROM statistics")
+    cursor.execute('''
+        INSERT INTO statistics (scope, key, count, bytes, updated_at)
+        SELECT 'documents', '', COUNT(*), COALESCE(SUM(file_size), 0), MAX(created_at) FROM documents
+    ''')
+    cursor.execute('''
+        INSERT INTO statistics (scope, key, count, bytes, updated_at)
+        SELECT 'document_type', COALESCE(file_type, ''), COUNT(*), COALESCE(SUM(file_size), 0), MAX(created_at)
+        FROM documents GROUP BY COALESCE(file_type, '')
+    ''')
+    cursor.execute('''
+        INSERT INTO statistics (scope, key, count, bytes, updated_at)
+        SELECT 'knowledge_base', '', COUNT(*), 0, MAX(created_at) FROM knowledge_base
+    ''')
+    cursor.execute('''
+        INSERT INTO statistics (scope, key, count, bytes, updated_at)
+        SELECT 'category', COALESCE(category, ''), COUNT(*), 0, MAX(created_at)
+        FROM knowledge_base GROUP BY COALESCE(category, '')
+    ''')
+    for table in ("semantic_chunks", "document_tags", "knowledge_tags"):
+        cursor.execute(f"INSERT INTO statistics (scope, key, count) SELECT 'index', '{table}', COUNT(*) FROM {table}")
+
+def _backfill_file_info(cursor: sqlite3.Cursor) -> None:
+    """为历史文档补充文件类型和大小（原文件已不存在时大小记为正文的UTF-8字节数）"""
+    cursor.execute("SELECT id, filename, filepath, content FROM documents WHERE file_type IS NULL")
+    updates = []
+    for doc_id, filename, filepath, content in cursor.fetchall():
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            size = len(content.encode("utf-8")) if content else 0
+        updates.append((Path(filename).suffix.lower(), size, doc_id))
+    cursor.executemany("UPDATE documents SET file_type = ?, file_size = ? WHERE id = ?", updates)
+
+def _entry_hash(title: str, content: str) -> str:
+    """知识条目的内容哈希（标题和内容），用于导入时查重"""
+    return hashlib.blake2b(f"{title.strip()}\n{content.strip()}".encode("utf-8"), digest_size=32).hexdigest()
+
+def _backfill_entry_hashes(cursor: sqlite3.Cursor) -> None:
+    """为已有知识条目补算内容哈希"""
+    cursor.execute("SELECT id, title, content FROM knowledge_base WHERE content_hash IS NULL")
+    cursor.executemany("UPDATE knowledge_base SET content_hash = ? WHERE id = ?",
+                       [(_entry_hash(title or "", content or ""), entry_id) for entry_id, title, content in cursor.fetchall()])
+
+# 写入后需要使检索缓存失效的数据表
+CACHED_TABLES = ("documents", "knowledge_base")
+
+def _init_data_generation(cursor: sqlite3.Cursor) -> None:
+    """创建数据版本号及递增版本号的触发器（任意进程写入文档或知识库后版本号加一）"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS data_generation (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            value INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("INSERT OR IGNORE INTO data_generation (id, value) VALUES (1, 0)")
+    for table in CACHED_TABLES:
+        for event in ("INSERT", "UPDATE", "DELETE"):
+            cursor.execute(f'''
+                CREATE TRIGGER IF NOT EXISTS trg_{table}_generation_{event.lower()} AFTER {event} ON {table}
+                BEGIN UPDATE data_generation SET value = value + 1 WHERE id = 1; END
+            ''')
+
+# 检索结果缓存
+query_cache = QueryCache(
+    max_entries=QUERY_CACHE_CONFIG.get("max_entries", 1024),
+    max_bytes=QUERY_CACHE_CONFIG.get("max_bytes", 16 * 1024 * 1024),
+    ttl=QUERY_CACHE_CONFIG.get("ttl", 300.0)
+)
+
+# 每个线程保留一个连接用于读取数据版本号，避免每次检索都重新连接
+_generation_local = threading.local()
+
+def _data_generation() -> int:
+    """读取当前数据版本号"""
+    conn = getattr(_generation_local, "conn", None)
+    if conn is None:
+        conn = _generation_local.conn = connect_db()
+    return conn.execute("SELECT value FROM data_generation WHERE id = 1").fetchone()[0]
+
+def _tag_key(tags: Optional[List[str]]) -> tuple:
+    return tuple(sorted({_normalize_tag(tag) for tag in tags or [] if _normalize_tag(tag)}))
+
+def _cached_query(key: tuple, compute) -> List[Dict[str, Any]]:
+    """按数据版本号读写检索缓存，出错的结果不缓存"""
+    generation = _data_generation()
+    cached = query_cache.get(key, generation)
+    if cached is not None:
+        return cached
+    result = compute()
+    if not (result and "error" in result[0]):
+        query_cache.put(key, generation, result)
+    return result
+
+# 数据库中是否仍有未迁移的旧版MD5哈希（原文件已不存在而无法重算），有则查重时一并计算MD5
+legacy_hashes_present = False
+
+def _migrate_file_hashes(cursor: sqlite3.Cursor) -> int:
+    """将旧版MD5文件哈希重新计算为BLAKE2b，原文件已不存在的记录保留旧值"""
+    cursor.execute("SELECT id, filepath, file_hash FROM documents")
+    rows = [row for row in cursor.fetchall() if is_legacy_hash(row[2])]
+    migrated = 0
+    for (doc_id, _, _), (_, digest) in zip(rows, iter_file_hashes(row[1] for row in rows)):
+        if isinstance(digest, FileHashError):
+            continue
+        try:
+            cursor.execute("UPDATE documents SET file_hash = ? WHERE id = ?", (digest, doc_id))
+            migrated += 1
+        except sqlite3.IntegrityError:
+            # 相同内容已以新哈希导入过，保留旧值
+            pass
+    return migrated
 
 def init_database():
     """初始化数据库"""
-    conn = sqlite3.connect(DB_PATH)
+    global legacy_hashes_present, fulltext_available
+    conn = connect_db()
     cursor = conn.cursor()
     
+    # WAL模式允许读写并发，共享服务模式下多个会话同时访问时不会互相阻塞
+    cursor.execute("PRAGMA journal_mode=WAL")
+    
     # 创建文档表
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS documents (
@@ -95,109 +433,292 @@ def init_database():
         )
     ''')
     
+    # 近似去重：MinHash签名与LSH分桶
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_signatures (
+            doc_id INTEGER PRIMARY KEY,
+            signature BLOB NOT NULL,
+            FOREIGN KEY (doc_id) REFERENCES documents (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_lsh (
+            band INTEGER NOT NULL,
+            bucket INTEGER NOT NULL,
+            doc_id INTEGER NOT NULL
+        )
+    ''')
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_document_lsh_bucket ON document_lsh (band, bucket)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_document_lsh_doc ON document_lsh (doc_id)")
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS document_links (
+            doc_id INTEGER NOT NULL,
+            duplicate_of INTEGER NOT NULL,
+            similarity REAL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            PRIMARY KEY (doc_id, duplicate_of)
+        )
+    ''')
+    
+    # 提取文本时超时或崩溃的文件（按文件哈希），不再重复尝试
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS extraction_quarantine (
+            file_hash TEXT PRIMARY KEY,
+            filepath TEXT,
+            reason TEXT,
+            failures INTEGER NOT NULL DEFAULT 1,
+            quarantined_at TIMESTAMP
+        )
+    ''')
+    
+    # 语义检索：分块元数据与IVF聚类中心（向量本身保存在内存映射文件中）
+    semantic_index.init_tables(cursor)
+    
+    # 全文索引（中文预先分词）
+    fulltext_available = _init_fulltext_index(cursor)
+    
+    # 标签与关键词关联表（kind: tag / keyword），按标签查找记录走主键索引
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS tags (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL UNIQUE
+        )
+    ''')
+    for table, id_column in TAG_TABLES.values():
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {table} (
+                tag_id INTEGER NOT NULL,
+                kind TEXT NOT NULL,
+                {id_column} INTEGER NOT NULL,
+                PRIMARY KEY (tag_id, kind, {id_column})
+            ) WITHOUT ROWID
+        ''')
+        cursor.execute(f"CREATE INDEX IF NOT EXISTS idx_{table}_owner ON {table} ({id_column}, kind)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_knowledge_base_category ON knowledge_base (category)")
+    
+    # 文档类型和大小（用于统计）
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(documents)").fetchall()}
+    if "file_type" not in columns:
+        cursor.execute("ALTER TABLE documents ADD COLUMN file_type TEXT")
+    if "file_size" not in columns:
+        cursor.execute("ALTER TABLE documents ADD COLUMN file_size INTEGER")
+    
+    # 知识条目内容哈希（批量导入查重）
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(knowledge_base)").fetchall()}
+    if "content_hash" not in columns:
+        cursor.execute("ALTER TABLE knowledge_base ADD COLUMN content_hash TEXT")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_knowledge_base_hash ON knowledge_base (content_hash)")
+    
+    # 迁移：文件哈希由MD5改为BLAKE2b
+    schema_version = cursor.execute("PRAGMA user_version").fetchone()[0]
+    if schema_version < 1:
+        _migrate_file_hashes(cursor)
+        cursor.execute("PRAGMA user_version = 1")
+    # 迁移：JSON列中的标签和关键词写入关联表
+    if schema_version < 2:
+        _backfill_tags(cursor)
+        cursor.execute("PRAGMA user_version = 2")
+    # 迁移：由触发器维护的统计表
+    _init_statistics(cursor)
+    _init_data_generation(cursor)
+    if schema_version < 3:
+        _backfill_file_info(cursor)
+        _recompute_statistics(cursor)
+        cursor.execute("PRAGMA user_version = 3")
+    if schema_version < 4:
+        _backfill_entry_hashes(cursor)
+        cursor.execute("PRAGMA user_version = 4")
+    cursor.execute("SELECT file_hash FROM documents WHERE length(file_hash) <> 64")
+    legacy_hashes_present = any(is_legacy_hash(row[0]) for row in cursor.fetchall())
+    
     conn.commit()
     conn.close()
 
 # 初始化数据库
 init_database()
 
+# 近似去重签名计算器
+minhasher = MinHasher()
+
+NEAR_DUPLICATE_ACTIONS = ("store", "skip", "link")
+
+# 后台任务队列（任务记录保存在同一数据库中）
+job_queue = JobQueue(DB_PATH, timeout=DATABASE_CONFIG.get("timeout", 30.0))
+
+# 文本提取的工作进程池（隔离模式下每次提取有超时和内存限制）
+extraction_pool = WorkerPool(
+    max_workers=DOCUMENT_CONFIG.get("extraction_workers", 2),
+    timeout=DOCUMENT_CONFIG.get("extraction_timeout", 120.0),
+    memory_limit=DOCUMENT_CONFIG.get("extraction_memory_mb", 2048) * 1024 * 1024
+) if DOCUMENT_CONFIG.get("isolate_extraction", False) else None
+
+# TextRank摘要器
+summarizer = TextRankSummarizer(
+    chunk_sentences=DOCUMENT_CONFIG.get("summary_chunk_sentences", 200),
+    max_input_sentences=DOCUMENT_CONFIG.get("summary_max_input_sentences", 5000)
+)
+
 class DocumentProcessor:
     """文档处理器"""
     
     @staticmethod
     def calculate_file_hash(filepath: str) -> str:
-        """计算文件哈希值"""
-        hash_md5 = hashlib.md5()
-        try:
-            with open(filepath, "rb") as f:
-                for chunk in iter(lambda: f.read(4096), b""):
-                    hash_md5.update(chunk)
-            return hash_md5.hexdigest()
-        except Exception as e:
-            return f"error_{str(e)}"
+        """计算文件哈希值（BLAKE2b），文件无法读取时抛出 FileHashError"""
+        return hash_file(filepath)
     
     @staticmethod
     def extract_text_from_txt(filepath: str) -> str:
-        """从TXT文件提取文本"""
-        try:
-            with open(filepath, 'r', encoding='utf-8') as f:
-                return f.read()
-        except UnicodeDecodeError:
-            with open(filepath, 'r', encoding='gbk') as f:
-                return f.read()
-        except Exception as e:
-            return f"Error reading TXT file: {str(e)}"
+        """从TXT文件提取文本（按BOM和 encoding_fallbacks 判断编码），失败时抛出 ExtractionError"""
+        return extract_txt(filepath, DOCUMENT_CONFIG.get("encoding_fallbacks") or ["utf-8", "gbk"])
     
     @staticmethod
     def extract_text_from_pdf(filepath: str) -> str:
-        """从PDF文件提取文本"""
-        if not pdf_available or PyPDF2 is None:
-            return "PDF processing not available. Please install PyPDF2: pip install PyPDF2"
-        
-        try:
-            text = ""
-            with open(filepath, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    text += page.extract_text() + "\n"
-            return text
-        except Exception as e:
-            return f"Error reading PDF file: {str(e)}"
+        """从PDF文件提取文本，失败时抛出 ExtractionError"""
+        return extract_pdf(filepath)
     
     @staticmethod
     def extract_text_from_docx(filepath: str) -> str:
-        """从DOCX文件提取文本"""
-        if not docx_available or Document is None:
-            return "DOCX processing not available. Please install python-docx: pip install python-docx"
-        
-        try:
-            doc = Document(filepath)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-            return text
-        except Exception as e:
-            return f"Error reading DOCX file: {str(e)}"
+        """从DOCX文件提取文本（流式解析，包含表格、页眉和脚注），解析失败时改用python-docx
+
+        Raises:
+            ExtractionError: 两种方式都无法提取文本
+        """
+        return extract_docx(filepath)
     
     @staticmethod
-    def extract_keywords(text: str, topK: int = 10) -> List[str]:
-        """提取关键词"""
-        if not jieba_available or jieba is None:
-            # 简单的关键词提取（基于词频）
-            words = re.findall(r'\b\w+\b', text.lower())
-            word_freq = {}
-            for word in words:
-                if len(word) > 2:  # 过滤短词
-                    word_freq[word] = word_freq.get(word, 0) + 1
-            
-            # 排序并返回前topK个
-            sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
-            return [word for word, freq in sorted_words[:topK]]
+    def extract_keywords(text: str, topK: int = 10, words: Optional[List[str]] = None) -> List[str]:
+        """提取关键词，words 为已有的分词结果时直接复用，不再重复分词"""
+        if jieba_available:
+            # 与 jieba.analyse.extract_tags 结果一致，但使用预热过的词典和分词缓存
+            return text_tokenizer.keywords(words if words is not None else text_tokenizer.segment(text), topK)
         
-        try:
-            # 使用jieba提取关键词
-            keywords = jieba.analyse.extract_tags(text, topK=topK, withWeight=False)
-            return keywords
-        except Exception as e:
-            return [f"Error extracting keywords: {str(e)}"]
+        # 简单的关键词提取（基于词频）
+        words = re.findall(r'\b\w+\b', text.lower())
+        word_freq = {}
+        for word in words:
+            if len(word) > 2:  # 过滤短词
+                word_freq[word] = word_freq.get(word, 0) + 1
+        
+        # 排序并返回前topK个
+        sorted_words = sorted(word_freq.items(), key=lambda x: x[1], reverse=True)
+        return [word for word, freq in sorted_words[:topK]]
     
     @staticmethod
-    def generate_summary(text: str, max_sentences: int = 3) -> str:
-        """生成文档摘要（简单实现）"""
-        sentences = re.split(r'[.!?。！？]', text)
-        sentences = [s.strip() for s in sentences if len(s.strip()) > 10]
-        
-        if len(sentences) <= max_sentences:
-            return '. '.join(sentences)
-        
-        # 简单选择前几句作为摘要
-        summary_sentences = sentences[:max_sentences]
-        return '. '.join(summary_sentences) + '.'
+    def generate_summary(text: str, max_sentences: Optional[int] = None) -> str:
+        """生成文档摘要（TextRank抽取式摘要），句数默认取 DOCUMENT_CONFIG["max_summary_sentences"]"""
+        return summarizer.summarize(text, max_sentences or DOCUMENT_CONFIG.get("max_summary_sentences", 5))
+    
+    @staticmethod
+    def generate_summaries(texts: List[str], max_sentences: Optional[int] = None) -> List[str]:
+        """批量生成摘要"""
+        return summarizer.summarize_batch(texts, max_sentences or DOCUMENT_CONFIG.get("max_summary_sentences", 5))
+
+def _resolve_path(path: str) -> str:
+    """相对路径按脚本所在目录解析"""
+    if not os.path.isabs(path):
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        path = os.path.join(script_dir, path)
+    return path
+
+def _store_signature(cursor: sqlite3.Cursor, doc_id: int, signature) -> None:
+    """保存文档的MinHash签名和LSH分桶"""
+    cursor.execute("INSERT OR REPLACE INTO document_signatures (doc_id, signature) VALUES (?, ?)",
+                   (doc_id, MinHasher.to_bytes(signature)))
+    cursor.execute("DELETE FROM document_lsh WHERE doc_id = ?", (doc_id,))
+    cursor.executemany("INSERT INTO document_lsh (band, bucket, doc_id) VALUES (?, ?, ?)",
+                       [(band, bucket, doc_id) for band, bucket in minhasher.band_buckets(signature)])
+
+def _find_similar_documents(cursor: sqlite3.Cursor, signature, threshold: float,
+                            exclude_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """通过LSH分桶查找候选文档，并用签名估计相似度"""
+    if not signature:
+        return []
+    
+    buckets = minhasher.band_buckets(signature)
+    placeholders = " OR ".join(["(l.band = ? AND l.bucket = ?)"] * len(buckets))
+    cursor.execute(f'''
+        SELECT DISTINCT s.doc_id, s.signature
+        FROM document_lsh l JOIN document_signatures s ON s.doc_id = l.doc_id
+        WHERE {placeholders}
+    ''', [value for bucket in buckets for value in bucket])
+    
+    matches = []
+    for doc_id, blob in cursor.fetchall():
+        if doc_id == exclude_id:
+            continue
+        similarity = MinHasher.similarity(signature, MinHasher.from_bytes(blob))
+        if similarity >= threshold:
+            matches.append({"document_id": doc_id, "similarity": round(similarity, 4)})
+    
+    matches.sort(key=lambda item: item["similarity"], reverse=True)
+    return matches
+
+def _ensure_signatures(conn: sqlite3.Connection) -> int:
+    """为尚未计算签名的历史文档补算签名"""
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT id, content FROM documents
+        WHERE id NOT IN (SELECT doc_id FROM document_signatures) AND content IS NOT NULL
+    ''')
+    count = 0
+    for doc_id, content in cursor.fetchall():
+        signature = minhasher.signature(content)
+        if signature:
+            _store_signature(cursor, doc_id, signature)
+            count += 1
+    conn.commit()
+    return count
+
+def _semantic_text_sql(source: str) -> str:
+    """建立语义索引所用文本的SQL表达式，与 _index_semantic 的输入保持一致"""
+    if source == "documents":
+        return "content"
+    return "title || char(10) || char(10) || content"
+
+def _index_semantic(cursor: sqlite3.Cursor, source: str, source_id: int, text: str) -> None:
+    """为新记录建立语义索引；失败时只记录日志，之后由服务启动时的补建任务或 build_semantic_index 补建"""
+    try:
+        semantic_index.add(cursor, source, source_id, text)
+    except Exception as e:
+        logger.warning(f"Semantic indexing failed for {source} #{source_id}: {e}")
+
+# 补建语义索引时每批提交的记录数，避免长时间持有写锁阻塞导入
+SEMANTIC_BACKFILL_BATCH = 100
+
+def _unindexed_semantic_ids(cursor: sqlite3.Cursor, source: str) -> List[int]:
+    """尚未建立语义索引的记录ID（需要扫描整张表，只在补建时调用）"""
+    cursor.execute(f'''
+        SELECT id FROM {source}
+        WHERE id NOT IN (SELECT source_id FROM semantic_items WHERE source = ?) AND content IS NOT NULL
+        ORDER BY id
+    ''', (source,))
+    return [row[0] for row in cursor.fetchall()]
+
+def _ensure_semantic_index(conn: sqlite3.Connection, job: Optional[JobContext] = None) -> int:
+    """为尚未建立语义索引的历史文档和知识条目补建索引（新增内容在写入时已建立索引）"""
+    cursor = conn.cursor()
+    pending = [(source, _unindexed_semantic_ids(cursor, source)) for source in SEMANTIC_SOURCES]
+    total = sum(len(ids) for _, ids in pending)
+    count = 0
+    for source, ids in pending:
+        for offset in range(0, len(ids), SEMANTIC_BACKFILL_BATCH):
+            batch = ids[offset:offset + SEMANTIC_BACKFILL_BATCH]
+            cursor.execute(f"SELECT id, {_semantic_text_sql(source)} FROM {source} WHERE id IN ({','.join('?' * len(batch))})",
+                           batch)
+            rows = cursor.fetchall()
+            for source_id, text in rows:
+                semantic_index.add(cursor, source, source_id, text)
+            conn.commit()
+            count += len(rows)
+            if job is not None:
+                job.report(count, total, f"Indexed {count}/{total} records")
+    return count
 
 # MCP工具定义
 
-@mcp.tool()
-def parse_document(filepath: str, extract_keywords: bool = True, generate_summary: bool = True) -> Dict[str, Any]:
+@mcp_tool()
+def parse_document(filepath: str, extract_keywords: bool = True, generate_summary: bool = True,
+                   near_duplicates: str = "store", similarity_threshold: float = 0.9) -> Dict[str, Any]:
     """
     解析文档并提取内容
     
@@ -205,25 +726,69 @@ def parse_document(filepath: str, extract_keywords: bool = True, generate_summar
         filepath: 文档文件路径
         extract_keywords: 是否提取关键词
         generate_summary: 是否生成摘要
+        near_duplicates: 近似重复文档的处理方式 (store: 照常保存, skip: 跳过不保存, link: 保存并关联到相似文档)
+        similarity_threshold: 判定为近似重复的相似度阈值 (0-1)
     """
+    if near_duplicates not in NEAR_DUPLICATE_ACTIONS:
+        return {"error": f"Invalid near_duplicates. Use: {', '.join(NEAR_DUPLICATE_ACTIONS)}"}
+    
     # 如果是相对路径，转换为绝对路径
-    if not os.path.isabs(filepath):
-        # 获取脚本所在目录
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        filepath = os.path.join(script_dir, filepath)
+    filepath = _resolve_path(filepath)
     
     if not os.path.exists(filepath):
         return {"error": f"File not found: {filepath}"}
     
+    return _process_document(filepath, extract_keywords, generate_summary, near_duplicates, similarity_threshold)
+
+def _extract_document_text(cursor: sqlite3.Cursor, filepath: str, file_extension: str, file_hash: str) -> str:
+    """提取文档文本；隔离模式下在工作进程中执行，超时或崩溃的文件按哈希记入隔离表，之后不再重试
+
+    Raises:
+        ExtractionError: 提取失败或文件已被隔离
+    """
+    encodings = DOCUMENT_CONFIG.get("encoding_fallbacks") or ["utf-8", "gbk"]
+    if extraction_pool is None:
+        return extract_text(filepath, file_extension, encodings)
+    
+    cursor.execute("SELECT reason FROM extraction_quarantine WHERE file_hash = ?", (file_hash,))
+    row = cursor.fetchone()
+    if row:
+        raise ExtractionError(f"File is quarantined after a failed extraction: {row[0]}")
+    try:
+        return extraction_pool.call("extractors:extract_text", filepath, file_extension, encodings)
+    except (WorkerTimeout, WorkerCrash) as e:
+        logger.warning(f"Quarantining {filepath}: {e}")
+        cursor.execute('''
+            INSERT INTO extraction_quarantine (file_hash, filepath, reason, quarantined_at) VALUES (?, ?, ?, ?)
+            ON CONFLICT (file_hash) DO UPDATE SET
+            filepath = excluded.filepath, reason = excluded.reason,
+            failures = failures + 1, quarantined_at = excluded.quarantined_at
+        ''', (file_hash, filepath, str(e), datetime.now()))
+        raise ExtractionError(f"Extraction failed, file quarantined: {e}") from e
+    except WorkerUnavailable as e:
+        # 工作进程无法启动与文件内容无关，不记入隔离表
+        logger.warning(f"Extraction worker unavailable, extracting in process: {e}")
+        return extract_text(filepath, file_extension, encodings)
+
+def _process_document(filepath: str, extract_keywords: bool, generate_summary: bool, near_duplicates: str,
+                      similarity_threshold: float, file_hashes=None) -> Dict[str, Any]:
+    """解析并保存文档，file_hashes 为批量导入时预先并行计算好的哈希"""
     # 获取文件信息
     filename = os.path.basename(filepath)
     file_extension = Path(filepath).suffix.lower()
-    file_hash = DocumentProcessor.calculate_file_hash(filepath)
+    try:
+        if file_hashes is None:
+            file_hashes = hash_file(filepath, with_legacy=legacy_hashes_present)
+        elif isinstance(file_hashes, FileHashError):
+            raise file_hashes
+    except FileHashError as e:
+        return {"error": str(e)}
+    file_hash, legacy_hash = file_hashes if isinstance(file_hashes, tuple) else (file_hashes, None)
     
-    # 检查是否已处理过
-    conn = sqlite3.connect(DB_PATH)
+    # 检查是否已处理过（兼容尚未迁移的旧版MD5哈希）
+    conn = connect_db()
     cursor = conn.cursor()
-    cursor.execute("SELECT * FROM documents WHERE file_hash = ?", (file_hash,))
+    cursor.execute("SELECT * FROM documents WHERE file_hash IN (?, ?)", (file_hash, legacy_hash or file_hash))
     existing_doc = cursor.fetchone()
     
     if existing_doc:
@@ -235,21 +800,41 @@ def parse_document(filepath: str, extract_keywords: bool = True, generate_summar
             "content_preview": existing_doc[4][:200] + "..." if existing_doc[4] else ""
         }
     
-    # 根据文件类型提取文本
-    if file_extension in ['.txt', '.md']:
-        content = DocumentProcessor.extract_text_from_txt(filepath)
-    elif file_extension == '.pdf':
-        content = DocumentProcessor.extract_text_from_pdf(filepath)
-    elif file_extension in ['.docx', '.doc']:
-        content = DocumentProcessor.extract_text_from_docx(filepath)
-    else:
+    # 根据文件类型提取文本，提取失败的文档不入库
+    if file_extension not in ['.txt', '.md', '.pdf', '.docx', '.doc']:
         conn.close()
         return {"error": f"Unsupported file type: {file_extension}"}
+    try:
+        content = _extract_document_text(cursor, filepath, file_extension, file_hash)
+    except ExtractionError as e:
+        # 提交可能写入的隔离记录
+        conn.commit()
+        conn.close()
+        return {"error": str(e)}
+    
+    # 近似去重：内容几乎相同的文档按 near_duplicates 处理
+    signature = minhasher.signature(content) if content else None
+    similar = []
+    if near_duplicates != "store" and signature:
+        similar = _find_similar_documents(cursor, signature, similarity_threshold)
+        if similar and near_duplicates == "skip":
+            cursor.execute("SELECT filename FROM documents WHERE id = ?", (similar[0]["document_id"],))
+            row = cursor.fetchone()
+            conn.close()
+            return {
+                "message": "Near-duplicate document skipped",
+                "document_id": similar[0]["document_id"],
+                "filename": row[0] if row else None,
+                "similarity": similar[0]["similarity"]
+            }
+    
+    # 分词一次，同时用于关键词提取和全文索引
+    words = text_tokenizer.segment(content) if content else []
     
     # 提取关键词
     keywords = []
     if extract_keywords and content:
-        keywords = DocumentProcessor.extract_keywords(content)
+        keywords = DocumentProcessor.extract_keywords(content, words=words)
     
     # 生成摘要
     summary = ""
@@ -259,15 +844,28 @@ def parse_document(filepath: str, extract_keywords: bool = True, generate_summar
     # 保存到数据库
     try:
         cursor.execute('''
-            INSERT INTO documents (filename, filepath, file_hash, content, summary, keywords, created_at)
-            VALUES (?, ?, ?, ?, ?, ?, ?)
-        ''', (filename, filepath, file_hash, content, summary, json.dumps(keywords), datetime.now()))
+            INSERT INTO documents (filename, filepath, file_hash, content, summary, keywords, file_type, file_size,
+                                   created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', (filename, filepath, file_hash, content, summary, json.dumps(keywords), file_extension,
+              os.path.getsize(filepath), datetime.now()))
         
         doc_id = cursor.lastrowid
+        if signature:
+            _store_signature(cursor, doc_id, signature)
+        _store_tags(cursor, "documents", doc_id, keywords, "keyword")
+        if content:
+            _index_fulltext(cursor, "documents", doc_id, words)
+            _index_semantic(cursor, "documents", doc_id, content)
+        if near_duplicates == "link":
+            cursor.executemany('''
+                INSERT OR REPLACE INTO document_links (doc_id, duplicate_of, similarity, created_at)
+                VALUES (?, ?, ?, ?)
+            ''', [(doc_id, item["document_id"], item["similarity"], datetime.now()) for item in similar])
         conn.commit()
         conn.close()
         
-        return {
+        result = {
             "success": True,
             "document_id": doc_id,
             "filename": filename,
@@ -276,46 +874,75 @@ def parse_document(filepath: str, extract_keywords: bool = True, generate_summar
             "summary": summary,
             "content_preview": content[:200] + "..." if len(content) > 200 else content
         }
+        if similar:
+            result["near_duplicates"] = similar
+        return result
         
     except Exception as e:
         conn.close()
         return {"error": f"Database error: {str(e)}"}
 
-@mcp.tool()
-def search_documents(query: str, search_type: str = "content") -> List[Dict[str, Any]]:
+@mcp_tool()
+def search_documents(query: str, search_type: str = "content", tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     """
     搜索文档
     
     Args:
         query: 搜索查询
-        search_type: 搜索类型 (content, keywords, filename)
+        search_type: 搜索类型 (content, keywords, filename)；keywords 按关键词精确匹配
+        tags: 标签过滤，只返回同时带有全部指定标签或关键词的文档
     """
-    conn = sqlite3.connect(DB_PATH)
+    query = normalize_query(query)
+    key = ("search_documents", query, search_type, _tag_key(tags))
+    return _cached_query(key, lambda: _search_documents(query, search_type, tags))
+
+def _search_documents(query: str, search_type: str, tags: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """执行文档检索（不经过缓存）"""
+    conn = connect_db()
     cursor = conn.cursor()
+    tag_sql, tag_params = _tag_filter("documents", tags, "d")
     
     if search_type == "content":
-        cursor.execute('''
-            SELECT id, filename, summary, keywords, created_at 
-            FROM documents 
-            WHERE content LIKE ? OR summary LIKE ?
-        ''', (f'%{query}%', f'%{query}%'))
+        results = []
+        match = text_tokenizer.match_expression(query) if fulltext_available else ""
+        if match:
+            # 全文索引检索，按相关度排序
+            cursor.execute(f'''
+                SELECT d.id, d.filename, d.summary, d.keywords, d.created_at
+                FROM documents_fts f JOIN documents d ON d.id = f.rowid
+                WHERE documents_fts MATCH ? {tag_sql}
+                ORDER BY f.rank
+            ''', [match] + tag_params)
+            results = cursor.fetchall()
+        if not results:
+            # 跨越分词边界的片段在索引中查不到，退回子串匹配
+            cursor.execute(f'''
+                SELECT d.id, d.filename, d.summary, d.keywords, d.created_at 
+                FROM documents d 
+                WHERE (d.content LIKE ? OR d.summary LIKE ?) {tag_sql}
+            ''', [f'%{query}%', f'%{query}%'] + tag_params)
+            results = cursor.fetchall()
     elif search_type == "keywords":
-        cursor.execute('''
-            SELECT id, filename, summary, keywords, created_at 
-            FROM documents 
-            WHERE keywords LIKE ?
-        ''', (f'%{query}%',))
+        # 通过关键词关联表精确查找
+        cursor.execute(f'''
+            SELECT d.id, d.filename, d.summary, d.keywords, d.created_at 
+            FROM tags t
+            JOIN document_tags r ON r.tag_id = t.id AND r.kind = 'keyword'
+            JOIN documents d ON d.id = r.doc_id
+            WHERE t.name = ? {tag_sql}
+        ''', [_normalize_tag(query)] + tag_params)
+        results = cursor.fetchall()
     elif search_type == "filename":
-        cursor.execute('''
-            SELECT id, filename, summary, keywords, created_at 
-            FROM documents 
-            WHERE filename LIKE ?
-        ''', (f'%{query}%',))
+        cursor.execute(f'''
+            SELECT d.id, d.filename, d.summary, d.keywords, d.created_at 
+            FROM documents d 
+            WHERE d.filename LIKE ? {tag_sql}
+        ''', [f'%{query}%'] + tag_params)
+        results = cursor.fetchall()
     else:
         conn.close()
         return [{"error": "Invalid search_type. Use: content, keywords, or filename"}]
     
-    results = cursor.fetchall()
     conn.close()
     
     documents = []
@@ -336,7 +963,156 @@ def search_documents(query: str, search_type: str = "content") -> List[Dict[str,
     
     return documents
 
-@mcp.tool()
+@mcp_tool()
+def find_near_duplicates(document_id: Optional[int] = None, threshold: float = 0.8) -> Dict[str, Any]:
+    """
+    查找内容几乎相同的文档（基于MinHash/LSH）
+    
+    Args:
+        document_id: 指定文档ID时只查找该文档的近似重复；不指定时返回全部重复组
+        threshold: 相似度阈值 (0-1)
+    """
+    conn = connect_db()
+    try:
+        _ensure_signatures(conn)
+        cursor = conn.cursor()
+        
+        if document_id is not None:
+            cursor.execute("SELECT signature FROM document_signatures WHERE doc_id = ?", (document_id,))
+            row = cursor.fetchone()
+            if not row:
+                return {"error": f"Document with ID {document_id} not found or has no content"}
+            matches = _find_similar_documents(cursor, MinHasher.from_bytes(row[0]), threshold, exclude_id=document_id)
+            for match in matches:
+                cursor.execute("SELECT filename FROM documents WHERE id = ?", (match["document_id"],))
+                match["filename"] = cursor.fetchone()[0]
+            return {"document_id": document_id, "threshold": threshold, "near_duplicates": matches}
+        
+        # 任一分段落入同一桶的文档对即为候选，再用完整签名校验
+        cursor.execute('''
+            SELECT DISTINCT a.doc_id, b.doc_id
+            FROM document_lsh a JOIN document_lsh b
+              ON a.band = b.band AND a.bucket = b.bucket AND a.doc_id < b.doc_id
+        ''')
+        candidates = cursor.fetchall()
+        signatures = {}
+        pairs = []
+        for first, second in candidates:
+            for doc_id in (first, second):
+                if doc_id not in signatures:
+                    cursor.execute("SELECT signature FROM document_signatures WHERE doc_id = ?", (doc_id,))
+                    signatures[doc_id] = MinHasher.from_bytes(cursor.fetchone()[0])
+            similarity = MinHasher.similarity(signatures[first], signatures[second])
+            if similarity >= threshold:
+                pairs.append({"document_ids": [first, second], "similarity": round(similarity, 4)})
+        
+        groups = group_pairs(pair["document_ids"] for pair in pairs)
+        filenames = {}
+        for doc_id in {doc_id for group in groups for doc_id in group}:
+            cursor.execute("SELECT filename FROM documents WHERE id = ?", (doc_id,))
+            filenames[doc_id] = cursor.fetchone()[0]
+        
+        return {
+            "threshold": threshold,
+            "pairs": sorted(pairs, key=lambda item: item["similarity"], reverse=True),
+            "groups": [[{"id": doc_id, "filename": filenames[doc_id]} for doc_id in group] for group in groups]
+        }
+    except Exception as e:
+        return {"error": f"Near-duplicate search failed: {str(e)}"}
+    finally:
+        conn.close()
+
+@mcp_tool()
+def semantic_search(query: str, top_k: int = 10, source: str = "all", nprobe: int = 0) -> List[Dict[str, Any]]:
+    """
+    语义检索：按含义相近而非字面匹配查找文档和知识库条目（本地向量化，无需联网）
+    
+    Args:
+        query: 查询文本
+        top_k: 返回结果数量
+        source: 检索范围 (all, documents, knowledge_base)
+        nprobe: 已构建IVF索引时探查的聚类数，0表示使用配置默认值
+    """
+    if not semantic_index.available:
+        return [{"error": "Semantic search requires numpy. Install it with: pip install numpy"}]
+    if source == "all":
+        sources = list(SEMANTIC_SOURCES)
+    elif source in SEMANTIC_SOURCES:
+        sources = [source]
+    else:
+        return [{"error": f"Invalid source. Use: all, {', '.join(SEMANTIC_SOURCES)}"}]
+    if not query.strip():
+        return [{"error": "Query must not be empty"}]
+    
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        # 多取一些分块，合并同一文档的多个命中后再截取 top_k
+        hits = semantic_index.search(cursor, [query], top_k * 4, sources,
+                                     nprobe or SEMANTIC_CONFIG.get("nprobe", 8))[0]
+        
+        results = {}
+        for hit_source, row, score in hits:
+            cursor.execute(
+                "SELECT source_id, start, length FROM semantic_chunks WHERE source = ? AND row = ?",
+                (hit_source, row)
+            )
+            chunk = cursor.fetchone()
+            if chunk is None or (hit_source, chunk[0]) in results:
+                continue
+            source_id, start, length = chunk
+            title_column = "filename" if hit_source == "documents" else "title"
+            cursor.execute(
+                f"SELECT {title_column}, substr({_semantic_text_sql(hit_source)}, ?, ?) FROM {hit_source} WHERE id = ?",
+                (start + 1, min(length, 300), source_id)
+            )
+            row_data = cursor.fetchone()
+            if row_data is None:
+                continue
+            results[(hit_source, source_id)] = {
+                "source": hit_source,
+                "id": source_id,
+                "title": row_data[0],
+                "score": round(score, 4),
+                "snippet": row_data[1].strip()
+            }
+            if len(results) >= top_k:
+                break
+        return list(results.values())
+    except Exception as e:
+        return [{"error": f"Semantic search failed: {str(e)}"}]
+    finally:
+        conn.close()
+
+@mcp_tool()
+def build_semantic_index(source: str = "all", n_lists: int = 0) -> Dict[str, Any]:
+    """
+    补建缺失的语义索引并构建IVF粗量化索引，加速大规模语料的语义检索（之后新增的内容会自动归入最近的聚类）
+    
+    Args:
+        source: 数据源 (all, documents, knowledge_base)
+        n_lists: 聚类数，0表示取分块数的平方根
+    """
+    if not semantic_index.available:
+        return {"error": "Semantic search requires numpy. Install it with: pip install numpy"}
+    if source != "all" and source not in SEMANTIC_SOURCES:
+        return {"error": f"Invalid source. Use: all, {', '.join(SEMANTIC_SOURCES)}"}
+    
+    conn = connect_db()
+    try:
+        indexed = _ensure_semantic_index(conn)
+        cursor = conn.cursor()
+        lists = {}
+        for name in (SEMANTIC_SOURCES if source == "all" else [source]):
+            lists[name] = semantic_index.build_ivf(cursor, name, n_lists)
+        conn.commit()
+        return {"success": True, "newly_indexed": indexed, "ivf_lists": lists, "index": semantic_index.status(cursor)}
+    except Exception as e:
+        return {"error": f"Index build failed: {str(e)}"}
+    finally:
+        conn.close()
+
+@mcp_tool()
 def get_document_content(document_id: int) -> Dict[str, Any]:
     """
     获取文档完整内容
@@ -344,7 +1120,7 @@ def get_document_content(document_id: int) -> Dict[str, Any]:
     Args:
         document_id: 文档ID
     """
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cursor = conn.cursor()
     cursor.execute("SELECT * FROM documents WHERE id = ?", (document_id,))
     doc = cursor.fetchone()
@@ -365,7 +1141,7 @@ def get_document_content(document_id: int) -> Dict[str, Any]:
         "updated_at": doc[9]
     }
 
-@mcp.tool()
+@mcp_tool()
 def add_knowledge_entry(title: str, content: str, category: str = "", tags: Optional[List[str]] = None, source_doc_id: Optional[int] = None) -> Dict[str, Any]:
     """
     添加知识库条目
@@ -390,16 +1166,20 @@ def add_knowledge_entry(title: str, content: str, category: str = "", tags: Opti
             "hint": "Please provide both title and content. Example: add_knowledge_entry(title='知识图谱构建', content='知识图谱构建的步骤与方法...')"
         }
     
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cursor = conn.cursor()
     
     try:
         cursor.execute('''
-            INSERT INTO knowledge_base (title, content, category, tags, source_doc_id, created_at)
-            VALUES (?, ?, ?, ?, ?, ?)
-        ''', (title.strip(), content.strip(), category.strip() if isinstance(category, str) else "", json.dumps(tags), source_doc_id, datetime.now()))
+            INSERT INTO knowledge_base (title, content, category, tags, source_doc_id, created_at, content_hash)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        ''', (title.strip(), content.strip(), category.strip() if isinstance(category, str) else "", json.dumps(tags), source_doc_id, datetime.now(),
+              _entry_hash(title, content)))
         
         entry_id = cursor.lastrowid
+        _store_tags(cursor, "knowledge_base", entry_id, tags)
+        _index_fulltext(cursor, "knowledge_base", entry_id, text_tokenizer.segment(f"{title.strip()}\n{content.strip()}"))
+        _index_semantic(cursor, "knowledge_base", entry_id, f"{title.strip()}\n\n{content.strip()}")
         conn.commit()
         
         return {
@@ -418,32 +1198,300 @@ def add_knowledge_entry(title: str, content: str, category: str = "", tags: Opti
         except:
             pass
 
-@mcp.tool()
-def search_knowledge_base(query: str, category: str = "") -> List[Dict[str, Any]]:
+# 批量导入：每批写入的条目数、重复条目的处理方式、结果中最多列出的错误数
+IMPORT_BATCH_SIZE = 500
+IMPORT_DUPLICATE_ACTIONS = ("skip", "store")
+MAX_REPORTED_ERRORS = 100
+
+def _iter_import_records(filepath: str, entries: Optional[List[Dict[str, Any]]], file_format: str):
+    """逐条读取待导入的条目，产出 (行号, 条目)；无法解析的行产出 ValueError"""
+    if entries is not None:
+        for index, record in enumerate(entries, 1):
+            yield index, record
+        return
+    with open(filepath, "r", encoding="utf-8-sig", newline="") as f:
+        if file_format == "csv":
+            # 长文本字段可能超过csv模块默认的单字段长度上限
+            csv.field_size_limit(max(csv.field_size_limit(), DOCUMENT_CONFIG.get("max_file_size", 50 * 1024 * 1024)))
+            reader = csv.DictReader(f)
+            for record in reader:
+                yield reader.line_num, record
+            return
+        for line_no, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield line_no, json.loads(line)
+            except ValueError as e:
+                yield line_no, ValueError(f"Invalid JSON: {e}")
+
+def _parse_import_tags(value: Any) -> List[str]:
+    """标签可以是列表、JSON数组字符串或以逗号/分号/竖线分隔的字符串"""
+    if value is None or value == "":
+        return []
+    if isinstance(value, str):
+        text = value.strip()
+        if text.startswith("["):
+            value = json.loads(text)
+        else:
+            return [tag for tag in re.split(r"[,;|，；]", text) if tag.strip()]
+    if not isinstance(value, list) or not all(isinstance(tag, (str, int, float)) for tag in value):
+        raise ValueError("tags must be a list of strings")
+    return [str(tag) for tag in value if str(tag).strip()]
+
+def _validate_import_record(record: Any) -> Dict[str, Any]:
+    """校验并规范化一条导入条目，无效时抛出 ValueError"""
+    if isinstance(record, ValueError):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("Entry must be an object")
+    title, content = record.get("title"), record.get("content")
+    if not isinstance(title, str) or not title.strip():
+        raise ValueError("title is required and must be a non-empty string")
+    if not isinstance(content, str) or not content.strip():
+        raise ValueError("content is required and must be a non-empty string")
+    category = record.get("category") or ""
+    if not isinstance(category, str):
+        raise ValueError("category must be a string")
+    source_doc_id = record.get("source_doc_id")
+    if source_doc_id in ("", None):
+        source_doc_id = None
+    else:
+        try:
+            source_doc_id = int(source_doc_id)
+        except (TypeError, ValueError):
+            raise ValueError("source_doc_id must be an integer")
+    created_at = record.get("created_at") or None
+    if created_at is not None and not isinstance(created_at, str):
+        raise ValueError("created_at must be a string")
+    return {
+        "title": title.strip(),
+        "content": content.strip(),
+        "category": category.strip(),
+        "tags": _parse_import_tags(record.get("tags")),
+        "source_doc_id": source_doc_id,
+        "created_at": created_at,
+        "content_hash": _entry_hash(title, content)
+    }
+
+def _insert_knowledge_batch(cursor: sqlite3.Cursor, batch: List[Dict[str, Any]], next_id: int) -> List[int]:
+    """以显式ID批量写入知识条目及其标签、全文索引和语义索引，返回条目ID"""
+    now = datetime.now()
+    ids = list(range(next_id, next_id + len(batch)))
+    cursor.executemany('''
+        INSERT INTO knowledge_base (id, title, content, category, tags, source_doc_id, created_at, content_hash)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(entry_id, e["title"], e["content"], e["category"], json.dumps(e["tags"]), e["source_doc_id"],
+           e["created_at"] or now, e["content_hash"]) for entry_id, e in zip(ids, batch)])
+    _store_tags_many(cursor, "knowledge_base", [(entry_id, e["tags"]) for entry_id, e in zip(ids, batch)])
+    if fulltext_available:
+        cursor.executemany(f"INSERT INTO {FULLTEXT_TABLES['knowledge_base'][0]} (rowid, body) VALUES (?, ?)",
+                           [(entry_id, text_tokenizer.index_text(f"{e['title']}\n{e['content']}"))
+                            for entry_id, e in zip(ids, batch)])
+    for entry_id, e in zip(ids, batch):
+        _index_semantic(cursor, "knowledge_base", entry_id, f"{e['title']}\n\n{e['content']}")
+    return ids
+
+@mcp_tool()
+def import_knowledge_entries(filepath: str = "", entries: Optional[List[Dict[str, Any]]] = None, file_format: str = "",
+                             on_duplicate: str = "skip", dry_run: bool = False) -> Dict[str, Any]:
+    """
+    批量导入知识库条目（单个事务内分批写入，任何数据库错误都会整体回滚）
+    
+    Args:
+        filepath: JSONL或CSV文件路径（每条包含 title、content，可选 category、tags、source_doc_id、created_at）
+        entries: 直接传入的条目列表，与 filepath 二选一
+        file_format: jsonl 或 csv，为空时按文件扩展名判断
+        on_duplicate: 与已有条目或本次导入中前面的条目标题和内容相同时的处理方式 (skip: 跳过, store: 照常保存)
+        dry_run: 只校验和查重，不写入
+    """
+    if bool(filepath) == (entries is not None):
+        return {"error": "Provide either filepath or entries"}
+    if entries is not None and not isinstance(entries, list):
+        return {"error": "Invalid parameter: entries must be a list"}
+    if on_duplicate not in IMPORT_DUPLICATE_ACTIONS:
+        return {"error": f"Invalid on_duplicate. Use: {', '.join(IMPORT_DUPLICATE_ACTIONS)}"}
+    if filepath:
+        filepath = _resolve_path(filepath)
+        if not os.path.exists(filepath):
+            return {"error": f"File not found: {filepath}"}
+        file_format = (file_format or Path(filepath).suffix.lstrip(".")).lower()
+        if file_format not in ("jsonl", "csv"):
+            return {"error": "Unsupported import format. Use: jsonl, csv"}
+    
+    summary = {"imported": 0, "duplicates": 0, "invalid": 0, "errors": [], "dry_run": dry_run}
+    seen_hashes = set()
+    
+    def reject(line_no: int, error: str) -> None:
+        summary["invalid"] += 1
+        if len(summary["errors"]) < MAX_REPORTED_ERRORS:
+            summary["errors"].append({"line": line_no, "error": error})
+    
+    conn = connect_db()
+    cursor = conn.cursor()
+    try:
+        # 持有写锁直到提交，显式分配的条目ID不会与其他写入冲突
+        cursor.execute("BEGIN IMMEDIATE")
+        cursor.execute('''
+            SELECT MAX(COALESCE((SELECT seq FROM sqlite_sequence WHERE name = 'knowledge_base'), 0),
+                       COALESCE((SELECT MAX(id) FROM knowledge_base), 0))
+        ''')
+        next_id = cursor.fetchone()[0] + 1
+        records = _iter_import_records(filepath, entries, file_format)
+        while True:
+            batch = []
+            for line_no, record in records:
+                try:
+                    batch.append((line_no, _validate_import_record(record)))
+                except ValueError as e:
+                    reject(line_no, str(e))
+                if len(batch) >= IMPORT_BATCH_SIZE:
+                    break
+            if not batch:
+                break
+            
+            # 来源文档必须存在
+            doc_ids = sorted({e["source_doc_id"] for _, e in batch if e["source_doc_id"] is not None})
+            existing_docs = set()
+            if doc_ids:
+                cursor.execute(f"SELECT id FROM documents WHERE id IN ({','.join('?' * len(doc_ids))})", doc_ids)
+                existing_docs = {row[0] for row in cursor.fetchall()}
+            hashes = sorted({e["content_hash"] for _, e in batch})
+            cursor.execute(f"SELECT DISTINCT content_hash FROM knowledge_base WHERE content_hash IN ({','.join('?' * len(hashes))})",
+                           hashes)
+            existing_hashes = {row[0] for row in cursor.fetchall()}
+            
+            rows = []
+            for line_no, entry in batch:
+                if entry["source_doc_id"] is not None and entry["source_doc_id"] not in existing_docs:
+                    reject(line_no, f"Source document not found: {entry['source_doc_id']}")
+                    continue
+                if on_duplicate == "skip" and (entry["content_hash"] in existing_hashes or entry["content_hash"] in seen_hashes):
+                    summary["duplicates"] += 1
+                    continue
+                seen_hashes.add(entry["content_hash"])
+                rows.append(entry)
+            if rows and not dry_run:
+                _insert_knowledge_batch(cursor, rows, next_id)
+                next_id += len(rows)
+            summary["imported"] += len(rows)
+        
+        if dry_run:
+            conn.rollback()
+        else:
+            conn.commit()
+    except (OSError, UnicodeDecodeError, csv.Error) as e:
+        conn.rollback()
+        return {"error": f"Cannot read import file: {str(e)}"}
+    except sqlite3.Error as e:
+        conn.rollback()
+        return {"error": f"Database error: {str(e)}"}
+    finally:
+        conn.close()
+    
+    summary["errors"].sort(key=lambda error: error["line"])
+    summary["success"] = True
+    return summary
+
+@mcp_tool()
+def export_knowledge_base(filepath: str, category: str = "", tags: Optional[List[str]] = None) -> Dict[str, Any]:
+    """
+    将知识库逐条导出为JSONL文件（流式写入，导出结果可直接用 import_knowledge_entries 导入）
+    
+    Args:
+        filepath: 导出文件路径
+        category: 只导出该分类的条目
+        tags: 只导出同时带有全部指定标签的条目
+    """
+    filepath = _resolve_path(filepath)
+    temp_path = filepath + ".tmp"
+    tag_sql, tag_params = _tag_filter("knowledge_base", tags, "k")
+    sql = '''
+        SELECT k.id, k.title, k.content, k.category, k.tags, k.source_doc_id, k.created_at
+        FROM knowledge_base k WHERE 1 = 1
+    '''
+    params: List[Any] = []
+    if category:
+        sql += " AND k.category = ?"
+        params.append(category)
+    sql += tag_sql + " ORDER BY k.id"
+    params.extend(tag_params)
+    
+    conn = connect_db()
+    exported = 0
+    try:
+        # 游标逐行读取，写完后再替换目标文件，导出中断时不会留下不完整的文件
+        with open(temp_path, "w", encoding="utf-8") as f:
+            for entry_id, title, content, entry_category, entry_tags, source_doc_id, created_at in conn.execute(sql, params):
+                f.write(json.dumps({
+                    "id": entry_id,
+                    "title": title,
+                    "content": content,
+                    "category": entry_category or "",
+                    "tags": json.loads(entry_tags) if entry_tags else [],
+                    "source_doc_id": source_doc_id,
+                    "created_at": created_at
+                }, ensure_ascii=False) + "\n")
+                exported += 1
+        os.replace(temp_path, filepath)
+    except (OSError, sqlite3.Error) as e:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return {"error": f"Export failed: {str(e)}"}
+    finally:
+        conn.close()
+    
+    return {
+        "success": True,
+        "filepath": filepath,
+        "exported": exported,
+        "bytes": os.path.getsize(filepath)
+    }
+
+@mcp_tool()
+def search_knowledge_base(query: str, category: str = "", tags: Optional[List[str]] = None) -> List[Dict[str, Any]]:
     """
     搜索知识库
     
     Args:
-        query: 搜索查询
+        query: 搜索查询（为空时只按分类和标签过滤）
         category: 分类过滤
+        tags: 标签过滤，只返回同时带有全部指定标签的条目
     """
-    conn = sqlite3.connect(DB_PATH)
+    query = normalize_query(query)
+    key = ("search_knowledge_base", query, category, _tag_key(tags))
+    return _cached_query(key, lambda: _search_knowledge_base(query, category, tags))
+
+def _search_knowledge_base(query: str, category: str, tags: Optional[List[str]]) -> List[Dict[str, Any]]:
+    """执行知识库检索（不经过缓存）"""
+    conn = connect_db()
     cursor = conn.cursor()
     
+    filter_sql, filter_params = _tag_filter("knowledge_base", tags, "k")
     if category:
-        cursor.execute('''
-            SELECT id, title, content, category, tags, created_at 
-            FROM knowledge_base 
-            WHERE (title LIKE ? OR content LIKE ?) AND category = ?
-        ''', (f'%{query}%', f'%{query}%', category))
-    else:
-        cursor.execute('''
-            SELECT id, title, content, category, tags, created_at 
-            FROM knowledge_base 
-            WHERE title LIKE ? OR content LIKE ?
-        ''', (f'%{query}%', f'%{query}%'))
+        filter_sql += " AND k.category = ?"
+        filter_params.append(category)
+    
+    results = []
+    match = text_tokenizer.match_expression(query) if fulltext_available else ""
+    if match:
+        cursor.execute(f'''
+            SELECT k.id, k.title, k.content, k.category, k.tags, k.created_at
+            FROM knowledge_fts f JOIN knowledge_base k ON k.id = f.rowid
+            WHERE knowledge_fts MATCH ? {filter_sql}
+            ORDER BY f.rank
+        ''', [match] + filter_params)
+        results = cursor.fetchall()
+    
+    if not results:
+        # 跨越分词边界的片段在索引中查不到，退回子串匹配
+        cursor.execute(f'''
+            SELECT k.id, k.title, k.content, k.category, k.tags, k.created_at 
+            FROM knowledge_base k 
+            WHERE (k.title LIKE ? OR k.content LIKE ?) {filter_sql}
+        ''', [f'%{query}%', f'%{query}%'] + filter_params)
+        results = cursor.fetchall()
     
-    results = cursor.fetchall()
     conn.close()
     
     entries = []
@@ -465,10 +1513,51 @@ def search_knowledge_base(query: str, category: str = "") -> List[Dict[str, Any]
     
     return entries
 
-@mcp.tool()
+@mcp_tool()
+def get_facets(limit: int = 50) -> Dict[str, Any]:
+    """
+    获取分面统计：知识库各分类、各标签的条目数，以及文档各标签、各关键词的文档数
+    
+    Args:
+        limit: 每个分面最多返回的取值数（按数量降序）
+    """
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        
+        def tag_counts(source: str, kind: str) -> List[Dict[str, Any]]:
+            table, id_column = TAG_TABLES[source]
+            cursor.execute(f'''
+                SELECT t.name, COUNT(*) AS n FROM {table} r JOIN tags t ON t.id = r.tag_id
+                WHERE r.kind = ? GROUP BY r.tag_id ORDER BY n DESC, t.name LIMIT ?
+            ''', (kind, limit))
+            return [{"name": name, "count": count} for name, count in cursor.fetchall()]
+        
+        cursor.execute('''
+            SELECT COALESCE(category, ''), COUNT(*) AS n FROM knowledge_base
+            GROUP BY category ORDER BY n DESC LIMIT ?
+        ''', (limit,))
+        categories = [{"name": name, "count": count} for name, count in cursor.fetchall()]
+        
+        return {
+            "knowledge_base": {
+                "categories": categories,
+                "tags": tag_counts("knowledge_base", "tag")
+            },
+            "documents": {
+                "tags": tag_counts("documents", "tag"),
+                "keywords": tag_counts("documents", "keyword")
+            }
+        }
+    except Exception as e:
+        return {"error": f"Facet query failed: {str(e)}"}
+    finally:
+        conn.close()
+
+@mcp_tool()
 def list_documents() -> List[Dict[str, Any]]:
     """列出所有文档"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = connect_db()
     cursor = conn.cursor()
     cursor.execute("SELECT id, filename, summary, created_at FROM documents ORDER BY created_at DESC")
     results = cursor.fetchall()
@@ -485,30 +1574,54 @@ def list_documents() -> List[Dict[str, Any]]:
     
     return documents
 
-@mcp.tool()
-def get_statistics() -> Dict[str, Any]:
-    """获取系统统计信息"""
+@mcp_tool()
+def get_statistics(recompute: bool = False) -> Dict[str, Any]:
+    """
+    获取系统统计信息（读取触发器维护的计数，不扫描数据表）
+    
+    index_sizes 中 fulltext_rows_estimate 是估算值：全文索引为虚拟表，无法由触发器计数，
+    按文档数与知识条目数之和估算，可能与索引中的实际行数不同。
+    
+    Args:
+        recompute: 是否全量重新计算统计表（用于校正）
+    """
     conn = None
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect_db()
         cursor = conn.cursor()
         
-        # 文档统计
-        cursor.execute("SELECT COUNT(*) FROM documents")
-        doc_count = cursor.fetchone()[0]
+        if recompute:
+            _recompute_statistics(cursor)
+            conn.commit()
         
-        # 知识库统计
-        cursor.execute("SELECT COUNT(*) FROM knowledge_base")
-        kb_count = cursor.fetchone()[0]
+        cursor.execute("SELECT scope, key, count, bytes, updated_at FROM statistics")
+        rows = cursor.fetchall()
+        totals = {scope: (count, size, updated_at) for scope, key, count, size, updated_at in rows if key == ""}
+        doc_count, total_bytes, last_ingest = totals.get("documents", (0, 0, None))
         
-        # 分类统计
-        cursor.execute("SELECT category, COUNT(*) FROM knowledge_base GROUP BY category")
-        category_stats = dict(cursor.fetchall())
+        # 分组计数为0的行是删除后留下的，不再输出
+        documents_by_type = {key or "unknown": {"count": count, "bytes": size}
+                             for scope, key, count, size, _ in rows if scope == "document_type" and count}
+        category_stats = {key: count for scope, key, count, _, _ in rows if scope == "category" and count}
+        index_sizes = {key: count for scope, key, count, _, _ in rows if scope == "index"}
+        # 全文索引行数不由触发器维护，按记录数估算
+        index_sizes["fulltext_rows_estimate"] = doc_count + totals.get("knowledge_base", (0,))[0] if fulltext_available else 0
+        index_sizes["semantic_vector_bytes"] = sum(
+            os.path.getsize(semantic_index.vectors_path(source))
+            for source in SEMANTIC_SOURCES if os.path.exists(semantic_index.vectors_path(source))
+        )
+        index_sizes["database_bytes"] = os.path.getsize(DB_PATH)
         
         return {
             "total_documents": doc_count,
-            "total_knowledge_entries": kb_count,
+            "total_knowledge_entries": totals.get("knowledge_base", (0,))[0],
+            "total_bytes": total_bytes,
+            "documents_by_type": documents_by_type,
             "categories": category_stats,
+            "index_sizes": index_sizes,
+            "last_ingest_at": last_ingest,
+            "query_cache": query_cache.stats(),
+            "tokenizer_cache": text_tokenizer.cache_stats(),
             "database_path": DB_PATH
         }
     except Exception as e:
@@ -521,6 +1634,254 @@ def get_statistics() -> Dict[str, Any]:
             except:
                 pass
 
+# 后台任务
+
+INGEST_EXTENSIONS = {'.txt', '.md', '.pdf', '.docx', '.doc'}
+
+# 批量导入时每批生成摘要的文档数
+SUMMARY_BATCH_SIZE = 16
+
+def _run_parse_document_job(params: Dict[str, Any], job: JobContext) -> Dict[str, Any]:
+    """后台解析单个文档"""
+    job.report(0, 1, f"Parsing {os.path.basename(params['filepath'])}", force=True)
+    result = parse_document(**params)
+    if "error" in result:
+        raise RuntimeError(result["error"])
+    return result
+
+def _run_ingest_directory_job(params: Dict[str, Any], job: JobContext) -> Dict[str, Any]:
+    """后台批量导入目录中的文档；已导入的文件按哈希去重，因此中断后可安全重跑"""
+    directory = params["directory"]
+    files = []
+    for root, dirs, names in os.walk(directory):
+        if not params.get("recursive", True):
+            dirs[:] = []
+        dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+        files.extend(os.path.join(root, name) for name in sorted(names)
+                     if Path(name).suffix.lower() in INGEST_EXTENSIONS)
+
+    summary = {
+        "directory": directory,
+        "total_files": len(files),
+        "processed": 0,
+        "duplicates": 0,
+        "failed": 0,
+        "document_ids": [],
+        "errors": []
+    }
+    job.report(0, len(files), f"Found {len(files)} files", force=True)
+
+    near_duplicates = params.get("near_duplicates", "store")
+    if near_duplicates not in NEAR_DUPLICATE_ACTIONS:
+        raise ValueError(f"Invalid near_duplicates. Use: {', '.join(NEAR_DUPLICATE_ACTIONS)}")
+
+    # 摘要攒够一批后统一生成（批量幂迭代）
+    pending_summaries = []
+
+    # 文件哈希在线程池中并行计算，解析按原顺序依次进行
+    hashes = iter_file_hashes(files, with_legacy=legacy_hashes_present)
+    try:
+        for index, (filepath, file_hashes) in enumerate(hashes):
+            job.report(index, message=f"Parsing {os.path.basename(filepath)}")
+            result = _process_document(filepath, params.get("extract_keywords", True), False, near_duplicates,
+                                       params.get("similarity_threshold", 0.9), file_hashes)
+            if "error" in result:
+                summary["failed"] += 1
+                if len(summary["errors"]) < 100:
+                    summary["errors"].append({"filepath": filepath, "error": result["error"]})
+            elif result.get("success"):
+                summary["processed"] += 1
+                summary["document_ids"].append(result["document_id"])
+                if params.get("generate_summary", True):
+                    pending_summaries.append(result["document_id"])
+                    if len(pending_summaries) >= SUMMARY_BATCH_SIZE:
+                        _store_summaries(pending_summaries)
+                        pending_summaries = []
+            else:
+                summary["duplicates"] += 1
+    finally:
+        # 任务取消或出错时也为已导入的文档补上摘要，重跑时这些文档会按哈希跳过
+        _store_summaries(pending_summaries)
+
+    return summary
+
+def _store_summaries(doc_ids: List[int]) -> None:
+    """批量生成并保存文档摘要"""
+    if not doc_ids:
+        return
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        placeholders = ",".join("?" * len(doc_ids))
+        cursor.execute(f"SELECT id, content FROM documents WHERE id IN ({placeholders})", doc_ids)
+        rows = [(doc_id, content) for doc_id, content in cursor.fetchall() if content]
+        summaries = DocumentProcessor.generate_summaries([content for _, content in rows])
+        cursor.executemany("UPDATE documents SET summary = ?, updated_at = ? WHERE id = ?",
+                           [(text, datetime.now(), doc_id) for (doc_id, _), text in zip(rows, summaries)])
+        conn.commit()
+    finally:
+        conn.close()
+
+def _run_semantic_backfill_job(params: Dict[str, Any], job: JobContext) -> Dict[str, Any]:
+    """后台补建缺失的语义索引（升级前导入的内容、修改向量维度后清空的索引）"""
+    conn = connect_db()
+    try:
+        return {"newly_indexed": _ensure_semantic_index(conn, job)}
+    finally:
+        conn.close()
+
+job_queue.register("parse_document", _run_parse_document_job)
+job_queue.register("ingest_directory", _run_ingest_directory_job)
+job_queue.register("semantic_backfill", _run_semantic_backfill_job)
+
+def submit_semantic_backfill() -> Optional[Dict[str, Any]]:
+    """存在未建立语义索引的记录且没有未完成的补建任务时，提交后台补建任务"""
+    if not semantic_index.available:
+        return None
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        if not any(_unindexed_semantic_ids(cursor, source) for source in SEMANTIC_SOURCES):
+            return None
+    finally:
+        conn.close()
+    if any(job["kind"] == "semantic_backfill" for status in ("queued", "running") for job in job_queue.list(status)):
+        return None
+    return job_queue.submit("semantic_backfill")
+
+@mcp_tool()
+def submit_parse_document(filepath: str, extract_keywords: bool = True, generate_summary: bool = True) -> Dict[str, Any]:
+    """
+    以后台任务方式解析文档，立即返回任务ID，可通过 get_job_status 或 jobs://{job_id} 查询进度
+    
+    Args:
+        filepath: 文档文件路径
+        extract_keywords: 是否提取关键词
+        generate_summary: 是否生成摘要
+    """
+    filepath = _resolve_path(filepath)
+    if not os.path.exists(filepath):
+        return {"error": f"File not found: {filepath}"}
+    
+    return job_queue.submit("parse_document", {
+        "filepath": filepath,
+        "extract_keywords": extract_keywords,
+        "generate_summary": generate_summary
+    })
+
+@mcp_tool()
+def ingest_directory(directory: str, recursive: bool = True, extract_keywords: bool = True, generate_summary: bool = True,
+                     near_duplicates: str = "store", similarity_threshold: float = 0.9) -> Dict[str, Any]:
+    """
+    以后台任务方式批量导入目录中的文档，立即返回任务ID
+    
+    Args:
+        directory: 文档目录路径
+        recursive: 是否包含子目录
+        extract_keywords: 是否提取关键词
+        generate_summary: 是否生成摘要
+        near_duplicates: 近似重复文档的处理方式 (store, skip, link)
+        similarity_threshold: 判定为近似重复的相似度阈值 (0-1)
+    """
+    if near_duplicates not in NEAR_DUPLICATE_ACTIONS:
+        return {"error": f"Invalid near_duplicates. Use: {', '.join(NEAR_DUPLICATE_ACTIONS)}"}
+    
+    directory = _resolve_path(directory)
+    if not os.path.isdir(directory):
+        return {"error": f"Directory not found: {directory}"}
+    
+    return job_queue.submit("ingest_directory", {
+        "directory": directory,
+        "recursive": recursive,
+        "extract_keywords": extract_keywords,
+        "generate_summary": generate_summary,
+        "near_duplicates": near_duplicates,
+        "similarity_threshold": similarity_threshold
+    })
+
+@mcp_tool()
+def get_job_status(job_id: str) -> Dict[str, Any]:
+    """
+    获取后台任务的状态、进度和结果
+    
+    Args:
+        job_id: 任务ID
+    """
+    job = job_queue.get(job_id)
+    if job is None:
+        return {"error": f"Job {job_id} not found"}
+    return job
+
+@mcp_tool()
+def cancel_job(job_id: str) -> Dict[str, Any]:
+    """
+    取消后台任务
+    
+    Args:
+        job_id: 任务ID
+    """
+    return job_queue.cancel(job_id)
+
+@mcp_tool()
+def list_jobs(status: str = "", limit: int = 20) -> List[Dict[str, Any]]:
+    """
+    列出最近的后台任务
+    
+    Args:
+        status: 状态过滤 (queued, running, completed, failed, cancelled)
+        limit: 返回数量上限
+    """
+    if status and status not in JOB_STATUSES:
+        return [{"error": f"Invalid status. Use: {', '.join(JOB_STATUSES)}"}]
+    return job_queue.list(status, limit)
+
+@mcp_tool()
+def list_quarantined_files(limit: int = 100) -> Dict[str, Any]:
+    """
+    列出提取文本时超时或崩溃而被隔离的文件，以及提取工作进程池的状态
+    
+    Args:
+        limit: 返回数量上限
+    """
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT file_hash, filepath, reason, failures, quarantined_at FROM extraction_quarantine
+            ORDER BY quarantined_at DESC LIMIT ?
+        ''', (limit,))
+        files = [
+            {"file_hash": row[0], "filepath": row[1], "reason": row[2], "failures": row[3], "quarantined_at": row[4]}
+            for row in cursor.fetchall()
+        ]
+    finally:
+        conn.close()
+    return {
+        "isolated": extraction_pool is not None,
+        "workers": extraction_pool.status() if extraction_pool is not None else None,
+        "quarantined": files
+    }
+
+@mcp_tool()
+def release_quarantined_file(filepath: str = "") -> Dict[str, Any]:
+    """
+    解除文件的隔离，下次解析时重新尝试
+    
+    Args:
+        filepath: 被隔离的文件路径，为空时解除全部
+    """
+    conn = connect_db()
+    try:
+        cursor = conn.cursor()
+        if filepath:
+            cursor.execute("DELETE FROM extraction_quarantine WHERE filepath = ?", (_resolve_path(filepath),))
+        else:
+            cursor.execute("DELETE FROM extraction_quarantine")
+        conn.commit()
+        return {"released": cursor.rowcount}
+    finally:
+        conn.close()
+
 # 资源定义
 @mcp.resource("document://{document_id}")
 def get_document_resource(document_id: str) -> str:
@@ -538,7 +1899,7 @@ def get_document_resource(document_id: str) -> str:
 def get_knowledge_resource(entry_id: str) -> str:
     """获取知识库条目资源"""
     try:
-        conn = sqlite3.connect(DB_PATH)
+        conn = connect_db()
         cursor = conn.cursor()
         cursor.execute("SELECT title, content FROM knowledge_base WHERE id = ?", (int(entry_id),))
         result = cursor.fetchone()
@@ -551,7 +1912,56 @@ def get_knowledge_resource(entry_id: str) -> str:
     except ValueError:
         return f"Invalid entry ID: {entry_id}"
 
+@mcp.resource("jobs://{job_id}")
+def get_job_resource(job_id: str) -> str:
+    """获取后台任务状态资源"""
+    job = job_queue.get(job_id)
+    if job is None:
+        return f"Job {job_id} not found"
+    return json.dumps(job, ensure_ascii=False, indent=2, default=str)
+
+# 服务启动
+
+def warm_shared_caches():
+    """预加载分词词典等进程级缓存，共享服务模式下由所有会话复用"""
+    text_tokenizer.warm()
+
+def run_server(transport: Optional[str] = None, host: Optional[str] = None, port: Optional[int] = None):
+    """按配置启动服务器
+    
+    stdio 模式下每个客户端各自启动一个进程；sse / streamable-http 模式下在本机端口上
+    运行一个常驻进程，多个客户端会话共享同一份数据库连接配置、分词词典和缓存。
+    """
+    transport = transport or SERVER_CONFIG.get("transport", "stdio")
+    if transport not in SUPPORTED_TRANSPORTS:
+        raise ValueError(f"Unsupported transport: {transport}. Use: {', '.join(SUPPORTED_TRANSPORTS)}")
+    
+    if host:
+        mcp.settings.host = host
+    if port:
+        mcp.settings.port = port
+    
+    if transport != "stdio":
+        if SERVER_CONFIG.get("warm_on_start", True):
+            warm_shared_caches()
+        logger.info(f"Shared server listening on {mcp.settings.host}:{mcp.settings.port} ({transport})")
+    
+    # 恢复上次中断的后台任务，并在后台补建缺失的语义索引
+    job_queue.start()
+    backfill = submit_semantic_backfill()
+    if backfill:
+        logger.info(f"Semantic index backfill queued as job {backfill['id']}")
+    mcp.run(transport=transport)
+
 if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description=SERVER_CONFIG.get("description", ""))
+    parser.add_argument("--transport", choices=SUPPORTED_TRANSPORTS, help="传输方式，默认读取 config.py")
+    parser.add_argument("--host", help="共享服务模式的监听地址")
+    parser.add_argument("--port", type=int, help="共享服务模式的监听端口")
+    args = parser.parse_args()
+    
     print("智能文档处理与知识管理MCP服务器启动中...")
     print("支持的功能:")
     print("- 文档解析 (TXT, PDF, DOCX)")
@@ -559,6 +1969,7 @@ if __name__ == "__main__":
     print("- 摘要生成")
     print("- 知识库管理")
     print("- 智能搜索")
+    print("- 后台任务")
     
     # 启动服务器
-    mcp.run()
\ No newline at end of file
+    run_server(args.transport, args.host, args.port)
\ No newline at end of file
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+DOCX流式文本提取
+直接从zip包中增量解析 word/document.xml（以及页眉、脚注、尾注），
+处理完的元素立即释放，不构建完整的文档树；表格按行输出，单元格以制表符分隔。
+"""
+
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from typing import IO, Iterator, List
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+_P, _T, _TAB, _BR, _CR = _W + "p", _W + "t", _W + "tab", _W + "br", _W + "cr"
+_TBL, _TR, _TC = _W + "tbl", _W + "tr", _W + "tc"
+
+_HEADER_PATTERN = re.compile(r"^word/header\d*\.xml$")
+_NOTE_PARTS = ("word/footnotes.xml", "word/endnotes.xml")
+
+
+def _paragraph_text(paragraph: ET.Element) -> str:
+    parts = []
+    for node in paragraph.iter():
+        if node.tag == _T:
+            parts.append(node.text or "")
+        elif node.tag == _TAB:
+            parts.append("\t")
+        elif node.tag in (_BR, _CR):
+            parts.append("\n")
+    return "".join(parts)
+
+
+def _iter_part(stream: IO[bytes]) -> Iterator[str]:
+    """逐段输出一个XML部件中的文本（段落一行，表格一行一条）"""
+    # 表格可以嵌套，每层保存 (当前行的单元格列表, 当前单元格的段落列表)
+    tables: List[tuple] = []
+    parents: List[ET.Element] = []
+    for event, element in ET.iterparse(stream, events=("start", "end")):
+        if event == "start":
+            parents.append(element)
+            if element.tag == _TBL:
+                tables.append(([], []))
+            continue
+
+        parents.pop()
+        tag = element.tag
+        if tag == _P:
+            text = _paragraph_text(element)
+            if tables:
+                tables[-1][1].append(text)
+            elif text.strip():
+                yield text
+        elif tag == _TC and tables:
+            cells, paragraphs = tables[-1]
+            cells.append(" ".join(p.strip() for p in paragraphs if p.strip()))
+            paragraphs.clear()
+        elif tag == _TR and tables:
+            cells = tables[-1][0]
+            row = "\t".join(cells)
+            cells.clear()
+            if len(tables) > 1:
+                # 嵌套表格的行并入外层单元格
+                tables[-2][1].append(row.replace("\t", " "))
+            elif row.strip():
+                yield row
+        elif tag == _TBL and tables:
+            tables.pop()
+
+        # 段落和表格元素处理完后从父节点移除，已解析的子树随即释放
+        if parents and tag in (_P, _TR, _TC, _TBL):
+            parents[-1].remove(element)
+
+
+def iter_docx_text(source, chunk_size: int = 64 * 1024) -> Iterator[str]:
+    """流式提取DOCX文本，按约 chunk_size 个字符分块输出
+
+    顺序为：页眉（去重）、正文、脚注和尾注。
+
+    Raises:
+        zipfile.BadZipFile: 不是有效的DOCX（zip）文件
+        KeyError: 缺少 word/document.xml
+        xml.etree.ElementTree.ParseError: XML损坏
+    """
+    with zipfile.ZipFile(source) as archive:
+        names = archive.namelist()
+        if "word/document.xml" not in names:
+            raise KeyError("word/document.xml")
+
+        def parts() -> Iterator[str]:
+            seen_headers = set()
+            for name in sorted(n for n in names if _HEADER_PATTERN.match(n)):
+                with archive.open(name) as stream:
+                    for line in _iter_part(stream):
+                        if line not in seen_headers:
+                            seen_headers.add(line)
+                            yield line
+            with archive.open("word/document.xml") as stream:
+                yield from _iter_part(stream)
+            for name in _NOTE_PARTS:
+                if name in names:
+                    with archive.open(name) as stream:
+                        yield from _iter_part(stream)
+
+        buffer, size = [], 0
+        for line in parts():
+            buffer.append(line + "\n")
+            size += len(line) + 1
+            if size >= chunk_size:
+                yield "".join(buffer)
+                buffer, size = [], 0
+        if buffer:
+            yield "".join(buffer)
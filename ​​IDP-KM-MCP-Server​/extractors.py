@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文档文本提取
+按扩展名从TXT、PDF和DOCX文件中提取文本。模块不依赖服务器状态，
+隔离模式下由工作进程直接导入执行。
+"""
+
+import logging
+import zipfile
+from typing import Sequence
+from xml.etree import ElementTree
+
+from docx_reader import iter_docx_text
+from text_reader import DEFAULT_ENCODINGS, ExtractionError, read_text
+
+logger = logging.getLogger(__name__)
+
+# 尝试导入可选依赖
+pdf_available = False
+docx_available = False
+
+try:
+    import PyPDF2
+    pdf_available = True
+except ImportError:
+    PyPDF2 = None
+
+try:
+    from docx import Document
+    docx_available = True
+except ImportError:
+    Document = None
+
+TEXT_EXTENSIONS = (".txt", ".md")
+PDF_EXTENSIONS = (".pdf",)
+DOCX_EXTENSIONS = (".docx", ".doc")
+
+
+def extract_txt(filepath: str, encodings: Sequence[str] = DEFAULT_ENCODINGS) -> str:
+    """从TXT文件提取文本（按BOM和候选编码判断编码），失败时抛出 ExtractionError"""
+    return read_text(filepath, encodings)
+
+
+def extract_pdf(filepath: str) -> str:
+    """从PDF文件提取文本，失败时抛出 ExtractionError"""
+    if not pdf_available or PyPDF2 is None:
+        raise ExtractionError("PDF processing not available. Please install PyPDF2: pip install PyPDF2")
+
+    try:
+        text = ""
+        with open(filepath, 'rb') as file:
+            pdf_reader = PyPDF2.PdfReader(file)
+            for page in pdf_reader.pages:
+                text += page.extract_text() + "\n"
+        return text
+    except MemoryError:
+        raise
+    except Exception as e:
+        raise ExtractionError(f"Error reading PDF file: {str(e)}") from e
+
+
+def extract_docx(filepath: str) -> str:
+    """从DOCX文件提取文本（流式解析，包含表格、页眉和脚注），解析失败时改用python-docx
+
+    Raises:
+        ExtractionError: 两种方式都无法提取文本
+    """
+    try:
+        return "".join(iter_docx_text(filepath))
+    except (zipfile.BadZipFile, KeyError, ElementTree.ParseError) as e:
+        logger.info(f"Streaming DOCX extraction failed for {filepath}, falling back to python-docx: {e}")
+    except OSError as e:
+        raise ExtractionError(f"Error reading DOCX file: {str(e)}") from e
+
+    if not docx_available or Document is None:
+        raise ExtractionError("DOCX processing not available. Please install python-docx: pip install python-docx")
+
+    try:
+        doc = Document(filepath)
+        lines = [paragraph.text for paragraph in doc.paragraphs]
+        for table in doc.tables:
+            lines.extend("\t".join(cell.text for cell in row.cells) for row in table.rows)
+        return "\n".join(lines) + "\n"
+    except MemoryError:
+        raise
+    except Exception as e:
+        raise ExtractionError(f"Error reading DOCX file: {str(e)}") from e
+
+
+def extract_text(filepath: str, file_extension: str, encodings: Sequence[str] = DEFAULT_ENCODINGS) -> str:
+    """按扩展名提取文本
+
+    Raises:
+        ExtractionError: 不支持的文件类型或提取失败
+    """
+    if file_extension in TEXT_EXTENSIONS:
+        return extract_txt(filepath, encodings)
+    if file_extension in PDF_EXTENSIONS:
+        return extract_pdf(filepath)
+    if file_extension in DOCX_EXTENSIONS:
+        return extract_docx(filepath)
+    raise ExtractionError(f"Unsupported file type: {file_extension}")
@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文件哈希
+使用可复用的大缓冲区和BLAKE2b计算文件摘要，支持批量并行计算。
+"""
+
+import hashlib
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterable, Iterator, Optional, Tuple, Union
+
+HASH_ALGORITHM = "blake2b"
+DIGEST_SIZE = 32  # 256位摘要，十六进制长度64
+BUFFER_SIZE = 1024 * 1024
+
+# 旧版本使用的MD5摘要（十六进制长度32），用于迁移和兼容查重
+LEGACY_HASH_LENGTH = 32
+
+_local = threading.local()
+
+
+class FileHashError(Exception):
+    """文件无法读取，哈希计算失败"""
+
+    def __init__(self, filepath: str, reason: Exception):
+        super().__init__(f"Cannot hash {filepath}: {reason}")
+        self.filepath = filepath
+        self.reason = reason
+
+
+def _buffer(size: int) -> bytearray:
+    # 每个线程复用一个读缓冲区，避免为每个文件重新分配
+    buffer = getattr(_local, "buffer", None)
+    if buffer is None or len(buffer) != size:
+        buffer = _local.buffer = bytearray(size)
+    return buffer
+
+
+def hash_file(filepath: str, with_legacy: bool = False,
+              buffer_size: int = BUFFER_SIZE) -> Union[str, Tuple[str, str]]:
+    """计算文件的BLAKE2b摘要
+
+    Args:
+        filepath: 文件路径
+        with_legacy: 同时计算旧版MD5摘要（同一次读取），返回 (blake2b, md5)
+        buffer_size: 读缓冲区大小
+
+    Raises:
+        FileHashError: 文件无法读取
+    """
+    digest = hashlib.blake2b(digest_size=DIGEST_SIZE)
+    legacy = hashlib.md5() if with_legacy else None
+    buffer = _buffer(buffer_size)
+    view = memoryview(buffer)
+    try:
+        with open(filepath, "rb", buffering=0) as f:
+            while True:
+                size = f.readinto(buffer)
+                if not size:
+                    break
+                digest.update(view[:size])
+                if legacy is not None:
+                    legacy.update(view[:size])
+    except OSError as e:
+        raise FileHashError(filepath, e) from e
+    finally:
+        view.release()
+
+    if legacy is not None:
+        return digest.hexdigest(), legacy.hexdigest()
+    return digest.hexdigest()
+
+
+def iter_file_hashes(filepaths: Iterable[str], max_workers: Optional[int] = None,
+                     with_legacy: bool = False) -> Iterator[Tuple[str, Union[str, Tuple[str, str], FileHashError]]]:
+    """并行计算多个文件的摘要，按输入顺序返回 (路径, 摘要或FileHashError)
+
+    hashlib在处理大块数据时会释放GIL，线程池即可利用多核和磁盘并发。
+    """
+    filepaths = list(filepaths)
+    if max_workers is None:
+        max_workers = min(8, (os.cpu_count() or 1) + 2)
+
+    def compute(filepath):
+        try:
+            return hash_file(filepath, with_legacy)
+        except FileHashError as e:
+            return e
+
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="file-hash") as executor:
+        yield from zip(filepaths, executor.map(compute, filepaths))
+
+
+def is_legacy_hash(file_hash: str) -> bool:
+    """判断数据库中的哈希值是否为旧版MD5（或旧版本失败时写入的 error_ 占位值）"""
+    return len(file_hash) == LEGACY_HASH_LENGTH or file_hash.startswith("error_")
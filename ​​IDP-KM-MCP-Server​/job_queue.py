@@ -0,0 +1,369 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+后台任务队列
+将耗时的工具调用提交为后台任务并立即返回任务ID，任务状态持久化在SQLite中，
+服务重启后未完成的任务会重新排队执行，反复中断达到执行次数上限的任务标记为失败。
+IDA-MCP-Server 与 IDP-KM-MCP-Server 独立部署、互不依赖，两个服务各有一份本模块；
+除模块说明外两份代码保持一致，修改时需同步。
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+JOB_STATUSES = ("queued", "running", "completed", "failed", "cancelled")
+
+# 任务最多执行的次数：每次中断后重启都会重新执行一次，达到上限后标记为失败，
+# 避免导致进程崩溃的任务（如超大文件耗尽内存）在每次重启后反复执行
+DEFAULT_MAX_ATTEMPTS = 3
+
+
+def _utc_now() -> str:
+    """当前UTC时间的ISO-8601字符串（任务表中的时间统一使用此格式）"""
+    return datetime.now(timezone.utc).isoformat(timespec="microseconds")
+
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """判断任务所属进程是否仍在运行"""
+    if not pid or pid == os.getpid():
+        # 当前进程启动前遗留的同PID任务同样视为中断
+        return False
+    if os.name == "nt":
+        # Windows下 os.kill 会终止目标进程，改为尝试打开进程句柄
+        import ctypes
+        handle = ctypes.windll.kernel32.OpenProcess(0x1000, False, pid)
+        if not handle:
+            return False
+        ctypes.windll.kernel32.CloseHandle(handle)
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, OSError):
+        return True
+    return True
+
+
+class JobCancelled(Exception):
+    """任务已被取消"""
+
+
+class JobContext:
+    """任务执行上下文，供任务处理函数上报进度和检查取消状态"""
+
+    # 进度写库的最小间隔（秒），避免频繁提交
+    REPORT_INTERVAL = 0.5
+
+    def __init__(self, queue: "JobQueue", job_id: str):
+        self.queue = queue
+        self.job_id = job_id
+        self._last_report = 0.0
+
+    def report(self, progress: int, total: Optional[int] = None, message: Optional[str] = None, force: bool = False):
+        """上报进度（最多每 REPORT_INTERVAL 秒写库一次），写库时同时检查取消状态，已取消时抛出 JobCancelled"""
+        now = time.monotonic()
+        if force or now - self._last_report >= self.REPORT_INTERVAL:
+            self._last_report = now
+            if self.queue._update_progress(self.job_id, progress, total, message):
+                raise JobCancelled(self.job_id)
+
+    def is_cancelled(self) -> bool:
+        """是否已请求取消"""
+        return self.queue._cancel_requested(self.job_id)
+
+    def check_cancelled(self):
+        """已请求取消时抛出 JobCancelled"""
+        if self.is_cancelled():
+            raise JobCancelled(self.job_id)
+
+
+class JobQueue:
+    """基于SQLite的持久化任务队列"""
+
+    def __init__(self, db_path: str, workers: int = 1, timeout: float = 30.0,
+                 max_attempts: int = DEFAULT_MAX_ATTEMPTS):
+        self.db_path = db_path
+        self.workers = workers
+        self.timeout = timeout
+        self.max_attempts = max(1, max_attempts)
+        self._handlers: Dict[str, Callable[[Dict[str, Any], JobContext], Any]] = {}
+        self._threads: List[threading.Thread] = []
+        self._wakeup = threading.Event()
+        self._claim_lock = threading.Lock()
+        self._running = False
+        self._start_lock = threading.Lock()
+        self.init_table()
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=self.timeout)
+
+    def init_table(self):
+        """创建任务表"""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    params TEXT,
+                    status TEXT NOT NULL DEFAULT 'queued',
+                    progress INTEGER DEFAULT 0,
+                    total INTEGER,
+                    message TEXT,
+                    result TEXT,
+                    error TEXT,
+                    cancel_requested INTEGER DEFAULT 0,
+                    attempts INTEGER DEFAULT 0,
+                    owner_pid INTEGER,
+                    created_at TIMESTAMP,
+                    started_at TIMESTAMP,
+                    finished_at TIMESTAMP,
+                    updated_at TIMESTAMP
+                )
+            ''')
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+            conn.commit()
+        finally:
+            conn.close()
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any], JobContext], Any]):
+        """注册任务类型及其处理函数，处理函数返回值需可JSON序列化"""
+        self._handlers[kind] = handler
+
+    @property
+    def kinds(self) -> List[str]:
+        return sorted(self._handlers)
+
+    def start(self):
+        """启动工作线程，并将上次运行中断的任务重新排队（已达执行次数上限的标记为失败）"""
+        with self._start_lock:
+            if self._running:
+                return
+            conn = self._connect()
+            try:
+                # 只恢复所属进程已退出的任务，避免与仍在运行的其他服务进程重复执行
+                running = conn.execute("SELECT id, owner_pid, attempts FROM jobs WHERE status = 'running'").fetchall()
+                orphaned = [(job_id, attempts or 0) for job_id, owner_pid, attempts in running
+                            if not _process_alive(owner_pid)]
+                resumed = [job_id for job_id, attempts in orphaned if attempts < self.max_attempts]
+                abandoned = [(job_id, attempts) for job_id, attempts in orphaned if attempts >= self.max_attempts]
+                now = _utc_now()
+                conn.executemany(
+                    "UPDATE jobs SET status = 'queued', owner_pid = NULL, message = 'Resumed after restart', "
+                    "updated_at = ? WHERE id = ? AND status = 'running'", [(now, job_id) for job_id in resumed]
+                )
+                conn.executemany(
+                    "UPDATE jobs SET status = 'failed', owner_pid = NULL, error = ?, finished_at = ?, updated_at = ? "
+                    "WHERE id = ? AND status = 'running'",
+                    [(f"Interrupted {attempts} times; not retried (max_attempts={self.max_attempts})", now, now, job_id)
+                     for job_id, attempts in abandoned]
+                )
+                conn.commit()
+                if resumed:
+                    logger.info(f"Resumed {len(resumed)} interrupted job(s)")
+                if abandoned:
+                    logger.warning(f"Failed {len(abandoned)} job(s) interrupted {self.max_attempts} or more times")
+            finally:
+                conn.close()
+
+            self._running = True
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._wakeup.set()
+
+    def stop(self, timeout: Optional[float] = None):
+        """停止工作线程（运行中的任务下次启动时恢复）"""
+        self._running = False
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+    def submit(self, kind: str, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """提交任务，立即返回任务信息"""
+        if kind not in self._handlers:
+            return {"error": f"Unknown job kind: {kind}", "available_kinds": self.kinds}
+
+        job_id = uuid.uuid4().hex
+        now = _utc_now()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                INSERT INTO jobs (id, kind, params, status, created_at, updated_at)
+                VALUES (?, ?, ?, 'queued', ?, ?)
+            ''', (job_id, kind, json.dumps(params or {}, ensure_ascii=False), now, now))
+            conn.commit()
+        finally:
+            conn.close()
+
+        self.start()
+        self._wakeup.set()
+        return self.get(job_id)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """获取任务状态"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row_to_dict(row) if row else None
+
+    def list(self, status: str = "", limit: int = 50) -> List[Dict[str, Any]]:
+        """列出最近的任务"""
+        conn = self._connect()
+        conn.row_factory = sqlite3.Row
+        try:
+            if status:
+                rows = conn.execute(
+                    "SELECT * FROM jobs WHERE status = ? ORDER BY created_at DESC LIMIT ?", (status, limit)
+                ).fetchall()
+            else:
+                rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)).fetchall()
+        finally:
+            conn.close()
+        return [self._row_to_dict(row, include_result=False) for row in rows]
+
+    def cancel(self, job_id: str) -> Dict[str, Any]:
+        """取消任务：排队中的任务直接取消，运行中的任务在下次上报进度时停止"""
+        now = _utc_now()
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE jobs SET status = 'cancelled', cancel_requested = 1, finished_at = ?, updated_at = ? "
+                "WHERE id = ? AND status = 'queued'", (now, now, job_id)
+            )
+            conn.execute(
+                "UPDATE jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = 'running'",
+                (now, job_id)
+            )
+            conn.commit()
+        finally:
+            conn.close()
+
+        job = self.get(job_id)
+        if job is None:
+            return {"error": f"Job {job_id} not found"}
+        return job
+
+    def _claim_next(self) -> Optional[sqlite3.Row]:
+        with self._claim_lock:
+            conn = self._connect()
+            conn.row_factory = sqlite3.Row
+            try:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                now = _utc_now()
+                cursor = conn.execute(
+                    "UPDATE jobs SET status = 'running', attempts = attempts + 1, owner_pid = ?, started_at = ?, "
+                    "updated_at = ? WHERE id = ? AND status = 'queued'", (os.getpid(), now, now, row["id"])
+                )
+                conn.commit()
+                # 读取与认领之间任务可能已被取消
+                return row if cursor.rowcount else None
+            finally:
+                conn.close()
+
+    def _worker_loop(self):
+        while self._running:
+            row = self._claim_next()
+            if row is None:
+                self._wakeup.wait(timeout=1.0)
+                self._wakeup.clear()
+                continue
+            self._run(row)
+
+    def _run(self, row: sqlite3.Row):
+        job_id = row["id"]
+        handler = self._handlers.get(row["kind"])
+        if handler is None:
+            self._finish(job_id, "failed", error=f"No handler registered for job kind: {row['kind']}")
+            return
+
+        context = JobContext(self, job_id)
+        try:
+            params = json.loads(row["params"]) if row["params"] else {}
+            result = handler(params, context)
+            self._finish(job_id, "completed", result=result)
+        except JobCancelled:
+            self._finish(job_id, "cancelled", message="Cancelled by request")
+        except Exception as e:
+            logger.exception(f"Job {job_id} ({row['kind']}) failed")
+            self._finish(job_id, "failed", error=str(e))
+
+    def _finish(self, job_id: str, status: str, result: Any = None, error: Optional[str] = None,
+                message: Optional[str] = None):
+        now = _utc_now()
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE jobs SET status = ?, result = ?, error = ?, message = COALESCE(?, message),
+                    progress = CASE WHEN ? = 'completed' THEN COALESCE(total, progress) ELSE progress END,
+                    finished_at = ?, updated_at = ?
+                WHERE id = ?
+            ''', (status, json.dumps(result, ensure_ascii=False) if result is not None else None, error,
+                  message, status, now, now, job_id))
+            conn.commit()
+        finally:
+            conn.close()
+
+    def _update_progress(self, job_id: str, progress: int, total: Optional[int], message: Optional[str]) -> bool:
+        """写入进度，返回是否已请求取消（同一个连接完成）"""
+        conn = self._connect()
+        try:
+            conn.execute('''
+                UPDATE jobs SET progress = ?, total = COALESCE(?, total), message = COALESCE(?, message),
+                    updated_at = ?
+                WHERE id = ?
+            ''', (progress, total, message, _utc_now(), job_id))
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            conn.commit()
+        finally:
+            conn.close()
+        return bool(row and row[0])
+
+    def _cancel_requested(self, job_id: str) -> bool:
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return bool(row and row[0])
+
+    @staticmethod
+    def _row_to_dict(row: sqlite3.Row, include_result: bool = True) -> Dict[str, Any]:
+        job = {
+            "id": row["id"],
+            "kind": row["kind"],
+            "status": row["status"],
+            "progress": row["progress"],
+            "total": row["total"],
+            "percent": round(100.0 * row["progress"] / row["total"], 1) if row["total"] else None,
+            "message": row["message"],
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+            "updated_at": row["updated_at"]
+        }
+        if include_result:
+            job["params"] = json.loads(row["params"]) if row["params"] else {}
+            job["result"] = json.loads(row["result"]) if row["result"] else None
+        return job
@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文档近似去重
+基于字符shingle的MinHash签名和LSH分桶，用于发现内容几乎相同的文档
+（例如元数据不同但正文相同的重新导出版本）。
+"""
+
+import hashlib
+import random
+import re
+import sys
+import zlib
+from array import array
+from typing import Iterable, List, Set, Tuple
+
+# 尝试导入可选依赖（有numpy时批量计算签名）
+numpy_available = False
+
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    np = None
+
+# 哈希函数取模用的梅森素数，保证 a*x+b 在uint64范围内不溢出
+_PRIME = (1 << 31) - 1
+_MAX_HASH = _PRIME - 1
+
+_NORMALIZE_PATTERN = re.compile(r'[\W_]+', re.UNICODE)
+
+
+class MinHasher:
+    """MinHash签名计算器
+
+    文本先去除空白和标点并转为小写，再切分为长度为 shingle_size 的字符片段；
+    签名由 num_perm 个哈希函数下的最小值组成，两个签名相同位置相等的比例即为
+    Jaccard相似度的估计。LSH将签名切分为 bands 段，任一段完全相同即成为候选。
+    """
+
+    def __init__(self, num_perm: int = 128, bands: int = 16, shingle_size: int = 5, seed: int = 1):
+        if num_perm % bands:
+            raise ValueError("num_perm must be divisible by bands")
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle_size = shingle_size
+
+        rng = random.Random(seed)
+        self._a = [rng.randint(1, _MAX_HASH) for _ in range(num_perm)]
+        self._b = [rng.randint(0, _MAX_HASH) for _ in range(num_perm)]
+        if numpy_available:
+            self._a_np = np.array(self._a, dtype=np.uint64)[:, None]
+            self._b_np = np.array(self._b, dtype=np.uint64)[:, None]
+
+    def shingles(self, text: str) -> Set[int]:
+        """将文本切分为字符shingle并哈希为32位整数"""
+        normalized = _NORMALIZE_PATTERN.sub('', text.lower())
+        if not normalized:
+            return set()
+        if len(normalized) <= self.shingle_size:
+            return {zlib.crc32(normalized.encode('utf-8'))}
+        size = self.shingle_size
+        return {
+            zlib.crc32(normalized[i:i + size].encode('utf-8'))
+            for i in range(len(normalized) - size + 1)
+        }
+
+    def signature(self, text: str) -> array:
+        """计算文本的MinHash签名，空文本返回空签名"""
+        values = self.shingles(text)
+        if not values:
+            return array('I')
+        if numpy_available:
+            return self._signature_numpy(values)
+
+        signature = array('I')
+        for a, b in zip(self._a, self._b):
+            signature.append(min((a * x + b) % _PRIME for x in values))
+        return signature
+
+    def _signature_numpy(self, values: Set[int], block: int = 8192) -> array:
+        hashes = np.fromiter(values, dtype=np.uint64, count=len(values))
+        minimum = np.full(self.num_perm, _PRIME, dtype=np.uint64)
+        # 分块计算，避免 num_perm × shingle数 的矩阵占用过多内存
+        for start in range(0, len(hashes), block):
+            chunk = hashes[start:start + block][None, :]
+            np.minimum(minimum, ((self._a_np * chunk + self._b_np) % _PRIME).min(axis=1), out=minimum)
+        return array('I', minimum.astype(np.uint32).tobytes())
+
+    def band_buckets(self, signature: array) -> List[Tuple[int, int]]:
+        """将签名切分为LSH分段，返回 (分段序号, 桶哈希) 列表"""
+        buckets = []
+        for band in range(self.bands):
+            segment = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+            digest = hashlib.blake2b(segment, digest_size=8).digest()
+            buckets.append((band, int.from_bytes(digest, 'little', signed=True)))
+        return buckets
+
+    @staticmethod
+    def similarity(first: array, second: array) -> float:
+        """根据两个签名估计Jaccard相似度"""
+        if not first or len(first) != len(second):
+            return 0.0
+        return sum(1 for x, y in zip(first, second) if x == y) / len(first)
+
+    @staticmethod
+    def to_bytes(signature: array) -> bytes:
+        """序列化签名（统一使用小端字节序）"""
+        if sys.byteorder != 'little':
+            signature = array('I', signature)
+            signature.byteswap()
+        return signature.tobytes()
+
+    @staticmethod
+    def from_bytes(data: bytes) -> array:
+        """反序列化签名"""
+        signature = array('I')
+        signature.frombytes(data)
+        if sys.byteorder != 'little':
+            signature.byteswap()
+        return signature
+
+
+def group_pairs(pairs: Iterable[Tuple[int, int]]) -> List[List[int]]:
+    """将相似文档对合并为重复组（并查集）"""
+    parent = {}
+
+    def find(x):
+        parent.setdefault(x, x)
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    for x, y in pairs:
+        root_x, root_y = find(x), find(y)
+        if root_x != root_y:
+            parent[max(root_x, root_y)] = min(root_x, root_y)
+
+    groups = {}
+    for x in parent:
+        groups.setdefault(find(x), []).append(x)
+    return sorted((sorted(members) for members in groups.values() if len(members) > 1), key=lambda g: g[0])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+查询结果缓存
+按规范化后的查询参数缓存检索结果（LRU，限制条目数、总字节数和存活时间）。
+每条缓存记录写入时的数据版本号，数据表有写入时版本号递增，旧版本的缓存自然失效。
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+_ASCII_LOWER = str.maketrans("ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz")
+
+
+def normalize_query(query: str) -> str:
+    """合并空白并将ASCII字母转为小写
+
+    SQLite的 LIKE 只对ASCII字母忽略大小写、FTS5也会转为小写，
+    因此检索前先做同样的规范化，相同含义的查询共用缓存且结果不变。
+    """
+    return " ".join(str(query).split()).translate(_ASCII_LOWER)
+
+
+class QueryCache:
+    """带版本号校验的LRU缓存
+
+    结果以JSON文本保存，命中时解析出新对象返回，调用方修改返回值不会影响缓存。
+    """
+
+    def __init__(self, max_entries: int = 1024, max_bytes: int = 16 * 1024 * 1024, ttl: float = 300.0):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, generation: int) -> Optional[Any]:
+        """读取缓存；版本号不一致或已过期时返回 None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            entry_generation, expires_at, payload, _ = entry
+            if entry_generation != generation or expires_at < time.monotonic():
+                self._discard(key)
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+        return json.loads(payload)
+
+    def put(self, key: Hashable, generation: int, value: Any) -> None:
+        """写入缓存，超过字节上限的结果不缓存"""
+        payload = json.dumps(value, ensure_ascii=False, default=str)
+        size = len(payload.encode("utf-8"))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (generation, time.monotonic() + self.ttl, payload, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                self._discard(next(iter(self._entries)))
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0
+            }
+
+    def _discard(self, key: Hashable) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[3]
@@ -0,0 +1,374 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+本地语义检索
+文本按段落切块后用哈希n-gram特征（词、词内字符n-gram、中文单字和双字）向量化，
+向量以float32矩阵追加写入文件并通过内存映射检索，全程本地计算，无需联网。
+语料较大时可构建IVF粗量化索引，只在最接近查询的若干聚类中计算相似度。
+"""
+
+import math
+import os
+import re
+import zlib
+from collections import Counter
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+# 尝试导入可选依赖（语义检索需要numpy）
+numpy_available = False
+
+try:
+    import numpy as np
+    numpy_available = True
+except ImportError:
+    np = None
+
+SOURCES = ("documents", "knowledge_base")
+
+_CJK_RANGES = "㐀-䶿一-鿿豈-﫿"
+_TOKEN_PATTERN = re.compile(f"[{_CJK_RANGES}]+|[^\\W_{_CJK_RANGES}]+", re.UNICODE)
+_CJK_PATTERN = re.compile(f"[{_CJK_RANGES}]")
+
+# 分块时优先断开的位置：段落、句末标点、空白
+_BREAK_CHARS = ("\n", "。！？.!?；;", " \t")
+
+
+def split_chunks(text: str, size: int = 1000, overlap: int = 150) -> List[Tuple[int, int]]:
+    """将文本切分为有重叠的块，返回 (起始位置, 长度) 列表，跳过空白块"""
+    chunks = []
+    start, length = 0, len(text)
+    while start < length:
+        end = min(start + size, length)
+        if end < length:
+            for chars in _BREAK_CHARS:
+                cut = max(text.rfind(char, start + size // 2, end) for char in chars)
+                if cut > 0:
+                    end = cut + 1
+                    break
+        if text[start:end].strip():
+            chunks.append((start, end - start))
+        if end >= length:
+            break
+        start = max(end - overlap, start + 1)
+    return chunks
+
+
+class TextVectorizer:
+    """哈希n-gram向量化
+
+    特征经crc32哈希到 dim 维（带符号，冲突可部分抵消），词频取 1+log(tf)，
+    向量做L2归一化，因此内积即余弦相似度。
+    """
+
+    def __init__(self, dim: int = 1024, char_ngram: int = 3, ngram_weight: float = 0.5):
+        if dim <= 0 or dim & (dim - 1):
+            raise ValueError("dim must be a power of two")
+        self.dim = dim
+        self.char_ngram = char_ngram
+        self.ngram_weight = ngram_weight
+        self._mask = dim - 1
+
+    def features(self, text: str) -> Tuple[Counter, Counter]:
+        """提取 (词特征, 字符n-gram特征) 计数"""
+        words, grams = Counter(), Counter()
+        n = self.char_ngram
+        for token in _TOKEN_PATTERN.findall(text.lower()):
+            if _CJK_PATTERN.match(token):
+                # 中文不做分词：单字作为字符特征，相邻双字近似词
+                grams.update(token)
+                words.update(token[i:i + 2] for i in range(len(token) - 1))
+            else:
+                words[token] += 1
+                if len(token) > n:
+                    padded = f"<{token}>"
+                    grams.update("#" + padded[i:i + n] for i in range(len(padded) - n + 1))
+        return words, grams
+
+    def _fill(self, text: str, out) -> None:
+        mask = self._mask
+        for counter, weight in zip(self.features(text), (1.0, self.ngram_weight)):
+            for feature, tf in counter.items():
+                h = zlib.crc32(feature.encode("utf-8"))
+                out[h & mask] += (weight if h & 0x80000000 else -weight) * (1.0 + math.log(tf))
+        norm = float(np.linalg.norm(out))
+        if norm:
+            out /= norm
+
+    def transform(self, texts: Sequence[str]):
+        """向量化多段文本，返回 (n, dim) 的float32矩阵"""
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for i, text in enumerate(texts):
+            self._fill(text, matrix[i])
+        return matrix
+
+
+class SemanticIndex:
+    """分块向量索引
+
+    每个数据源一个向量文件（行号即矩阵行），分块元数据、文档频率和IVF聚类中心
+    保存在SQLite中。追加写入在调用方的数据库事务内完成：先写入记录行取得写锁，
+    再分配行号、写入分块行，最后写向量文件，多个进程分配的行号不冲突；
+    事务回滚时已写入的向量行会被后续写入覆盖。
+    """
+
+    BATCH_ROWS = 1024
+    BLOCK_ROWS = 65536
+
+    def __init__(self, vectors_dir: str, dim: int = 1024, chunk_size: int = 1000, chunk_overlap: int = 150):
+        self.vectors_dir = vectors_dir
+        self.dim = dim
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.vectorizer = TextVectorizer(dim)
+
+    @property
+    def available(self) -> bool:
+        return numpy_available
+
+    def vectors_path(self, source: str) -> str:
+        return os.path.join(self.vectors_dir, f"semantic_{source}.f32")
+
+    def init_tables(self, cursor) -> None:
+        """创建索引表；向量维度变化时清空旧索引，之后按需重建"""
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS semantic_items (
+                source TEXT NOT NULL,
+                source_id INTEGER NOT NULL,
+                chunks INTEGER NOT NULL,
+                PRIMARY KEY (source, source_id)
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS semantic_chunks (
+                source TEXT NOT NULL,
+                row INTEGER NOT NULL,
+                source_id INTEGER NOT NULL,
+                start INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                list_id INTEGER,
+                PRIMARY KEY (source, row)
+            )
+        ''')
+        cursor.execute("CREATE INDEX IF NOT EXISTS idx_semantic_chunks_list ON semantic_chunks (source, list_id)")
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS semantic_meta (
+                source TEXT PRIMARY KEY,
+                dim INTEGER NOT NULL,
+                total INTEGER NOT NULL,
+                df BLOB NOT NULL
+            )
+        ''')
+        cursor.execute('''
+            CREATE TABLE IF NOT EXISTS semantic_centroids (
+                source TEXT NOT NULL,
+                list_id INTEGER NOT NULL,
+                centroid BLOB NOT NULL,
+                PRIMARY KEY (source, list_id)
+            )
+        ''')
+        cursor.execute("SELECT source FROM semantic_meta WHERE dim <> ?", (self.dim,))
+        for (source,) in cursor.fetchall():
+            self.reset(cursor, source)
+
+    def reset(self, cursor, source: str) -> None:
+        """清空数据源的索引"""
+        for table in ("semantic_items", "semantic_chunks", "semantic_meta", "semantic_centroids"):
+            cursor.execute(f"DELETE FROM {table} WHERE source = ?", (source,))
+        path = self.vectors_path(source)
+        if os.path.exists(path):
+            os.truncate(path, 0)
+
+    def add(self, cursor, source: str, source_id: int, text: str) -> int:
+        """为一条记录建立索引，返回分块数；已索引过的记录直接返回0"""
+        if not numpy_available:
+            return 0
+        cursor.execute("SELECT 1 FROM semantic_items WHERE source = ? AND source_id = ?", (source, source_id))
+        if cursor.fetchone():
+            return 0
+
+        spans = split_chunks(text or "", self.chunk_size, self.chunk_overlap)
+        # SAVEPOINT 开始的是延迟事务，第一条语句必须是写入：先取得写锁（WAL模式下读快照
+        # 之后再升级为写会失败），并在锁内确认记录未被其他会话索引，之后才能分配行号
+        cursor.execute("SAVEPOINT semantic_add")
+        try:
+            cursor.execute("INSERT OR IGNORE INTO semantic_items (source, source_id, chunks) VALUES (?, ?, ?)",
+                           (source, source_id, len(spans)))
+            if cursor.rowcount == 0:
+                return 0
+            centroids = self._load_centroids(cursor, source)
+            row = self._row_count(cursor, source)
+            for offset in range(0, len(spans), self.BATCH_ROWS):
+                batch = spans[offset:offset + self.BATCH_ROWS]
+                vectors = self.vectorizer.transform([text[start:start + length] for start, length in batch])
+                list_ids = [None] * len(batch)
+                if centroids is not None:
+                    list_ids = np.argmax(vectors @ centroids.T, axis=1).tolist()
+
+                # 行号先在数据库中占用，再写入向量文件
+                cursor.executemany('''
+                    INSERT INTO semantic_chunks (source, row, source_id, start, length, list_id)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                ''', [(source, row + i, source_id, start, length, list_id)
+                      for i, ((start, length), list_id) in enumerate(zip(batch, list_ids))])
+                self._write_rows(source, row, vectors)
+                self._update_df(cursor, source, vectors)
+                row += len(batch)
+        except Exception:
+            cursor.execute("ROLLBACK TO semantic_add")
+            raise
+        finally:
+            cursor.execute("RELEASE semantic_add")
+        return len(spans)
+
+    def search(self, cursor, queries: Sequence[str], top_k: int = 10, sources: Iterable[str] = SOURCES,
+               nprobe: int = 8) -> List[List[Tuple[str, int, float]]]:
+        """批量检索，每个查询返回按相似度降序的 (数据源, 行号, 得分) 列表
+
+        有IVF聚类中心的数据源只计算最近 nprobe 个聚类中的向量，否则分块扫描全部向量。
+        """
+        sources = list(sources)
+        queries_matrix = self.vectorizer.transform(list(queries))
+        # 查询向量按逆文档频率加权，突出少见特征
+        queries_matrix *= self._idf(cursor, sources)
+        norms = np.linalg.norm(queries_matrix, axis=1, keepdims=True)
+        queries_matrix /= np.where(norms > 0, norms, 1.0)
+
+        merged = [[] for _ in queries]
+        for source in sources:
+            count = self._row_count(cursor, source)
+            if not count:
+                continue
+            matrix = np.memmap(self.vectors_path(source), dtype=np.float32, mode="r", shape=(count, self.dim))
+            centroids = self._load_centroids(cursor, source)
+            if centroids is None:
+                scores, rows = self._scan(matrix, queries_matrix, top_k)
+            else:
+                scores, rows = self._probe(cursor, source, matrix, centroids, queries_matrix, top_k, nprobe)
+            for i in range(len(merged)):
+                merged[i].extend((source, int(row), float(score))
+                                 for score, row in zip(scores[i], rows[i]) if row >= 0)
+            del matrix
+
+        return [sorted(items, key=lambda item: item[2], reverse=True)[:top_k] for items in merged]
+
+    def build_ivf(self, cursor, source: str, n_lists: int = 0, iterations: int = 10,
+                  sample_size: int = 20000) -> int:
+        """对数据源的向量做球面k-means聚类并记录每个分块所属聚类，返回聚类数"""
+        count = self._row_count(cursor, source)
+        if not count:
+            return 0
+        n_lists = min(n_lists or max(1, int(math.sqrt(count))), count)
+        matrix = np.memmap(self.vectors_path(source), dtype=np.float32, mode="r", shape=(count, self.dim))
+        rng = np.random.default_rng(0)
+
+        sample_rows = np.sort(rng.choice(count, size=min(count, max(sample_size, n_lists * 40)), replace=False))
+        sample = np.asarray(matrix[sample_rows])
+        centroids = sample[rng.choice(len(sample), size=n_lists, replace=False)].copy()
+        for _ in range(iterations):
+            assignment = np.argmax(sample @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignment, sample)
+            norms = np.linalg.norm(sums, axis=1)
+            # 空聚类保留原中心
+            filled = norms > 0
+            centroids[filled] = sums[filled] / norms[filled, None]
+
+        cursor.execute("DELETE FROM semantic_centroids WHERE source = ?", (source,))
+        cursor.executemany("INSERT INTO semantic_centroids (source, list_id, centroid) VALUES (?, ?, ?)",
+                           [(source, i, centroids[i].tobytes()) for i in range(n_lists)])
+        for start in range(0, count, self.BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + self.BLOCK_ROWS])
+            assignment = np.argmax(block @ centroids.T, axis=1)
+            cursor.executemany("UPDATE semantic_chunks SET list_id = ? WHERE source = ? AND row = ?",
+                               [(int(list_id), source, start + i) for i, list_id in enumerate(assignment)])
+        del matrix
+        return n_lists
+
+    def status(self, cursor) -> Dict[str, Dict[str, int]]:
+        """各数据源的索引规模"""
+        result = {}
+        for source in SOURCES:
+            cursor.execute("SELECT COUNT(*) FROM semantic_items WHERE source = ?", (source,))
+            items = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM semantic_centroids WHERE source = ?", (source,))
+            lists = cursor.fetchone()[0]
+            result[source] = {"items": items, "chunks": self._row_count(cursor, source), "ivf_lists": lists}
+        return result
+
+    def _row_count(self, cursor, source: str) -> int:
+        cursor.execute("SELECT COALESCE(MAX(row) + 1, 0) FROM semantic_chunks WHERE source = ?", (source,))
+        return cursor.fetchone()[0]
+
+    def _write_rows(self, source: str, row: int, vectors) -> None:
+        path = self.vectors_path(source)
+        if not os.path.exists(path):
+            open(path, "ab").close()
+        with open(path, "r+b") as f:
+            f.seek(row * self.dim * 4)
+            f.write(vectors.astype("<f4", copy=False).tobytes())
+
+    def _update_df(self, cursor, source: str, vectors) -> None:
+        cursor.execute("SELECT total, df FROM semantic_meta WHERE source = ?", (source,))
+        row = cursor.fetchone()
+        df = np.frombuffer(row[1], dtype=np.int64).copy() if row else np.zeros(self.dim, dtype=np.int64)
+        df += np.count_nonzero(vectors, axis=0)
+        cursor.execute("INSERT OR REPLACE INTO semantic_meta (source, dim, total, df) VALUES (?, ?, ?, ?)",
+                       (source, self.dim, (row[0] if row else 0) + len(vectors), df.tobytes()))
+
+    def _idf(self, cursor, sources: List[str]):
+        total, df = 0, np.zeros(self.dim, dtype=np.float64)
+        for source in sources:
+            cursor.execute("SELECT total, df FROM semantic_meta WHERE source = ?", (source,))
+            row = cursor.fetchone()
+            if row:
+                total += row[0]
+                df += np.frombuffer(row[1], dtype=np.int64)
+        return (np.log((total + 1) / (df + 1)) + 1.0).astype(np.float32)
+
+    def _load_centroids(self, cursor, source: str):
+        cursor.execute("SELECT centroid FROM semantic_centroids WHERE source = ? ORDER BY list_id", (source,))
+        rows = cursor.fetchall()
+        if not rows:
+            return None
+        return np.vstack([np.frombuffer(blob, dtype=np.float32) for (blob,) in rows])
+
+    def _scan(self, matrix, queries, top_k: int):
+        """分块计算全部向量的相似度，维护每个查询的top-k候选"""
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), 0), -1, dtype=np.int64)
+        for start in range(0, len(matrix), self.BLOCK_ROWS):
+            block = np.asarray(matrix[start:start + self.BLOCK_ROWS])
+            scores = np.concatenate([best_scores, queries @ block.T], axis=1)
+            rows = np.concatenate([best_rows, np.broadcast_to(
+                np.arange(start, start + len(block)), (len(queries), len(block)))], axis=1)
+            best_scores, best_rows = _top_k(scores, rows, top_k)
+        return best_scores, best_rows
+
+    def _probe(self, cursor, source: str, matrix, centroids, queries, top_k: int, nprobe: int):
+        """IVF检索：只计算最近 nprobe 个聚类中的向量"""
+        nprobe = max(1, min(nprobe, len(centroids)))
+        probes = np.argsort(-(queries @ centroids.T), axis=1)[:, :nprobe]
+        best_scores = np.full((len(queries), top_k), -np.inf, dtype=np.float32)
+        best_rows = np.full((len(queries), top_k), -1, dtype=np.int64)
+        for i, lists in enumerate(probes.tolist()):
+            placeholders = ",".join("?" * len(lists))
+            cursor.execute(f"SELECT row FROM semantic_chunks WHERE source = ? AND list_id IN ({placeholders})",
+                           [source, *lists])
+            rows = np.array(sorted(row for (row,) in cursor.fetchall()), dtype=np.int64)
+            if not len(rows):
+                continue
+            scores = np.asarray(matrix[rows]) @ queries[i]
+            top_scores, top_rows = _top_k(scores[None, :], rows[None, :], top_k)
+            best_scores[i, :top_scores.shape[1]] = top_scores[0]
+            best_rows[i, :top_rows.shape[1]] = top_rows[0]
+        return best_scores, best_rows
+
+
+def _top_k(scores, rows, k: int):
+    """按行取得分最高的k个（降序）"""
+    if scores.shape[1] > k:
+        part = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        scores = np.take_along_axis(scores, part, axis=1)
+        rows = np.take_along_axis(rows, part, axis=1)
+    order = np.argsort(-scores, axis=1, kind="stable")
+    return np.take_along_axis(scores, order, axis=1), np.take_along_axis(rows, order, axis=1)
@@ -57,7 +57,8 @@ def start_server():
     
     try:
         # 导入并启动服务器
-        from document_mcp import mcp
+        from document_mcp import run_server
+        from config import SERVER_CONFIG
         
         print("✅ 服务器模块加载成功")
         print("🌐 服务器启动中...")
@@ -71,13 +72,16 @@ def start_server():
         print("  - 知识库管理")
         print("  - 智能搜索")
         print("\n💡 使用方法:")
-        print("  通过MCP客户端连接此服务器")
+        if SERVER_CONFIG.get("transport", "stdio") == "stdio":
+            print("  通过MCP客户端连接此服务器")
+        else:
+            print(f"  共享服务地址: http://{SERVER_CONFIG['host']}:{SERVER_CONFIG['port']} ({SERVER_CONFIG['transport']})")
         print("  使用提供的工具进行文档处理")
         print("\n🛑 按 Ctrl+C 停止服务器")
         print("="*50)
         
-        # 启动服务器
-        mcp.run()
+        # 启动服务器（传输方式读取 config.py 中的 SERVER_CONFIG）
+        run_server()
         
     except KeyboardInterrupt:
         print("\n\n👋 服务器已停止")
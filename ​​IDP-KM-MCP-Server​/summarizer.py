@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+抽取式摘要
+基于TextRank：句子向量化后计算相似度矩阵，用幂迭代求句子重要度，
+选出得分最高且互不重复的句子按原文顺序输出。长文档先分块各自选出候选句，
+再对候选句做一次排序（map-reduce），参与排序的句子数有上限，避免O(n²)开销失控。
+"""
+
+import re
+from typing import List, Sequence
+
+from semantic_index import TextVectorizer, numpy_available
+
+if numpy_available:
+    import numpy as np
+
+_SENTENCE_SPLIT = re.compile(r'(?<=[。！？；])|(?<=[.!?;])\s+|\s*\n\s*')
+_CJK_END = "。！？；"
+
+
+def split_sentences(text: str, min_length: int = 10) -> List[str]:
+    """切分句子（保留句末标点），过滤过短的片段"""
+    return [s.strip() for s in _SENTENCE_SPLIT.split(text) if s and len(s.strip()) > min_length]
+
+
+def join_sentences(sentences: Sequence[str]) -> str:
+    """拼接句子，中文句子之间不加空格"""
+    parts = []
+    for sentence in sentences:
+        if parts and not parts[-1].endswith(tuple(_CJK_END)):
+            parts.append(" ")
+        parts.append(sentence)
+    return "".join(parts)
+
+
+class TextRankSummarizer:
+    """TextRank摘要器
+
+    Args:
+        damping: 阻尼系数
+        chunk_sentences: 单次排序的句子数上限，超过时分块排序后再合并
+        max_input_sentences: 每篇文档参与排序的句子数上限
+        redundancy: 与已选句子相似度超过该值的句子不再入选
+    """
+
+    def __init__(self, damping: float = 0.85, chunk_sentences: int = 200, max_input_sentences: int = 5000,
+                 redundancy: float = 0.8, dim: int = 1024, tolerance: float = 1e-6, max_iterations: int = 100):
+        self.damping = damping
+        self.chunk_sentences = max(chunk_sentences, 2)
+        self.max_input_sentences = max_input_sentences
+        self.redundancy = redundancy
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.vectorizer = TextVectorizer(dim) if numpy_available else None
+
+    def summarize(self, text: str, max_sentences: int = 5) -> str:
+        """生成单篇文档的摘要"""
+        return self.summarize_batch([text], max_sentences)[0]
+
+    def summarize_batch(self, texts: Sequence[str], max_sentences: int = 5) -> List[str]:
+        """批量生成摘要，各文档的相似度矩阵合并为一批做幂迭代"""
+        documents = [split_sentences(text)[:self.max_input_sentences] for text in texts]
+        if not numpy_available:
+            # 没有numpy时退化为取前几句
+            return [join_sentences(sentences[:max_sentences]) for sentences in documents]
+
+        vectors = [self.vectorizer.transform(sentences) for sentences in documents]
+        candidates = [np.arange(len(sentences)) for sentences in documents]
+        # 每块保留的句子数少于块大小的一半，保证每轮候选句至少减半
+        keep = min(max(max_sentences * 2, 10), self.chunk_sentences // 2)
+
+        # map：句子过多的文档分块排序，每块保留得分最高的若干句，直到候选句数不超过上限
+        while True:
+            groups = [(doc, chunk) for doc, indices in enumerate(candidates) if len(indices) > self.chunk_sentences
+                      for chunk in np.array_split(indices, -(-len(indices) // self.chunk_sentences))]
+            if not groups:
+                break
+            scores = self.rank([vectors[doc][chunk] for doc, chunk in groups])
+            reduced = {}
+            for (doc, chunk), chunk_scores in zip(groups, scores):
+                top = np.sort(np.argsort(-chunk_scores, kind="stable")[:keep])
+                reduced.setdefault(doc, []).append(chunk[top])
+            for doc, parts in reduced.items():
+                candidates[doc] = np.concatenate(parts)
+
+        # reduce：对候选句整体排序并选出摘要句
+        summaries = [""] * len(documents)
+        ranked = []
+        for doc, indices in enumerate(candidates):
+            if len(indices) > max_sentences:
+                ranked.append(doc)
+            else:
+                summaries[doc] = join_sentences([documents[doc][i] for i in indices])
+        scores = self.rank([vectors[doc][candidates[doc]] for doc in ranked]) if ranked else []
+        for doc, doc_scores in zip(ranked, scores):
+            selected = self._select(vectors[doc][candidates[doc]], doc_scores, max_sentences)
+            summaries[doc] = join_sentences([documents[doc][candidates[doc][i]] for i in selected])
+        return summaries
+
+    def rank(self, groups: Sequence["np.ndarray"]) -> List["np.ndarray"]:
+        """计算每组句子向量的TextRank得分（批量幂迭代）"""
+        size = max(len(group) for group in groups)
+        counts = np.array([len(group) for group in groups], dtype=np.float32)[:, None]
+        transitions = np.zeros((len(groups), size, size), dtype=np.float32)
+        for b, group in enumerate(groups):
+            n = len(group)
+            similarity = group @ group.T
+            np.clip(similarity, 0.0, None, out=similarity)
+            np.fill_diagonal(similarity, 0.0)
+            totals = similarity.sum(axis=1, keepdims=True)
+            # 与其他句子都不相似的句子均匀跳转
+            transitions[b, :n, :n] = np.where(totals > 0, similarity / np.where(totals > 0, totals, 1.0), 1.0 / n)
+
+        mask = (np.arange(size)[None, :] < counts).astype(np.float32)
+        scores = mask / counts
+        base = (1.0 - self.damping) * scores
+        for _ in range(self.max_iterations):
+            updated = base + self.damping * np.einsum("bi,bij->bj", scores, transitions)
+            converged = np.abs(updated - scores).sum(axis=1).max() < self.tolerance
+            scores = updated
+            if converged:
+                break
+        return [scores[b, :len(group)] for b, group in enumerate(groups)]
+
+    def _select(self, vectors, scores, max_sentences: int) -> List[int]:
+        """按得分选句并跳过与已选句子高度重复的句子，返回按原文顺序排列的下标"""
+        order = [int(i) for i in np.argsort(-scores, kind="stable")]
+        selected = []
+        for i in order:
+            if all(float(vectors[i] @ vectors[j]) < self.redundancy for j in selected):
+                selected.append(i)
+                if len(selected) >= max_sentences:
+                    break
+        # 去重后句子不足时按得分补齐
+        for i in order:
+            if len(selected) >= max_sentences:
+                break
+            if i not in selected:
+                selected.append(i)
+        return sorted(selected)
@@ -4,7 +4,24 @@ MCP服务测试脚本
 
 import os
 import sqlite3
-from document_mcp import DocumentProcessor, init_database
+import tempfile
+import threading
+import time
+import zipfile
+from contextlib import contextmanager
+import anyio
+import document_mcp
+from document_mcp import DocumentProcessor, import_knowledge_entries, init_database
+from job_queue import JobQueue
+from minhash import MinHasher
+from file_hashing import FileHashError, iter_file_hashes
+from semantic_index import SemanticIndex, numpy_available
+from tokenizer import TextTokenizer
+from summarizer import TextRankSummarizer, split_sentences
+from query_cache import QueryCache, normalize_query
+from docx_reader import iter_docx_text
+from text_reader import ExtractionError, iter_text_chunks, read_text
+from worker_pool import WorkerError, WorkerPool, WorkerTimeout, WorkerUnavailable
 
 def test_document_processor():
     """测试文档处理器"""
@@ -60,10 +77,545 @@ def test_file_hash():
     
     print(f"✅ 哈希一致性: {hash1 == hash2}")
     print(f"✅ 哈希值: {hash1}")
+    assert hash1 == hash2 and len(hash1) == 64
+    
+    # 批量并行计算，无法读取的文件返回错误而不是哈希值
+    results = dict(iter_file_hashes(["hash_test.txt", "missing_file.txt"]))
+    assert results["hash_test.txt"] == hash1
+    assert isinstance(results["missing_file.txt"], FileHashError)
+    print("✅ 批量哈希与错误处理正常")
     
     # 清理
     os.remove("hash_test.txt")
 
+def test_job_queue():
+    """测试后台任务队列"""
+    print("\n⏳ 测试后台任务...")
+    
+    db_path = os.path.join(tempfile.mkdtemp(), "jobs.db")
+    queue = JobQueue(db_path)
+    queue.register("sum", lambda params, job: sum(params["values"]))
+    
+    def slow(params, job):
+        for index in range(200):
+            job.report(index, 200, force=True)
+            time.sleep(0.05)
+    queue.register("slow", slow)
+    
+    def wait_for(job_id, statuses):
+        for _ in range(50):
+            status = queue.get(job_id)
+            if status["status"] in statuses:
+                break
+            time.sleep(0.1)
+        return status
+    
+    job = queue.submit("sum", {"values": [1, 2, 3]})
+    status = wait_for(job["id"], ("completed",))
+    print(f"✅ 任务状态: {status['status']}, 结果: {status['result']}")
+    assert status["result"] == 6
+    # 时间统一为ISO-8601格式的UTC时间
+    assert status["created_at"].endswith("+00:00") and status["finished_at"] >= status["created_at"]
+    
+    # 运行中的任务在写入进度时发现取消请求
+    job = queue.submit("slow")
+    wait_for(job["id"], ("running",))
+    queue.cancel(job["id"])
+    status = wait_for(job["id"], ("cancelled",))
+    queue.stop()
+    assert status["status"] == "cancelled" and status["progress"] < 200
+    
+    # 所属进程已退出且执行次数达到上限的任务不再重新排队，标记为失败
+    job = queue.submit("sum", {"values": [1]})
+    conn = sqlite3.connect(db_path)
+    conn.execute("UPDATE jobs SET status = 'running', owner_pid = ?, attempts = 2 WHERE id = ?",
+                 (os.getpid(), job["id"]))
+    conn.commit()
+    conn.close()
+    queue = JobQueue(db_path, max_attempts=2)
+    queue.start()
+    status = queue.get(job["id"])
+    queue.stop()
+    print(f"✅ 反复中断的任务: {status['status']}, {status['error']}")
+    assert status["status"] == "failed" and status["error"].startswith("Interrupted 2 times")
+
+def test_near_duplicates():
+    """测试近似去重签名"""
+    print("\n🧬 测试近似去重...")
+    
+    hasher = MinHasher()
+    original = "".join(f"第{i}节：人工智能是计算机科学的一个分支，致力于创建能够执行通常需要人类智能的任务的系统。"
+                       for i in range(30))
+    exported = original.replace("。", "。\n") + "导出时间：2025-08-12"
+    other = "".join(f"第{i}节：MCP协议是一个开放标准，用于连接AI助手与各种数据源和工具。" for i in range(30))
+    
+    similar = MinHasher.similarity(hasher.signature(original), hasher.signature(exported))
+    different = MinHasher.similarity(hasher.signature(original), hasher.signature(other))
+    print(f"✅ 近似文档相似度: {similar:.2f}, 不同文档相似度: {different:.2f}")
+    assert similar > 0.8 > different
+
+def test_fulltext_tokenizer():
+    """测试全文索引分词"""
+    print("\n🈶 测试全文索引分词...")
+    
+    tokenizer = TextTokenizer()
+    conn = sqlite3.connect(":memory:")
+    conn.execute("CREATE VIRTUAL TABLE t USING fts5(body, content='')")
+    texts = ["深度学习模型通过训练数据学习规律", "The indexing service tokenizes English text"]
+    for row_id, text in enumerate(texts, 1):
+        conn.execute("INSERT INTO t (rowid, body) VALUES (?, ?)", (row_id, tokenizer.index_text(text)))
+    
+    def match(query):
+        return [row[0] for row in conn.execute("SELECT rowid FROM t WHERE t MATCH ?",
+                                                (tokenizer.match_expression(query),))]
+    
+    assert match("学习") == [1]
+    assert match("训练数据") == [1]
+    assert match("index") == [2]
+    
+    # 复用分词结果提取的关键词与jieba直接提取一致
+    if tokenizer.name == "jieba":
+        import jieba.analyse
+        words = tokenizer.segment(texts[0])
+        assert tokenizer.keywords(words, 5) == jieba.analyse.extract_tags(texts[0], topK=5)
+    print(f"✅ 分词器: {tokenizer.name}")
+    conn.close()
+
+def test_tokenizer_cache():
+    """测试分词缓存与自定义词典缓存"""
+    print("\n🧠 测试分词缓存...")
+    
+    tokenizer = TextTokenizer()
+    text = "页眉：内部资料\r\n深度学习模型通过训练数据学习规律。\n页眉：内部资料\n\nEnglish text  here"
+    expected = TextTokenizer(segment_cache_entries=0).segment(text)
+    assert tokenizer.segment(text) == expected
+    assert tokenizer.segment(text) == expected
+    stats = tokenizer.cache_stats()
+    assert stats["hits"] >= 5 and stats["entries"] == 5
+    print(f"✅ 按行缓存的分词结果与整体分词一致: {stats}")
+    
+    if tokenizer.name != "jieba":
+        return
+    directory = tempfile.mkdtemp()
+    user_dict = os.path.join(directory, "user.txt")
+    with open(user_dict, "w", encoding="utf-8") as f:
+        f.write("蓝鲸数据湖 10 n\n")
+    cache_file = os.path.join(directory, "dict.cache")
+    TextTokenizer(user_dicts=[user_dict], cache_file=cache_file).warm()
+    assert os.path.exists(cache_file)
+    # 第二个实例直接从缓存文件载入合并后的词典
+    cached = TextTokenizer(user_dicts=[user_dict], cache_file=cache_file)
+    assert cached._load_dictionary_cache()
+    assert "蓝鲸数据湖" in cached.segment("蓝鲸数据湖的容量")
+    print("✅ 自定义词典缓存可由其他进程直接载入")
+
+def test_summarizer():
+    """测试TextRank摘要"""
+    print("\n📝 测试摘要生成...")
+    
+    front_matter = "本报告版权归本公司所有，未经书面许可不得转载。报告编号：2025-0812-001号文件。"
+    body = ("公司光伏组件出货量同比增长，光伏组件业务收入创历史新高。"
+            "光伏组件价格下降，但光伏组件出货量增长抵消了价格影响。"
+            "储能业务收入同比增长，储能项目订单充足。"
+            "光伏组件与储能业务共同推动公司营收增长，储能业务毛利率提升。"
+            "海外市场光伏组件需求旺盛，公司海外收入占比提高。"
+            "公司计划扩大光伏组件产能，并加大储能技术研发投入。")
+    text = front_matter + body
+    
+    summarizer = TextRankSummarizer()
+    summary = summarizer.summarize(text, max_sentences=3)
+    assert len(split_sentences(summary)) == 3
+    assert "版权" not in summary
+    print(f"✅ 摘要: {summary}")
+    
+    # 分块排序（map-reduce）与批量模式
+    chunked = TextRankSummarizer(chunk_sentences=4)
+    assert len(split_sentences(chunked.summarize(text, max_sentences=2))) == 2
+    assert summarizer.summarize_batch([text, front_matter], 3) == [summary, summarizer.summarize(front_matter, 3)]
+    print("✅ 分块与批量摘要正常")
+
+def test_query_cache():
+    """测试检索结果缓存"""
+    print("\n🗃️ 测试检索缓存...")
+    
+    cache = QueryCache(max_entries=2, max_bytes=1024, ttl=60)
+    key = ("search", normalize_query("  Hello   世界 "))
+    assert key[1] == "hello 世界"
+    
+    cache.put(key, 1, [{"id": 1}])
+    assert cache.get(key, 1) == [{"id": 1}]
+    assert cache.get(key, 2) is None  # 数据版本变化后失效
+    
+    cache.put("a", 1, [1])
+    cache.put("b", 1, [2])
+    cache.put("c", 1, [3])
+    assert cache.get("a", 1) is None and cache.get("c", 1) == [3]  # LRU淘汰
+    cache.put("big", 1, ["x" * 2048])
+    assert cache.get("big", 1) is None  # 超过字节上限不缓存
+    print(f"✅ 缓存统计: {cache.stats()}")
+
+def test_docx_reader():
+    """测试DOCX流式提取"""
+    print("\n📄 测试DOCX流式提取...")
+    
+    try:
+        from docx import Document
+    except ImportError:
+        print("⚠️ 未安装python-docx，跳过")
+        return
+    
+    path = os.path.join(tempfile.mkdtemp(), "stream.docx")
+    doc = Document()
+    doc.add_paragraph("正文第一段")
+    table = doc.add_table(rows=2, cols=2)
+    for i, row in enumerate(table.rows):
+        row.cells[0].text = f"名称{i}"
+        row.cells[1].text = f"数值{i}"
+    doc.sections[0].header.paragraphs[0].text = "页眉文字"
+    doc.save(path)
+    
+    # 追加脚注部件
+    with zipfile.ZipFile(path, "a") as archive:
+        archive.writestr("word/footnotes.xml", (
+            '<w:footnotes xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main">'
+            '<w:footnote w:type="separator" w:id="-1"><w:p><w:r><w:separator/></w:r></w:p></w:footnote>'
+            '<w:footnote w:id="1"><w:p><w:r><w:t>脚注内容</w:t></w:r></w:p></w:footnote>'
+            '</w:footnotes>'
+        ))
+    
+    text = "".join(iter_docx_text(path, chunk_size=8))
+    assert text == "页眉文字\n正文第一段\n名称0\t数值0\n名称1\t数值1\n脚注内容\n"
+    print("✅ 页眉、表格和脚注均已提取")
+
+def test_text_reader():
+    """测试文本编码识别与分块读取"""
+    print("\n🔤 测试文本编码识别...")
+    
+    directory = tempfile.mkdtemp()
+    gbk_path = os.path.join(directory, "gbk.txt")
+    with open(gbk_path, "wb") as f:
+        f.write("中文编码测试\r\n第二行".encode("gbk"))
+    assert read_text(gbk_path) == "中文编码测试\n第二行"
+    
+    bom_path = os.path.join(directory, "utf16.txt")
+    with open(bom_path, "wb") as f:
+        f.write("带BOM的文本".encode("utf-16"))
+    assert read_text(bom_path) == "带BOM的文本"
+    
+    # 小分块时 \r\n 和多字节字符会被拆开
+    crlf_path = os.path.join(directory, "crlf.txt")
+    with open(crlf_path, "wb") as f:
+        f.write("第一行\r\n第二行\r\n".encode("utf-8") * 50)
+    chunks = list(iter_text_chunks(crlf_path, chunk_size=7))
+    assert "".join(chunks) == "第一行\n第二行\n" * 50
+    assert len(chunks) > 1
+    
+    try:
+        read_text(os.path.join(directory, "missing.txt"))
+        assert False, "missing file should raise"
+    except ExtractionError:
+        pass
+    print("✅ GBK、BOM与换行处理正常，读取失败抛出异常")
+
+def test_worker_pool():
+    """测试隔离提取：超时、内存超限后重启工作进程"""
+    print("\n🧯 测试隔离提取...")
+    
+    path = os.path.join(tempfile.mkdtemp(), "note.txt")
+    with open(path, "w", encoding="gbk") as f:
+        f.write("隔离模式下提取的文本")
+    pool = WorkerPool(max_workers=1, timeout=5, memory_limit=256 * 1024 * 1024)
+    try:
+        assert pool.call("extractors:extract_text", path, ".txt", ["utf-8", "gbk"]) == "隔离模式下提取的文本"
+        # 提取函数自身的异常原样抛出，工作进程继续使用
+        try:
+            pool.call("extractors:extract_text", path + ".missing", ".txt")
+            assert False, "missing file should raise"
+        except ExtractionError:
+            pass
+        try:
+            pool.call("time:sleep", 2, timeout=0.5)
+            assert False, "expected timeout"
+        except WorkerTimeout:
+            pass
+        try:
+            pool.call("builtins:bytearray", 512 * 1024 * 1024)
+            assert False, "expected memory limit"
+        except WorkerError as e:
+            assert "Memory" in str(e)
+        assert pool.call("extractors:extract_text", path, ".txt", ["gbk"]) == "隔离模式下提取的文本"
+        # 无法加载目标函数属于环境问题，与文件内容无关（不记入隔离表）
+        try:
+            pool.call("no_such_module:extract")
+            assert False, "expected unavailable"
+        except WorkerUnavailable:
+            pass
+        status = pool.status()
+        print(f"✅ 工作进程池: {status}")
+        assert status["timeouts"] == 1 and status["crashes"] == 1 and status["start_failures"] == 1
+    finally:
+        pool.close()
+
+def test_knowledge_import():
+    """测试知识库批量导入的校验与查重（dry_run，不写入数据库）"""
+    print("\n📥 测试知识库批量导入...")
+    
+    path = os.path.join(tempfile.mkdtemp(), "entries.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"title": "导入测试", "content": "批量导入的内容", "tags": ["测试"]}\n')
+        f.write('{"title": "导入测试", "content": "批量导入的内容"}\n')
+        f.write('{"title": "", "content": "缺少标题"}\n')
+        f.write('not json\n')
+    
+    result = import_knowledge_entries(path, dry_run=True)
+    print(f"✅ 导入结果: {result}")
+    assert result["imported"] == 1 and result["duplicates"] == 1 and result["invalid"] == 2
+    assert [error["line"] for error in result["errors"]] == [3, 4]
+    
+    result = import_knowledge_entries(entries=[{"title": "t", "content": "c", "tags": "a, b"}], dry_run=True)
+    assert result["imported"] == 1
+    assert "error" in import_knowledge_entries(path, entries=[])
+
+@contextmanager
+def temporary_database():
+    """在临时目录中使用独立的数据库和向量文件，返回该目录"""
+    directory = tempfile.mkdtemp()
+    saved = document_mcp.DB_PATH, document_mcp.semantic_index
+    document_mcp.DB_PATH = os.path.join(directory, "documents.db")
+    document_mcp.semantic_index = SemanticIndex(directory, dim=256)
+    try:
+        init_database()
+        yield directory
+    finally:
+        document_mcp.DB_PATH, document_mcp.semantic_index = saved
+        document_mcp.query_cache.clear()
+
+def test_statistics():
+    """测试触发器维护的统计计数与全量重算结果一致"""
+    print("\n📊 测试统计计数...")
+    
+    with temporary_database() as directory:
+        for name, text in [("a.txt", "数据库索引可以加快查询速度。"), ("b.md", "# 标题\n\n机器学习模型的训练过程。"),
+                           ("c.txt", "The recipe calls for flour, sugar and butter.")]:
+            path = os.path.join(directory, name)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(text)
+            assert "error" not in document_mcp.parse_document(path)
+        document_mcp.add_knowledge_entry("索引", "B树索引", category="数据库", tags=["db"])
+        document_mcp.add_knowledge_entry("训练", "梯度下降", category="机器学习")
+        import_knowledge_entries(entries=[{"title": "烘焙", "content": "黄油和面粉", "category": "烹饪"},
+                                          {"title": "查询", "content": "执行计划", "category": "数据库"}])
+        
+        def counters(stats):
+            # 缓存命中数和数据库文件大小随调用本身变化，不参与比较
+            stats = dict(stats, index_sizes=dict(stats["index_sizes"]))
+            for key in ("query_cache", "tokenizer_cache"):
+                stats.pop(key)
+            stats["index_sizes"].pop("database_bytes")
+            return stats
+        
+        stats = document_mcp.get_statistics()
+        print(f"✅ 统计信息: {counters(stats)}")
+        assert stats["total_documents"] == 3 and stats["total_knowledge_entries"] == 4
+        assert stats["documents_by_type"][".txt"]["count"] == 2 and stats["categories"]["数据库"] == 2
+        assert stats["index_sizes"]["fulltext_rows_estimate"] == (7 if document_mcp.fulltext_available else 0)
+        assert counters(stats) == counters(document_mcp.get_statistics(recompute=True))
+
+def test_tags_and_facets():
+    """测试标签关联表、按标签过滤检索和分面计数"""
+    print("\n🏷️ 测试标签与分面...")
+    
+    with temporary_database():
+        document_mcp.add_knowledge_entry("索引", "B树索引结构", category="数据库", tags=["DB", "性能"])
+        document_mcp.add_knowledge_entry("分区", "表分区策略", category="数据库", tags=["db"])
+        document_mcp.add_knowledge_entry("缓存", "查询缓存策略", category="架构", tags=["性能", "db"])
+        import_knowledge_entries(entries=[{"title": "梯度", "content": "梯度下降", "tags": "ml, 性能"}])
+        
+        def titles(tags, query=""):
+            return sorted(entry["title"] for entry in document_mcp.search_knowledge_base(query, tags=tags))
+        
+        # 标签不区分大小写，多个标签要求同时具备
+        assert titles(["db"]) == ["分区", "索引", "缓存"]
+        assert titles(["DB", "性能"]) == ["索引", "缓存"]
+        assert titles(["性能"], "策略") == ["缓存"]
+        assert titles(["不存在"]) == []
+        
+        facets = document_mcp.get_facets()
+        print(f"✅ 分面统计: {facets['knowledge_base']}")
+        assert facets["knowledge_base"]["tags"] == [{"name": "db", "count": 3}, {"name": "性能", "count": 3},
+                                                    {"name": "ml", "count": 1}]
+        assert facets["knowledge_base"]["categories"][0] == {"name": "数据库", "count": 2}
+        assert document_mcp.get_facets(limit=1)["knowledge_base"]["tags"] == [{"name": "db", "count": 3}]
+
+def test_semantic_ingest():
+    """测试写入时建立语义索引，检索不补建，补建只由 build_semantic_index 完成"""
+    print("\n🧩 测试语义索引的增量建立...")
+    
+    if not numpy_available:
+        print("⚠️ 未安装numpy，跳过")
+        return
+    
+    with temporary_database():
+        document_mcp.add_knowledge_entry("索引", "Indexing databases with B-tree structures speeds up lookups.")
+        import_knowledge_entries(entries=[{"title": "烘焙", "content": "The recipe calls for flour, sugar and butter."}])
+        hits = document_mcp.semantic_search("baking with butter", top_k=1, source="knowledge_base")
+        assert hits[0]["title"] == "烘焙"
+        
+        # 绕过工具直接写入的旧数据不会在检索时补建
+        conn = document_mcp.connect_db()
+        conn.execute("INSERT INTO knowledge_base (title, content) VALUES ('旧条目', 'Legacy rows are backfilled later.')")
+        conn.commit()
+        document_mcp.semantic_search("legacy", source="knowledge_base")
+        
+        def count():
+            return conn.execute("SELECT COUNT(*) FROM semantic_items").fetchone()[0]
+        assert count() == 2
+        result = document_mcp.build_semantic_index("knowledge_base")
+        print(f"✅ 补建语义索引: {result['newly_indexed']}")
+        assert result["newly_indexed"] == 1 and count() == 3
+        conn.close()
+
+def test_server_startup():
+    """测试服务启动：传输方式校验、监听地址和端口的配置"""
+    print("\n🌐 测试服务启动...")
+    
+    try:
+        document_mcp.run_server("websocket")
+        assert False, "expected ValueError"
+    except ValueError as e:
+        assert "Unsupported transport" in str(e)
+    
+    settings = document_mcp.mcp.settings
+    saved = settings.host, settings.port, document_mcp.job_queue
+    assert (settings.host, settings.port) == (document_mcp.SERVER_CONFIG["host"], document_mcp.SERVER_CONFIG["port"])
+    calls = []
+    document_mcp.mcp.run = lambda transport: calls.append((transport, settings.host, settings.port))
+    try:
+        with temporary_database():
+            document_mcp.job_queue = JobQueue(document_mcp.DB_PATH)
+            document_mcp.run_server("streamable-http", host="0.0.0.0", port=9123)
+            document_mcp.job_queue.stop()
+            document_mcp.run_server("stdio")
+            document_mcp.job_queue.stop()
+    finally:
+        del document_mcp.mcp.run
+        settings.host, settings.port, document_mcp.job_queue = saved
+    print(f"✅ 启动参数: {calls}")
+    # 未指定地址和端口时沿用之前的设置
+    assert calls == [("streamable-http", "0.0.0.0", 9123), ("stdio", "0.0.0.0", 9123)]
+
+def test_tool_concurrency():
+    """测试同步工具在工作线程中执行，并受并发上限限制"""
+    print("\n🔀 测试工具并发...")
+    
+    state = {"active": 0, "peak": 0, "threads": set()}
+    lock = threading.Lock()
+    
+    @document_mcp.mcp_tool(name="concurrency_probe")
+    def probe(seconds: float) -> dict:
+        with lock:
+            state["active"] += 1
+            state["peak"] = max(state["peak"], state["active"])
+            state["threads"].add(threading.get_ident())
+        time.sleep(seconds)
+        with lock:
+            state["active"] -= 1
+        return {"ok": True}
+    
+    async def run_calls():
+        ticks = 0
+        
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await anyio.sleep(0.01)
+        
+        async with anyio.create_task_group() as group:
+            group.start_soon(ticker)
+            async with anyio.create_task_group() as calls:
+                for _ in range(6):
+                    calls.start_soon(document_mcp.mcp.call_tool, "concurrency_probe", {"seconds": 0.2})
+            group.cancel_scope.cancel()
+        return ticks
+    
+    saved = document_mcp.SERVER_CONFIG.get("max_concurrency")
+    document_mcp.SERVER_CONFIG["max_concurrency"] = 2
+    document_mcp._tool_limiter = None
+    try:
+        started = time.monotonic()
+        ticks = anyio.run(run_calls)
+        elapsed = time.monotonic() - started
+    finally:
+        document_mcp.SERVER_CONFIG["max_concurrency"] = saved
+        document_mcp._tool_limiter = None
+        document_mcp.mcp.remove_tool("concurrency_probe")
+    print(f"✅ 并发峰值: {state['peak']}, 耗时: {elapsed:.2f}s, 事件循环计时: {ticks}")
+    # 6次调用、每次0.2秒、并发上限2：约0.6秒；期间事件循环未被阻塞
+    assert state["peak"] == 2 and elapsed >= 0.6
+    assert threading.get_ident() not in state["threads"]
+    assert ticks >= 20
+    # 被装饰的函数保持同步，可直接调用
+    assert probe(0) == {"ok": True}
+
+def test_semantic_search():
+    """测试本地语义检索"""
+    print("\n🧭 测试语义检索...")
+    
+    if not numpy_available:
+        print("⚠️ 未安装numpy，跳过")
+        return
+    
+    directory = tempfile.mkdtemp()
+    conn = sqlite3.connect(os.path.join(directory, "semantic.db"))
+    cursor = conn.cursor()
+    index = SemanticIndex(directory, dim=256, chunk_size=200, chunk_overlap=20)
+    index.init_tables(cursor)
+    texts = [
+        "Indexing databases with B-tree structures speeds up lookups of stored records.",
+        "机器学习模型通过训练数据学习规律，并对新的样本进行预测。",
+        "The recipe calls for flour, sugar and butter, baked for twenty minutes."
+    ]
+    for source_id, text in enumerate(texts, 1):
+        index.add(cursor, "documents", source_id, text)
+    
+    def best(query):
+        source, row, _ = index.search(cursor, [query], top_k=1)[0][0]
+        cursor.execute("SELECT source_id FROM semantic_chunks WHERE source = ? AND row = ?", (source, row))
+        return cursor.fetchone()[0]
+    
+    assert best("database index lookup") == 1
+    assert best("深度学习训练") == 2
+    index.build_ivf(cursor, "documents", n_lists=2)
+    assert best("baking with butter") == 3
+    print("✅ 语义检索与IVF索引正常")
+    conn.commit()
+    conn.close()
+    
+    # 另一个会话持有写锁时，先等待写锁再分配行号，不会覆盖对方尚未提交的向量行
+    import numpy as np
+    db_path = os.path.join(directory, "semantic.db")
+    holder = sqlite3.connect(db_path)
+    holder_cursor = holder.cursor()
+    holder_cursor.execute("BEGIN")
+    index.add(holder_cursor, "documents", 5, "Pending text indexed by another session.")
+    waiting = sqlite3.connect(db_path, timeout=0.1)
+    try:
+        index.add(waiting.cursor(), "documents", 4, "Text indexed while the lock is held.")
+        assert False, "expected database is locked"
+    except sqlite3.OperationalError:
+        pass
+    holder.commit()
+    assert index.add(waiting.cursor(), "documents", 4, "Text indexed while the lock is held.") == 1
+    waiting.commit()
+    vectors = np.fromfile(index.vectors_path("documents"), dtype="<f4").reshape(-1, 256)
+    expected = index.vectorizer.transform(["Pending text indexed by another session.",
+                                           "Text indexed while the lock is held."])
+    assert np.array_equal(vectors[3:5], expected)
+    assert index.add(waiting.cursor(), "documents", 4, "Text indexed while the lock is held.") == 0
+    holder.close()
+    waiting.close()
+
 def main():
     """运行所有测试"""
     print("🚀 MCP服务功能测试")
@@ -73,6 +625,22 @@ def main():
         test_document_processor()
         test_database()
         test_file_hash()
+        test_job_queue()
+        test_near_duplicates()
+        test_fulltext_tokenizer()
+        test_tokenizer_cache()
+        test_summarizer()
+        test_query_cache()
+        test_docx_reader()
+        test_text_reader()
+        test_worker_pool()
+        test_knowledge_import()
+        test_statistics()
+        test_tags_and_facets()
+        test_semantic_ingest()
+        test_server_startup()
+        test_tool_concurrency()
+        test_semantic_search()
         
         print("\n" + "=" * 40)
         print("✅ 所有测试通过！")
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+文本文件读取
+根据BOM和文件开头的样本判断编码（按配置的候选编码依次尝试），
+然后分块增量解码，整个文件只读取一次。
+"""
+
+import codecs
+import logging
+from typing import Iterator, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_ENCODINGS = ("utf-8", "gbk", "gb2312", "latin-1")
+SAMPLE_SIZE = 64 * 1024
+CHUNK_SIZE = 1024 * 1024
+
+# UTF-32的BOM以UTF-16的BOM开头，需先判断
+_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32-le"),
+    (codecs.BOM_UTF32_BE, "utf-32-be"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16-le"),
+    (codecs.BOM_UTF16_BE, "utf-16-be"),
+)
+
+
+class ExtractionError(Exception):
+    """文档文本提取失败"""
+
+
+def detect_encoding(sample: bytes, encodings: Sequence[str] = DEFAULT_ENCODINGS) -> Tuple[Optional[str], int]:
+    """根据样本判断编码，返回 (编码, BOM长度)；候选编码都无法解码时编码为 None"""
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding, len(bom)
+    for encoding in encodings:
+        try:
+            # 样本末尾可能截断多字节字符，不作为最终数据解码
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding, 0
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return None, 0
+
+
+def _candidates(sample: bytes, encodings: Sequence[str]) -> List[Tuple[str, int]]:
+    encoding, bom_length = detect_encoding(sample, encodings)
+    if encoding is None:
+        return []
+    if bom_length:
+        return [(encoding, bom_length)]
+    # 样本之后出现无法解码的内容时，依次改用后续候选编码
+    remaining = list(encodings)[list(encodings).index(encoding):]
+    return [(name, 0) for name in remaining]
+
+
+def _iter_decoded(f, filepath: str, encoding: str, chunk_size: int) -> Iterator[str]:
+    decoder = codecs.getincrementaldecoder(encoding)()
+    emitted = False
+    pending_cr = ""
+    while True:
+        data = f.read(chunk_size)
+        try:
+            text = decoder.decode(data, final=not data)
+        except UnicodeDecodeError as e:
+            if not emitted:
+                raise
+            # 已输出的内容无法撤回，之后无法解码的字节以替换字符表示
+            logger.warning(f"Invalid {encoding} data in {filepath}, replacing undecodable bytes: {e}")
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+            text = decoder.decode(data, final=not data)
+        text = pending_cr + text
+        # 保留末尾的 \r，避免 \r\n 被拆在两块之间
+        pending_cr = "\r" if data and text.endswith("\r") else ""
+        if pending_cr:
+            text = text[:-1]
+        text = text.replace("\r\n", "\n").replace("\r", "\n")
+        if text:
+            emitted = True
+            yield text
+        if not data:
+            return
+
+
+def iter_text_chunks(filepath: str, encodings: Sequence[str] = DEFAULT_ENCODINGS,
+                     chunk_size: int = CHUNK_SIZE) -> Iterator[str]:
+    """分块读取并解码文本文件（换行统一为 \\n）
+
+    Raises:
+        ExtractionError: 文件无法读取或所有候选编码都无法解码
+    """
+    try:
+        with open(filepath, "rb") as f:
+            sample = f.read(SAMPLE_SIZE)
+            for encoding, bom_length in _candidates(sample, encodings):
+                f.seek(bom_length)
+                try:
+                    yield from _iter_decoded(f, filepath, encoding, chunk_size)
+                    return
+                except UnicodeDecodeError:
+                    logger.info(f"{filepath} is not valid {encoding} beyond the sample, trying next encoding")
+    except OSError as e:
+        raise ExtractionError(f"Cannot read {filepath}: {e}") from e
+    raise ExtractionError(f"Cannot detect encoding of {filepath} (tried {', '.join(encodings)})")
+
+
+def read_text(filepath: str, encodings: Sequence[str] = DEFAULT_ENCODINGS, chunk_size: int = CHUNK_SIZE) -> str:
+    """读取整个文本文件，编码判断和解码在一次读取中完成"""
+    return "".join(iter_text_chunks(filepath, encodings, chunk_size))
@@ -0,0 +1,258 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+全文索引分词
+中文使用jieba分词（长词额外拆出词典中的子词，与 cut_for_search 一致），
+未安装jieba时中文按字符三元组切分。分词结果以空格连接写入FTS5表，
+查询使用同一分词器生成MATCH表达式，因此中英文检索都走倒排索引。
+
+jieba词典（含自定义词典和停用词表）每个进程只加载一次：合并后的词典序列化到缓存文件，
+其他进程直接载入；在加载完成后再fork的子进程直接继承。最近分词过的文本行缓存分词结果，
+重复出现的段落（页眉页脚、模板文字等）不再重复分词。
+"""
+
+import hashlib
+import logging
+import marshal
+import os
+import re
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Dict, List, Sequence
+
+# 尝试导入可选依赖
+jieba_available = False
+
+try:
+    import jieba
+    import jieba.analyse
+    jieba_available = True
+except ImportError:
+    jieba = None
+
+logger = logging.getLogger(__name__)
+
+_CJK_RANGES = "㐀-䶿一-鿿豈-﫿"
+_TOKEN_PATTERN = re.compile(f"[{_CJK_RANGES}]+|[^\\W_{_CJK_RANGES}]+", re.UNICODE)
+_CJK_PATTERN = re.compile(f"[{_CJK_RANGES}]")
+_WORD_PATTERN = re.compile(r"[^\W_]", re.UNICODE)
+
+
+def _is_cjk(word: str) -> bool:
+    return bool(_CJK_PATTERN.match(word))
+
+
+def _quote(term: str) -> str:
+    return '"' + term.replace('"', '""') + '"'
+
+# 超过该长度的文本行不缓存分词结果
+_CACHE_MAX_LINE = 4096
+
+
+class TextTokenizer:
+    """索引分词器
+
+    segment() 的结果可同时用于建立索引（index_terms）和提取关键词（keywords），
+    同一文档只需分词一次。
+
+    Args:
+        dictionary: jieba主词典路径，为空时使用jieba自带词典
+        user_dicts: 自定义词典路径列表
+        stopwords_files: 关键词提取使用的停用词表路径列表
+        cache_file: 合并后词典的缓存文件；为空且配置了自定义词典时使用临时目录下的默认文件
+        segment_cache_entries: 分词结果缓存的文本行数，为0时不缓存
+    """
+
+    def __init__(self, dictionary: str = "", user_dicts: Sequence[str] = (), stopwords_files: Sequence[str] = (),
+                 cache_file: str = "", segment_cache_entries: int = 4096):
+        self.name = "jieba" if jieba_available else "trigram"
+        self.dictionary = dictionary
+        self.user_dicts = list(user_dicts)
+        self.stopwords_files = list(stopwords_files)
+        self.cache_file = cache_file
+        if not cache_file and (dictionary or self.user_dicts):
+            self.cache_file = os.path.join(tempfile.gettempdir(), "idp_jieba_user.cache")
+        self.segment_cache_entries = segment_cache_entries
+        self._segments: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+        self._warmed = not jieba_available
+        self.hits = 0
+        self.misses = 0
+        if hasattr(os, "register_at_fork"):
+            # fork时其他线程可能正持有锁，子进程中重新创建（已加载的词典和分词缓存直接继承）
+            ref = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: ref() is not None and ref()._reset_locks())
+
+    def _reset_locks(self) -> None:
+        self._lock = threading.Lock()
+        self._warm_lock = threading.Lock()
+
+    def warm(self) -> None:
+        """加载jieba词典、自定义词典和停用词表（只执行一次）"""
+        if self._warmed:
+            return
+        with self._warm_lock:
+            if self._warmed:
+                return
+            if self.dictionary:
+                jieba.set_dictionary(self.dictionary)
+            if not self._load_dictionary_cache():
+                jieba.initialize()
+                for path in self.user_dicts:
+                    jieba.load_userdict(path)
+                self._save_dictionary_cache()
+            for path in self.stopwords_files:
+                jieba.analyse.set_stop_words(path)
+            self._warmed = True
+
+    def _dictionary_key(self) -> str:
+        """词典文件路径、大小和修改时间的摘要，任一词典变化后缓存失效"""
+        parts = []
+        for path in [self.dictionary or "<default>"] + self.user_dicts:
+            try:
+                stat = os.stat(path)
+                parts.append(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}")
+            except OSError:
+                parts.append(path)
+        return hashlib.blake2b("\n".join(parts).encode("utf-8"), digest_size=16).hexdigest()
+
+    def _load_dictionary_cache(self) -> bool:
+        if not self.cache_file or not os.path.isfile(self.cache_file):
+            return False
+        try:
+            with open(self.cache_file, "rb") as f:
+                key, freq, total = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable jieba cache {self.cache_file}: {e}")
+            return False
+        if key != self._dictionary_key():
+            return False
+        jieba.dt.FREQ, jieba.dt.total = freq, total
+        jieba.dt.initialized = True
+        return True
+
+    def _save_dictionary_cache(self) -> None:
+        if not self.cache_file:
+            return
+        directory = os.path.dirname(os.path.abspath(self.cache_file))
+        try:
+            # 先写临时文件再替换，其他进程不会读到写了一半的缓存
+            fd, temp_path = tempfile.mkstemp(dir=directory)
+            with os.fdopen(fd, "wb") as f:
+                marshal.dump((self._dictionary_key(), jieba.dt.FREQ, jieba.dt.total), f)
+            os.replace(temp_path, self.cache_file)
+        except OSError as e:
+            logger.warning(f"Cannot write jieba cache {self.cache_file}: {e}")
+
+    def segment(self, text: str) -> List[str]:
+        """切分为词序列（保留原文大小写，便于关键词提取）
+
+        分词不会跨越换行，因此按行切分并缓存每行的结果，拼接后与整体分词一致。
+        """
+        self.warm()
+        if not self.segment_cache_entries:
+            return self._segment_line(text)
+        words = []
+        for line in text.splitlines(True):
+            if len(line) > _CACHE_MAX_LINE:
+                words.extend(self._segment_line(line))
+                continue
+            with self._lock:
+                cached = self._segments.get(line)
+                if cached is not None:
+                    self._segments.move_to_end(line)
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            if cached is None:
+                cached = tuple(self._segment_line(line))
+                with self._lock:
+                    self._segments[line] = cached
+                    while len(self._segments) > self.segment_cache_entries:
+                        self._segments.popitem(last=False)
+            words.extend(cached)
+        return words
+
+    def _segment_line(self, text: str) -> List[str]:
+        if jieba_available:
+            return jieba.lcut(text)
+        return _TOKEN_PATTERN.findall(text)
+
+    def cache_stats(self) -> Dict[str, int]:
+        """分词缓存统计"""
+        with self._lock:
+            return {"entries": len(self._segments), "hits": self.hits, "misses": self.misses}
+
+    def index_terms(self, words: List[str]) -> List[str]:
+        """将分词结果转换为写入索引的词项"""
+        terms = []
+        if jieba_available:
+            self.warm()
+            freq = jieba.dt.FREQ
+        for word in words:
+            word = word.strip().lower()
+            if not word or not _WORD_PATTERN.search(word):
+                continue
+            if not _is_cjk(word):
+                terms.append(word)
+            elif jieba_available:
+                terms.append(word)
+                # 长词额外索引词典中的二字、三字子词，查询短词时也能命中
+                for n in (2, 3):
+                    if len(word) > n:
+                        terms.extend(word[i:i + n] for i in range(len(word) - n + 1) if freq.get(word[i:i + n]))
+            else:
+                terms.extend(self._trigrams(word))
+        return terms
+
+    def index_text(self, text: str) -> str:
+        """分词并以空格连接，作为FTS表的写入内容"""
+        return " ".join(self.index_terms(self.segment(text)))
+
+    def match_expression(self, query: str) -> str:
+        """将查询转换为FTS5 MATCH表达式（各词项之间为AND），无有效词项时返回空字符串"""
+        clauses = []
+        for word in self.segment(query):
+            word = word.strip().lower()
+            if not word or not _WORD_PATTERN.search(word):
+                continue
+            if not _is_cjk(word):
+                clauses.append(_quote(word) + "*")
+            elif jieba_available:
+                clauses.append(_quote(word))
+            elif len(word) < 3:
+                clauses.append(_quote(word) + "*")
+            else:
+                # 连续的三元组构成短语，等价于子串匹配
+                clauses.append(_quote(" ".join(word[i:i + 3] for i in range(len(word) - 2))))
+        return " AND ".join(clauses)
+
+    def keywords(self, words: List[str], top_k: int = 10) -> List[str]:
+        """基于分词结果按TF-IDF提取关键词（与 jieba.analyse.extract_tags 结果一致）"""
+        if not jieba_available:
+            freq = {}
+            for word in words:
+                word = word.lower()
+                if len(word) > 2:
+                    freq[word] = freq.get(word, 0) + 1
+            return sorted(freq, key=freq.__getitem__, reverse=True)[:top_k]
+
+        self.warm()
+        tfidf = jieba.analyse.default_tfidf
+        freq = {}
+        for word in words:
+            if len(word.strip()) < 2 or word.lower() in tfidf.stop_words:
+                continue
+            freq[word] = freq.get(word, 0.0) + 1.0
+        total = sum(freq.values())
+        for word in freq:
+            freq[word] *= tfidf.idf_freq.get(word, tfidf.median_idf) / total
+        return sorted(freq, key=freq.__getitem__, reverse=True)[:top_k]
+
+    @staticmethod
+    def _trigrams(run: str) -> List[str]:
+        # 每个位置输出一个三元组（末尾不足三字时输出剩余部分），任意子串都是某个词项的前缀
+        return [run[i:i + 3] for i in range(len(run))]
@@ -0,0 +1,273 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+受监管的工作进程池
+PDF、DOCX等文档的文本提取在常驻的工作进程中执行：每次调用有墙钟超时，
+工作进程启动时通过 resource.setrlimit 限制内存；超时或崩溃的进程被结束，下次调用时重新启动。
+工作进程以 `python -m worker_pool` 启动，只导入提取函数所在的模块，不会初始化服务器。
+"""
+
+import importlib
+import os
+import pickle
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Connection
+from typing import Any, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# 工作进程在脚本所在目录下以模块方式启动
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+DEFAULT_TIMEOUT = 120.0
+DEFAULT_MEMORY_LIMIT = 2048 * 1024 * 1024
+# 每个工作进程处理的任务数上限，之后重新启动以释放解析库积累的内存
+MAX_TASKS_PER_WORKER = 200
+# 工作进程启动并导入目标模块的时间上限（秒），不计入任务超时
+STARTUP_TIMEOUT = 60.0
+# 工作进程通过 pass_fds 继承管道，只支持POSIX；其他平台在当前进程中执行
+ISOLATION_SUPPORTED = os.name == "posix"
+
+
+class WorkerError(Exception):
+    """工作进程超时、超出内存限制或崩溃"""
+
+
+class WorkerTimeout(WorkerError):
+    """任务超过墙钟时间限制"""
+
+
+class WorkerCrash(WorkerError):
+    """工作进程在接受任务后崩溃或超出内存限制"""
+
+
+class WorkerUnavailable(WorkerError):
+    """工作进程无法启动、在接受任务前退出，或进程池已关闭（与任务内容无关）"""
+
+
+def _apply_memory_limit(limit: int):
+    # Linux上 RLIMIT_RSS 不生效，改为限制地址空间，超限时内存分配抛出 MemoryError
+    if resource is None or limit <= 0:
+        return
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+
+
+def _resolve_target(target: str):
+    module_name, _, attribute = target.partition(":")
+    value = importlib.import_module(module_name)
+    for part in attribute.split("."):
+        value = getattr(value, part)
+    return value
+
+
+def _worker_main(read_fd: int, write_fd: int, memory_limit: int):
+    """工作进程主循环：接收 (目标函数, 参数)，返回 (状态, 结果)"""
+    _apply_memory_limit(memory_limit)
+    reader = Connection(read_fd, writable=False)
+    writer = Connection(write_fd, readable=False)
+    while True:
+        try:
+            target, args = reader.recv()
+        except EOFError:
+            return
+        # 导入目标函数后确认接受任务；确认之前的失败属于运行环境问题，与任务内容无关
+        try:
+            function = _resolve_target(target)
+        except Exception as e:
+            writer.send(("unavailable", f"Cannot load {target}: {e}"))
+            continue
+        writer.send(("ack", None))
+        try:
+            reply = ("ok", function(*args))
+        except MemoryError:
+            # 内存超限后进程状态不可靠，报告后退出，由父进程重新启动
+            writer.send(("crash", "Memory limit exceeded"))
+            return
+        except Exception as e:
+            reply = ("raise", e)
+        try:
+            writer.send(reply)
+        except (pickle.PicklingError, TypeError, AttributeError) as e:
+            writer.send(("raise", RuntimeError(f"Cannot return result: {e}")))
+
+
+class _Worker:
+    def __init__(self, memory_limit: int):
+        child_read, parent_write = os.pipe()
+        parent_read, child_write = os.pipe()
+        try:
+            self.process = subprocess.Popen(
+                [sys.executable, "-m", __name__, str(child_read), str(child_write), str(memory_limit)],
+                cwd=SCRIPT_DIR, pass_fds=(child_read, child_write),
+                # stdio模式下标准输出是MCP通道，工作进程不能写入
+                stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL
+            )
+        except OSError:
+            os.close(parent_read)
+            os.close(parent_write)
+            raise
+        finally:
+            os.close(child_read)
+            os.close(child_write)
+        self.reader = Connection(parent_read, writable=False)
+        self.writer = Connection(parent_write, readable=False)
+        self.tasks = 0
+
+    def run(self, target: str, args: tuple, timeout: float) -> Any:
+        self.tasks += 1
+        acknowledged = False
+        try:
+            self.writer.send((target, args))
+            # 进程启动和导入模块的时间不计入任务超时
+            if not self.reader.poll(STARTUP_TIMEOUT):
+                raise WorkerUnavailable(f"Worker did not start within {STARTUP_TIMEOUT:g}s")
+            status, value = self.reader.recv()
+            if status == "ack":
+                acknowledged = True
+                if not self.reader.poll(timeout):
+                    raise WorkerTimeout(f"Timed out after {timeout:g}s")
+                status, value = self.reader.recv()
+        except (EOFError, OSError):
+            try:
+                code = self.process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                code = None
+            error = WorkerCrash if acknowledged else WorkerUnavailable
+            raise error(f"Worker exited with code {code}") from None
+        if status == "unavailable":
+            raise WorkerUnavailable(value)
+        if status == "crash":
+            raise WorkerCrash(value)
+        if status == "raise":
+            raise value
+        return value
+
+    def close(self, kill: bool = False):
+        if kill:
+            self.process.kill()
+        for connection in (self.writer, self.reader):
+            connection.close()
+        try:
+            self.process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class WorkerPool:
+    """受监管的工作进程池
+
+    call("模块:函数", *参数) 在空闲的工作进程中执行；函数抛出的异常（如 ExtractionError）原样抛出，
+    超时、内存超限或进程崩溃时抛出 WorkerError。
+    """
+
+    def __init__(self, max_workers: int = 2, timeout: float = DEFAULT_TIMEOUT,
+                 memory_limit: int = DEFAULT_MEMORY_LIMIT):
+        self.max_workers = max(1, max_workers)
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self._idle: List[_Worker] = []
+        self._started = 0
+        self._condition = threading.Condition()
+        self._closed = False
+        self.stats = {"tasks": 0, "timeouts": 0, "crashes": 0, "start_failures": 0, "restarts": 0}
+
+    def call(self, target: str, *args, timeout: Optional[float] = None) -> Any:
+        """在工作进程中执行 target(*args)
+
+        不支持工作进程的平台（非POSIX）上直接在当前进程中执行。
+
+        Raises:
+            WorkerTimeout: 任务超时
+            WorkerCrash: 工作进程在执行任务时内存超限或崩溃
+            WorkerUnavailable: 工作进程无法启动或进程池已关闭（与任务内容无关，可改为在当前进程中执行）
+        """
+        if not ISOLATION_SUPPORTED:
+            return _resolve_target(target)(*args)
+        worker = self._acquire()
+        try:
+            result = worker.run(target, args, timeout or self.timeout)
+        except WorkerError as e:
+            worker.close(kill=True)
+            self._release(None)
+            with self._condition:
+                if isinstance(e, WorkerTimeout):
+                    self.stats["timeouts"] += 1
+                elif isinstance(e, WorkerCrash):
+                    self.stats["crashes"] += 1
+                else:
+                    self.stats["start_failures"] += 1
+            raise
+        except BaseException:
+            # 提取函数自身的异常，进程可以继续使用
+            self._release(worker)
+            raise
+        self._release(worker)
+        return result
+
+    def _acquire(self) -> _Worker:
+        with self._condition:
+            while not self._idle and self._started >= self.max_workers:
+                self._condition.wait()
+            if self._closed:
+                raise WorkerUnavailable("Worker pool is closed")
+            self.stats["tasks"] += 1
+            if self._idle:
+                return self._idle.pop()
+            self._started += 1
+        # 启动失败时必须归还名额，否则之后的调用会一直等待
+        try:
+            return _Worker(self.memory_limit)
+        except OSError as e:
+            self._release(None)
+            raise WorkerUnavailable(f"Cannot start worker: {e}") from e
+        except BaseException:
+            self._release(None)
+            raise
+
+    def _release(self, worker: Optional[_Worker]):
+        if worker is not None and (worker.tasks >= MAX_TASKS_PER_WORKER or worker.process.poll() is not None):
+            worker.close(kill=True)
+            worker = None
+        with self._condition:
+            if worker is None:
+                self._started -= 1
+                self.stats["restarts"] += 1
+            elif self._closed:
+                self._started -= 1
+                worker.close()
+            else:
+                self._idle.append(worker)
+            self._condition.notify()
+
+    def status(self) -> Dict[str, Any]:
+        with self._condition:
+            return {
+                "isolated": ISOLATION_SUPPORTED,
+                "max_workers": self.max_workers,
+                "running_workers": self._started,
+                "timeout": self.timeout,
+                "memory_limit_mb": self.memory_limit // (1024 * 1024),
+                **self.stats
+            }
+
+    def close(self):
+        """结束全部空闲的工作进程（执行中的进程在任务结束后退出）"""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._started -= len(idle)
+            self._condition.notify_all()
+        for worker in idle:
+            worker.close()
+
+if __name__ == "__main__":
+    _worker_main(int(sys.argv[1]), int(sys.argv[2]), int(sys.argv[3]))